@@ -1,65 +1,164 @@
+from geometry_arena import GeometryArena
 from mesh import Mesh
-from shader import Shader
+from mesh_cache import MeshCache
+from mesh_processing import build_indexed_mesh
+from shader import Shader, compile_file_into_spirv
 from texture import TextureDescription, Texture
 
 import numpy as np
 import pywavefront
-from more_itertools import chunked, flatten
+
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+import multiprocessing
+import time
+
+# pos 3, tex 2, nrm 3, col 4. Layout expected by Mesh
+VERTEX_SIZE = 12
+
+
+def interleave_vertices(vertices: list[float], vertex_format: str, vertex_size: int) -> np.ndarray:
+    """
+    Converts pywavefront's flat vertex list (no index buffers, vertex_format such as "T2F_N3F_V3F") into a flat float32 array
+    of the 12-float vertex layout Mesh expects. Missing attributes are filled with defaults.
+    """
+    # each row has a single vertex's data
+    src = np.asarray(vertices, dtype=np.float32).reshape(-1, vertex_size)
+    n = src.shape[0]
+    ix = 0
+    pos_ix, tex_ix, nrm_ix, col_ix = -1, -1, -1, -1
+    for attr in vertex_format.split('_'):  # Ex: ["T2F", "N3F", "V3F"]
+        n_comp = int(attr[1])
+        if attr[0] == "V":  # Position
+            pos_ix = ix
+            assert(n_comp == 3)
+        if attr[0] == "T":  # TexCoord
+            tex_ix = ix
+            assert(n_comp == 2)
+        if attr[0] == "N":  # Normal
+            nrm_ix = ix
+            assert(n_comp == 3)
+        if attr[0] == "C":  # Color
+            col_ix = ix
+            assert(n_comp == 3)
+        ix += n_comp
+    assert(pos_ix != -1)
+
+    pos = src[:, pos_ix : pos_ix + 3]
+    tex = src[:, tex_ix : tex_ix + 2] if tex_ix != -1 else np.broadcast_to(np.float32(0), (n, 2))
+    nrm = src[:, nrm_ix : nrm_ix + 3] if nrm_ix != -1 else np.broadcast_to(np.float32(0), (n, 3))
+    col_rgb = src[:, col_ix : col_ix + 3] if col_ix != -1 else np.broadcast_to(np.float32(0), (n, 3))
+    col_a = np.broadcast_to(np.float32(1), (n, 1))
+    processed = np.concatenate([pos, tex, nrm, col_rgb, col_a], axis=1)
+    return processed.reshape(-1)
+
+
+def process_obj(filename: str) -> dict[str, np.ndarray]:
+    """Parses an OBJ file into the arrays a Mesh is made of: "vertices" and, if indexed, "indices". Doesn't need an OpenGL context."""
+    obj_scene = pywavefront.Wavefront(filename, create_materials=True)
+
+    for mesh_name in obj_scene.meshes:
+        print(f"Mesh {mesh_name} found in {filename}")
+
+    arrays = {}
+    for name, mat in obj_scene.materials.items():
+        print(f"name {name}, vertex format: {mat.vertex_format}, vertex size: {mat.vertex_size}, #verts {len(mat.vertices) / mat.vertex_size}")
+        if not mat.vertex_format:
+            continue
+        np_array = interleave_vertices(mat.vertices, mat.vertex_format, mat.vertex_size)
+        # always indexed: the GeometryArena draws every mesh indexed, a non-indexed one would get a trivial index buffer
+        # of the same length anyway, without the deduplication and the cache optimized triangle order
+        vertices, indices = build_indexed_mesh(np_array, VERTEX_SIZE)
+        print(f"  indexed: #unique verts {len(vertices) // VERTEX_SIZE}, #indices {len(indices)}")
+        arrays = {"vertices": vertices, "indices": indices}
+    return arrays
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def process_many(executor: Executor, objs: dict[str, str], shaders: dict[str, tuple[str, str]], shader_optimization: str = 'zero'):
+    """
+    Submits OBJ processing and SPIR-V compilation jobs to the executor, then yields (kind, asset_name, result, duration) in completion order.
+    kind is "mesh" with the process_obj() arrays as result, or "shader" with {'vert': spirv, 'frag': spirv} as result.
+    """
+    futures = {}
+    for asset_name, filename in objs.items():
+        futures[executor.submit(_timed, process_obj, filename)] = ("mesh", asset_name, None)
+    for asset_name, (vert_file, frag_file) in shaders.items():
+        futures[executor.submit(_timed, compile_file_into_spirv, vert_file, 'vert', shader_optimization)] = ("shader", asset_name, 'vert')
+        futures[executor.submit(_timed, compile_file_into_spirv, frag_file, 'frag', shader_optimization)] = ("shader", asset_name, 'frag')
+    spirv_binaries = {asset_name: {} for asset_name in shaders}
+    for future in as_completed(futures):
+        kind, asset_name, stage = futures[future]
+        result, duration = future.result()
+        if kind == "mesh":
+            yield kind, asset_name, result, duration
+            continue
+        # a shader is ready once both of its stages are
+        spirv_binaries[asset_name][stage] = result
+        if len(spirv_binaries[asset_name]) == 2:
+            yield kind, asset_name, spirv_binaries[asset_name], duration
+
 
 class Assets:
     def __init__(self, renderer):
         self.meshes: dict[str, Mesh] = {}
         self.shaders: dict[str, Shader] = {}
         self.textures: dict[str, Texture] = {}
+        self.mesh_cache = MeshCache()
+        # vertices and indices of all meshes, so that they can be drawn with glMultiDrawElementsIndirect
+        self.geometry_arena = GeometryArena()
+        # shaderc optimization level, 'zero' or 'performance'
+        self.shader_optimization = 'zero'
         self._renderer = renderer
     
     def load_obj(self, asset_name: str, filename: str):
-        obj_scene = pywavefront.Wavefront(filename, create_materials=True)
-        
-        for mesh_name in obj_scene.meshes:
-            print(f"Mesh {mesh_name} found in {filename}")
-        
-        for name, mat in obj_scene.materials.items():
-            print(f"name {name}, vertex format: {mat.vertex_format}, vertex size: {mat.vertex_size}, #verts {len(mat.vertices) / mat.vertex_size}")
-            # process to work with pywavefront (no index buffers, specific vertex_format)
-            vertices = chunked(mat.vertices, mat.vertex_size)  # each sub-list has a single flat vertex data
-            ix = 0
-            pos_ix, tex_ix, nrm_ix, col_ix = -1, -1, -1, -1
-            if not mat.vertex_format:
-                continue
-            for attr in mat.vertex_format.split('_'):  # Ex: ["T2F", "N3F", "V3F"]
-                n_comp = int(attr[1])
-                if attr[0] == "V":  # Position
-                    pos_ix = ix
-                    assert(n_comp == 3)
-                if attr[0] == "T":  # TexCoord
-                    tex_ix = ix
-                    assert(n_comp == 2)
-                if attr[0] == "N":  # Normal
-                    nrm_ix = ix
-                    assert(n_comp == 3)
-                if attr[0] == "C":  # Color
-                    col_ix = ix
-                    assert(n_comp == 3)
-                ix += n_comp
-            assert(pos_ix != -1)
-            
-            processed_vertices = []
-            for v in vertices:
-                pos = v[pos_ix : pos_ix + 3]
-                tex = v[tex_ix : tex_ix + 2] if tex_ix != -1 else [0, 0]
-                nrm = v[nrm_ix : nrm_ix + 3] if nrm_ix != -1 else [0, 0, 0]
-                col = v[col_ix : col_ix + 3] + [1] if col_ix != -1 else [0, 0, 0, 1]
-                w = list(flatten([pos, tex, nrm, col]))
-                processed_vertices.append(w)
-                
-            processed_vertices = list(flatten(processed_vertices))
-            np_array = np.array(processed_vertices, dtype=np.float32)
-            mesh = Mesh(np_array)
-            self.meshes[asset_name] = mesh
+        arrays = self.mesh_cache.get_or_process(filename, process_obj)
+        self._make_mesh(asset_name, arrays)
     
+    def load_many(self, objs: dict[str, str] = None, shaders: dict[str, tuple[str, str]] = None, max_workers: int = None):
+        """
+        Parses OBJ files and compiles shaders into SPIR-V in worker processes. Meshes and Shaders are created as results arrive
+        on the calling thread, which has to own the OpenGL context. Cached meshes are not sent to workers.
+        objs: asset_name -> OBJ filename
+        shaders: asset_name -> (vertex_file, fragment_file)
+        max_workers: number of worker processes, defaults to the number of CPUs
+        """
+        objs = objs or {}
+        shaders = shaders or {}
+        cached = {}
+        missing = {}
+        for asset_name, filename in objs.items():
+            arrays = self.mesh_cache.lookup(filename)
+            if arrays is not None:
+                cached[asset_name] = arrays
+            else:
+                missing[asset_name] = filename
+        # spawn, forking a process with a GL context and CUDA is not safe
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            jobs = process_many(executor, missing, shaders, self.shader_optimization)
+            # upload cached meshes while workers are busy
+            for asset_name, arrays in cached.items():
+                self._make_mesh(asset_name, arrays)
+            for kind, asset_name, result, duration in jobs:
+                if kind == "mesh":
+                    self.mesh_cache.store(missing[asset_name], result, duration)
+                    self._make_mesh(asset_name, result)
+                else:
+                    vert_file, frag_file = shaders[asset_name]
+                    self.shaders[asset_name] = Shader(vert_file, frag_file, spirv_binaries=result, optimization=self.shader_optimization)
+
+    def _make_mesh(self, asset_name: str, arrays: dict[str, np.ndarray]):
+        if "vertices" not in arrays:
+            return
+        # cached arrays are memory-mapped, glNamedBufferSubData reads straight from the mapping
+        self.meshes[asset_name] = Mesh(arrays["vertices"], arrays.get("indices"), self.geometry_arena)
+
     def load_shader(self, asset_name: str, vert_file: str, frag_file: str):
-        shader = Shader(vert_file, frag_file)
+        shader = Shader(vert_file, frag_file, optimization=self.shader_optimization)
         self.shaders[asset_name] = shader
     
     def make_texture(self, asset_name: str, tex_desc: TextureDescription):
@@ -0,0 +1,170 @@
+"""
+Headless benchmark of the renderer. Renders main.py's scene into a hidden window at fixed viewport sizes, for each
+Operation the machine supports, and writes fps, frame time percentiles and per pass GPU/CPU timings into a JSON file.
+Optionally compares the results against a baseline JSON and exits with 1 if any frame time regressed beyond the threshold.
+
+Usage:
+python bench.py --output bench.json
+python bench.py --baseline bench.json --threshold 0.1
+python bench.py --egl  # EGL context instead of GLX/WGL. Still a GLFW window, needs a display, ex: xvfb-run on a GPU-less machine
+"""
+import sys
+import os
+
+# PyOpenGL picks its platform at import time
+if "--egl" in sys.argv:
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+
+from cpu_profiler import CpuProfiler
+from cpu_shading import set_num_threads
+from gpu_profiler import GpuProfiler
+from main import App, Operation
+from renderer import Renderer
+
+import glfw
+import glm
+import imgui
+import numba
+import numpy as np
+from OpenGL.GL import GL_RENDERER, GL_VERSION, glGetString
+
+import argparse
+from datetime import datetime
+import json
+import platform
+import time
+
+DEFAULT_SIZES = ["640x360", "1280x720", "1920x1080"]
+
+
+def get_supported_operations() -> list[Operation]:
+    operations = [Operation.TEX_TO_NUMPY, Operation.TEX_TO_PBO_TO_MAP, Operation.CPU_NUMBA]
+    # the CUDA operation needs the CUDA Python bindings, which a GPU-less machine doesn't have to install
+    try:
+        import cuda_interop
+    except ImportError:
+        return operations
+    if cuda_interop.is_available():
+        operations.append(Operation.TEX_TO_PBO_TO_DEV_ND_ARR)
+    return operations
+
+
+def run(app: App, viewport_size: glm.ivec2, operation: Operation, num_warmup: int, num_frames: int) -> dict:
+    for _ in range(num_warmup):
+        render_frame(app, viewport_size, operation)
+    # fresh profilers, so that the measured frames are not mixed with the warm-up or the previous run
+    app.gpu_profiler = GpuProfiler(history_size=num_frames)
+    app.cpu_profiler = CpuProfiler(history_size=num_frames)
+    frame_durations_ms = np.zeros(num_frames)
+    last = time.perf_counter()
+    for ix in range(num_frames):
+        render_frame(app, viewport_size, operation)
+        now = time.perf_counter()
+        frame_durations_ms[ix] = (now - last) * 1e3
+        last = now
+    app.gpu_profiler.finish()
+    return {
+        "operation": operation.name,
+        "width": viewport_size.x,
+        "height": viewport_size.y,
+        "fps": 1e3 / frame_durations_ms.mean(),
+        "frame_ms": summarize(frame_durations_ms),
+        "gpu_passes_ms": {name: summarize(durations) for name, durations in app.gpu_profiler.timings.items()},
+        "cpu_scopes_ms": {name: summarize(durations) for name, durations in app.cpu_profiler.timings.items()},
+    }
+
+
+def render_frame(app: App, viewport_size: glm.ivec2, operation: Operation):
+    app.begin_frame()
+    imgui.new_frame()
+    # otherwise the render graph culls the post-process pass, nothing else reads the "cpu" texture
+    app.render_graph.request("cpu")
+    app.render(viewport_size, operation)
+    app.end_frame()
+
+
+def summarize(durations) -> dict:
+    durations = np.fromiter(durations, dtype=np.float64)
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+    return {"mean": float(durations.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99), "max": float(durations.max())}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Prints p50 frame times against the baseline's. Returns False if any of them is slower by more than the threshold ratio"""
+    baseline_runs = {(run["operation"], run["width"], run["height"]): run for run in baseline["runs"]}
+    ok = True
+    print(f"{'operation':>26} | {'size':>9} | {'base p50':>8} | {'p50':>8} | {'change':>7}")
+    for run in results["runs"]:
+        key = (run["operation"], run["width"], run["height"])
+        if key not in baseline_runs:
+            print(f"{run['operation']:>26} | {run['width']}x{run['height']:<4} | not in baseline")
+            continue
+        base_ms = baseline_runs[key]["frame_ms"]["p50"]
+        cur_ms = run["frame_ms"]["p50"]
+        change = cur_ms / base_ms - 1
+        regressed = change > threshold
+        ok = ok and not regressed
+        print(f"{run['operation']:>26} | {run['width']}x{run['height']:<4} | {base_ms:8.3f} | {cur_ms:8.3f} | {change:+7.1%}{' REGRESSION' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless renderer benchmark")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="viewport sizes as WxH")
+    parser.add_argument("--warmup", type=int, default=30, help="frames rendered before measuring, per run")
+    parser.add_argument("--frames", type=int, default=200, help="measured frames per run")
+    parser.add_argument("--operations", nargs="+", choices=[op.name for op in Operation], help="defaults to all supported")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed p50 frame time increase ratio over the baseline")
+    parser.add_argument("--numba-threads", type=int, help="threads of Operation.CPU_NUMBA, defaults to all cores")
+    parser.add_argument("--egl", action="store_true", help="create the context via EGL instead of GLX. GLFW still needs an X11/Wayland display, ex: Xvfb")
+    args = parser.parse_args()
+
+    sizes = [glm.ivec2(*map(int, size.split("x"))) for size in args.sizes]
+    operations = [Operation[name] for name in args.operations] if args.operations else get_supported_operations()
+    use_cuda = Operation.TEX_TO_PBO_TO_DEV_ND_ARR in operations
+    if args.numba_threads is not None:
+        set_num_threads(args.numba_threads)
+
+    renderer = Renderer()
+    renderer.init(win_size=sizes[0], viewport_size=sizes[0], visible=False, egl=args.egl)
+    glfw.swap_interval(0)  # don't wait for vsync
+    app = App(renderer, sizes[0], use_cuda=use_cuda)
+
+    results = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "gl_renderer": glGetString(GL_RENDERER).decode(),
+        "gl_version": glGetString(GL_VERSION).decode(),
+        "python": platform.python_version(),
+        "numba_threads": numba.get_num_threads(),
+        "warmup_frames": args.warmup,
+        "measured_frames": args.frames,
+        "runs": [],
+    }
+    print(f"{results['gl_renderer']}, {results['gl_version']}")
+    print(f"{'operation':>26} | {'size':>9} | {'fps':>7} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7}")
+    for operation in operations:
+        for size in sizes:
+            run_result = run(app, size, operation, args.warmup, args.frames)
+            results["runs"].append(run_result)
+            frame_ms = run_result["frame_ms"]
+            print(f"{operation.name:>26} | {size.x:>4}x{size.y:<4} | {run_result['fps']:7.1f} | {frame_ms['p50']:7.3f} | {frame_ms['p95']:7.3f} | {frame_ms['p99']:7.3f}")
+    app.deinit()
+    renderer.deinit()
+
+    # read before writing, output and baseline can be the same file
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if baseline is not None and not compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark of the CPU point light post-process: NumPy, NumPy with preallocated buffers and numba's parallel kernel with 1..N threads.
+Uses random G-buffer contents of a fixed viewport size. Does not need an OpenGL context.
+
+Usage: python bench_cpu_shading.py [width] [height] [repeats]
+"""
+from cpu_shading import NumpyShadingPass, shade_diffuse_numba, shade_diffuse_numpy, set_num_threads
+
+import numba
+import numpy as np
+
+import sys
+import time
+
+
+def make_gbuffer(width: int, height: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    pos = rng.uniform(-1, 1, size=(height, width, 3)).astype(np.float32)
+    norm = rng.normal(size=(height, width, 3)).astype(np.float32)
+    norm /= np.linalg.norm(norm, axis=2, keepdims=True)
+    return pos, norm
+
+
+def measure(func, repeats: int, *args) -> float:
+    func(*args)  # warm-up, includes JIT compilation
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func(*args)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1920
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1080
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    pos, norm = make_gbuffer(width, height)
+    light_pos = np.array([[0, 5, 0], [0, 0, 5]], dtype=np.float32)
+    pixels_numpy = np.zeros((height, width, 3), dtype=np.uint8)
+    pixels_numba = np.zeros((height, width, 3), dtype=np.uint8)
+
+    numpy_dur = measure(shade_diffuse_numpy, repeats, pos, norm, pixels_numpy, light_pos)
+    print(f"{width}x{height}, {len(light_pos)} lights, {repeats} repeats")
+    print(f"{'numpy':>12}: {numpy_dur * 1e3:8.2f} ms")
+    numpy_pass = NumpyShadingPass(width, height, light_pos)
+    numpy_pass.world_pos[...] = pos
+    numpy_pass.world_normal[...] = norm
+    pass_dur = measure(numpy_pass.shade, repeats)
+    print(f"{'numpy out=':>12}: {pass_dur * 1e3:8.2f} ms ({numpy_dur / pass_dur:.1f}x)")
+    for num_threads in range(1, numba.config.NUMBA_NUM_THREADS + 1):
+        set_num_threads(num_threads)
+        numba_dur = measure(shade_diffuse_numba, repeats, pos, norm, pixels_numba, light_pos)
+        print(f"{f'numba x{num_threads}':>12}: {numba_dur * 1e3:8.2f} ms ({numpy_dur / numba_dur:.1f}x)")
+    # fastmath can flip a value at rounding boundaries
+    max_diff = np.abs(pixels_numpy.astype(np.int16) - pixels_numba).max()
+    print(f"max difference between numpy and numba results: {max_diff}")
+
+
+if __name__ == "__main__":
+    main()
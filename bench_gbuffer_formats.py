@@ -0,0 +1,84 @@
+"""
+Benchmark of the G-buffer layouts. Renders main.py's scene into a hidden window with each GBufferLayout and compares the GPU
+time of the G-buffer fill and the fullscreen lighting pass, and the bytes per pixel of world_pos, world_normal and uv,
+against FULL_32F. Only the "viewport" texture is requested, so the CPU post-process pass is culled for all layouts.
+
+Usage: python bench_gbuffer_formats.py [--sizes 1280x720 1920x1080] [--frames 200] [--egl]
+"""
+import sys
+import os
+
+# PyOpenGL picks its platform at import time
+if "--egl" in sys.argv:
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+
+from bench import summarize
+from cpu_profiler import CpuProfiler
+from gbuffer_layout import GBufferLayout, get_gbuffer_descs, get_bytes_per_pixel
+from gpu_profiler import GpuProfiler
+from main import App, Operation
+from renderer import Renderer
+
+import glfw
+import glm
+import imgui
+from OpenGL.GL import GL_RENDERER, glGetString
+
+import argparse
+
+PASSES = ["G-buffer", "fullscreen lighting"]
+
+
+def render_frame(app: App, viewport_size: glm.ivec2):
+    app.begin_frame()
+    imgui.new_frame()
+    app.render(viewport_size, Operation.TEX_TO_NUMPY)
+    app.end_frame()
+
+
+def run(app: App, viewport_size: glm.ivec2, num_warmup: int, num_frames: int) -> dict[str, float]:
+    """p50 GPU milliseconds per pass"""
+    for _ in range(num_warmup):
+        render_frame(app, viewport_size)
+    app.gpu_profiler = GpuProfiler(history_size=num_frames)
+    app.cpu_profiler = CpuProfiler(history_size=num_frames)
+    for _ in range(num_frames):
+        render_frame(app, viewport_size)
+    app.gpu_profiler.finish()
+    return {name: summarize(app.gpu_profiler.timings[name])["p50"] for name in PASSES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="G-buffer layout benchmark")
+    parser.add_argument("--sizes", nargs="+", default=["1280x720", "1920x1080"], help="viewport sizes as WxH")
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--egl", action="store_true", help="create the context via EGL instead of GLX. GLFW still needs an X11/Wayland display, ex: Xvfb")
+    args = parser.parse_args()
+
+    sizes = [glm.ivec2(*map(int, size.split("x"))) for size in args.sizes]
+    renderer = Renderer()
+    renderer.init(win_size=sizes[0], viewport_size=sizes[0], visible=False, egl=args.egl)
+    glfw.swap_interval(0)  # don't wait for vsync
+    print(glGetString(GL_RENDERER).decode())
+
+    # layout -> size -> pass -> p50 ms
+    results: dict[GBufferLayout, dict[tuple[int, int], dict[str, float]]] = {}
+    for layout in GBufferLayout:
+        app = App(renderer, sizes[0], use_cuda=False, gbuffer_layout=layout)
+        results[layout] = {(size.x, size.y): run(app, size, args.warmup, args.frames) for size in sizes}
+        app.deinit()
+    renderer.deinit()
+
+    print(f"{'layout':>15} | {'B/px':>4} | {'size':>9} | {'G-buffer ms':>11} | {'lighting ms':>11} | {'G-buffer':>8} | {'lighting':>8}")
+    for layout, size_results in results.items():
+        bytes_per_pixel = get_bytes_per_pixel(get_gbuffer_descs(renderer, layout))
+        for size, timings in size_results.items():
+            base = results[GBufferLayout.FULL_32F][size]
+            gbuffer_ms, lighting_ms = timings["G-buffer"], timings["fullscreen lighting"]
+            print(f"{layout.name:>15} | {bytes_per_pixel:4} | {size[0]:>4}x{size[1]:<4} | {gbuffer_ms:11.3f} | {lighting_ms:11.3f} | "
+                  f"{gbuffer_ms / base['G-buffer'] - 1:+8.1%} | {lighting_ms / base['fullscreen lighting'] - 1:+8.1%}")
+
+
+if __name__ == "__main__":
+    main()
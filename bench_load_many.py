@@ -0,0 +1,54 @@
+"""
+Wall-clock benchmark of the CPU part of asset loading (OBJ processing and SPIR-V compilation) for every file in models/
+and the app's shaders, sequentially and with a process pool of 1..N workers. Does not need an OpenGL context.
+
+Usage: python bench_load_many.py [max_workers]
+"""
+from assets import process_many, process_obj
+from shader import compile_file_into_spirv
+
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import glob
+import io
+import logging
+import os
+import sys
+import time
+
+SHADERS = {
+    "default": ("shaders/default.vert", "shaders/default.frag"),
+    "fullscreen": ("shaders/fullscreen_quad.vert", "shaders/fullscreen_quad.frag"),
+}
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    logging.getLogger("pywavefront").setLevel(logging.ERROR)
+    objs = {os.path.basename(filename): filename for filename in sorted(glob.glob("models/*.obj"))}
+
+    # process_obj is chatty
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for filename in objs.values():
+            process_obj(filename)
+        for vert_file, frag_file in SHADERS.values():
+            compile_file_into_spirv(vert_file, 'vert')
+            compile_file_into_spirv(frag_file, 'frag')
+        sequential_dur = time.perf_counter() - start
+    print(f"{len(objs)} OBJ files, {len(SHADERS)} shaders")
+    print(f"{'workers':<10}{'wall ms':>10}{'speedup':>9}")
+    print(f"{'-':<10}{sequential_dur * 1e3:>10.1f}{1:>8.1f}x")
+    for num_workers in range(1, max_workers + 1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            # pool startup is part of the cost paid at app start
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                for _ in process_many(executor, objs, SHADERS):
+                    pass
+            dur = time.perf_counter() - start
+        print(f"{num_workers:<10}{dur * 1e3:>10.1f}{sequential_dur / dur:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Load-time benchmark of OBJ processing for every file in models/, followed by a report of
+VBO bytes saved and post-transform cache ACMR of indexing. Does not need an OpenGL context.
+
+Usage: python bench_load_obj.py [num_repeats]
+"""
+from assets import interleave_vertices, VERTEX_SIZE
+from mesh_processing import build_indexed_mesh, compute_acmr, deduplicate_vertices
+
+from more_itertools import chunked, flatten
+import numpy as np
+import pywavefront
+
+import glob
+import logging
+import sys
+import time
+
+
+def interleave_vertices_python(vertices: list[float], vertex_format: str, vertex_size: int) -> np.ndarray:
+    """Previous per-vertex Python implementation, kept as a reference for correctness and timing"""
+    ix = 0
+    pos_ix, tex_ix, nrm_ix, col_ix = -1, -1, -1, -1
+    for attr in vertex_format.split('_'):
+        n_comp = int(attr[1])
+        if attr[0] == "V":
+            pos_ix = ix
+        if attr[0] == "T":
+            tex_ix = ix
+        if attr[0] == "N":
+            nrm_ix = ix
+        if attr[0] == "C":
+            col_ix = ix
+        ix += n_comp
+    processed_vertices = []
+    for v in chunked(vertices, vertex_size):
+        pos = v[pos_ix : pos_ix + 3]
+        tex = v[tex_ix : tex_ix + 2] if tex_ix != -1 else [0, 0]
+        nrm = v[nrm_ix : nrm_ix + 3] if nrm_ix != -1 else [0, 0, 0]
+        col = v[col_ix : col_ix + 3] + [1] if col_ix != -1 else [0, 0, 0, 1]
+        processed_vertices.append(list(flatten([pos, tex, nrm, col])))
+    return np.array(list(flatten(processed_vertices)), dtype=np.float32)
+
+
+def best_of(func, num_repeats: int) -> float:
+    durations = []
+    for _ in range(num_repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    num_repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    logging.getLogger("pywavefront").setLevel(logging.ERROR)
+    print(f"{'file':<28}{'#verts':>8}{'parse ms':>10}{'python ms':>11}{'numpy ms':>10}{'speedup':>9}")
+    totals = [0.0, 0.0, 0.0]
+    for filename in sorted(glob.glob("models/*.obj")):
+        start = time.perf_counter()
+        obj_scene = pywavefront.Wavefront(filename, create_materials=True)
+        parse_dur = time.perf_counter() - start
+        python_dur, numpy_dur, num_verts = 0.0, 0.0, 0
+        for mat in obj_scene.materials.values():
+            if not mat.vertex_format:
+                continue
+            args = (mat.vertices, mat.vertex_format, mat.vertex_size)
+            assert np.array_equal(interleave_vertices_python(*args), interleave_vertices(*args))
+            python_dur += best_of(lambda: interleave_vertices_python(*args), num_repeats)
+            numpy_dur += best_of(lambda: interleave_vertices(*args), num_repeats)
+            num_verts += len(mat.vertices) // mat.vertex_size
+        totals = [totals[0] + parse_dur, totals[1] + python_dur, totals[2] + numpy_dur]
+        print(f"{filename:<28}{num_verts:>8}{parse_dur * 1e3:>10.2f}{python_dur * 1e3:>11.2f}{numpy_dur * 1e3:>10.2f}{python_dur / numpy_dur:>8.1f}x")
+    print(f"{'total':<28}{'':>8}{totals[0] * 1e3:>10.2f}{totals[1] * 1e3:>11.2f}{totals[2] * 1e3:>10.2f}{totals[1] / totals[2]:>8.1f}x")
+
+    print()
+    print(f"{'file':<28}{'#verts':>8}{'#unique':>9}{'VBO bytes':>11}{'VBO+EBO':>10}{'saved':>8}{'ACMR':>7}{'dedup':>7}{'tipsify':>9}{'index ms':>10}")
+    for filename in sorted(glob.glob("models/*.obj")):
+        obj_scene = pywavefront.Wavefront(filename, create_materials=True)
+        for mat in obj_scene.materials.values():
+            if not mat.vertex_format:
+                continue
+            vertices = interleave_vertices(mat.vertices, mat.vertex_format, mat.vertex_size)
+            start = time.perf_counter()
+            unique_vertices, indices = build_indexed_mesh(vertices, VERTEX_SIZE)
+            index_dur = time.perf_counter() - start
+            _, dedup_indices = deduplicate_vertices(vertices, VERTEX_SIZE)
+            deindexed_bytes = vertices.nbytes
+            indexed_bytes = unique_vertices.nbytes + indices.nbytes
+            saved = 1 - indexed_bytes / deindexed_bytes
+            # de-indexed draws transform each vertex of each triangle, i.e. ACMR of 3
+            print(f"{filename:<28}{len(vertices) // VERTEX_SIZE:>8}{len(unique_vertices) // VERTEX_SIZE:>9}{deindexed_bytes:>11}{indexed_bytes:>10}{saved:>8.0%}"
+                  f"{3.0:>7.2f}{compute_acmr(dedup_indices):>7.2f}{compute_acmr(indices):>9.2f}{index_dur * 1e3:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
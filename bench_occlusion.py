@@ -0,0 +1,129 @@
+"""
+Benchmark of Hi-Z occlusion culling on a dense scene: a grid of monkeys hidden behind a wall, a few in front of it.
+Renders the G-buffer pass with occlusion culling off and on, and reports drawn instances, multi-draw calls,
+CPU time of the culling and GPU time of the G-buffer pass (GL_TIME_ELAPSED query). Opens a hidden window.
+
+Usage: python bench_occlusion.py [grid_size] [num_frames]
+"""
+from assets import Assets
+from culling import FrustumCuller, OcclusionCuller
+from framebuffer import Framebuffer
+from instancing import InstanceBuffer, IndirectDrawList, make_batches
+from renderer import Renderer
+from scene import Scene, Object
+from scene_uniform_buffer import SceneUniformBuffer
+from texture import Texture
+import utils
+
+import glm
+from OpenGL.GL import GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_TIME_ELAPSED, GL_QUERY_RESULT
+from OpenGL.GL import glClear, glClearColor, glGenQueries, glBeginQuery, glEndQuery, glGetQueryObjectui64v
+
+import sys
+import time
+
+WARMUP_FRAMES = 10
+
+
+def make_scene(renderer: Renderer, assets: Assets, grid_size: int) -> Scene:
+    scene = Scene(renderer)
+    scene.cam.position = glm.vec3(0, 0, -6)
+    scene.cam.target = glm.vec3(0, 0, 0)
+    shader = assets.shaders["default"]
+    scene.objects["wall"] = Object(
+        mesh=assets.meshes["cube"],
+        transform=utils.Transform(translation=glm.vec3(0, 0, -2), rotation_yxz=glm.vec3(0), scale=glm.vec3(8, 8, 0.1)),
+        shader=shader,
+    )
+    for ix in range(grid_size):
+        for iy in range(grid_size):
+            for iz in range(4):
+                position = glm.vec3((ix - grid_size / 2) * 0.5, (iy - grid_size / 2) * 0.5, iz * 0.5)
+                scene.objects[f"hidden_{ix}_{iy}_{iz}"] = Object(
+                    mesh=assets.meshes["monkey"],
+                    transform=utils.Transform(translation=position, rotation_yxz=glm.vec3(0), scale=glm.vec3(0.2)),
+                    shader=shader,
+                )
+    for ix in range(5):
+        scene.objects[f"front_{ix}"] = Object(
+            mesh=assets.meshes["monkey"],
+            transform=utils.Transform(translation=glm.vec3(ix - 2, 0, -3), rotation_yxz=glm.vec3(0), scale=glm.vec3(0.3)),
+            shader=shader,
+        )
+    return scene
+
+
+def run(num_frames: int, occlusion: bool, scene: Scene, assets: Assets, fb_gbuffer: Framebuffer, scene_ubo: SceneUniformBuffer,
+        instance_buffer: InstanceBuffer, draw_list: IndirectDrawList, query: int) -> dict:
+    frustum_culler = FrustumCuller()
+    occlusion_culler = OcclusionCuller()
+    occlusion_culler.enabled = occlusion
+    objects = list(scene.objects.values())
+    cull_ns = gpu_ns = 0
+    num_instances = num_draw_calls = 0
+    for frame in range(WARMUP_FRAMES + num_frames):
+        scene_ubo.upload(scene)
+        fb_gbuffer.bind()
+        glClearColor(0, 0, 0, 1.0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        cull_start = time.perf_counter_ns()
+        visible_objects = occlusion_culler.cull(frustum_culler.cull(objects, scene.cam))
+        cull_end = time.perf_counter_ns()
+        batches, instanced_objects = make_batches(visible_objects)
+        instance_buffer.upload(instanced_objects)
+        draw_list.build(batches)
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        draw_list.submit(assets.geometry_arena)
+        glEndQuery(GL_TIME_ELAPSED)
+        occlusion_culler.capture(fb_gbuffer.depth_texture, scene.cam)
+        fb_gbuffer.unbind()
+        elapsed = glGetQueryObjectui64v(query, GL_QUERY_RESULT)
+        if frame >= WARMUP_FRAMES:
+            cull_ns += cull_end - cull_start
+            gpu_ns += int(elapsed)
+            num_instances += len(instanced_objects)
+            num_draw_calls += draw_list.get_num_draw_calls()
+    return {
+        "instances": num_instances / num_frames,
+        "draw_calls": num_draw_calls / num_frames,
+        "cull_ms": cull_ns / num_frames * 1e-6,
+        "gbuffer_ms": gpu_ns / num_frames * 1e-6,
+    }
+
+
+def main():
+    grid_size = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    num_frames = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    renderer = Renderer()
+    renderer.init(win_size=glm.ivec2(1280, 720), viewport_size=glm.ivec2(1280, 720), visible=False)
+
+    assets = Assets(renderer)
+    assets.load_many(
+        objs={"monkey": "models/suzanne_smooth.obj", "cube": "models/cube.obj"},
+        shaders={"default": ("shaders/default.vert", "shaders/default.frag")},
+    )
+    for name in ["scene", "mesh_id_colored"]:
+        assets.make_texture(name, renderer.get_texdesc_3channel_8bit())
+    for name in ["world_pos", "world_normal"]:
+        assets.make_texture(name, renderer.get_texdesc_3channel_flt32())
+    assets.make_texture("uv", renderer.get_texdesc_2channel_flt32())
+    assets.make_texture("my_depth", renderer.get_texdesc_1channel_flt32())
+    assets.make_texture("mesh_id", renderer.get_texdesc_1channel_int32())
+    fb_gbuffer = Framebuffer(
+        color_textures=[assets.textures[name] for name in ["scene", "world_pos", "world_normal", "uv", "my_depth", "mesh_id", "mesh_id_colored"]],
+        depth_texture=Texture(renderer.get_texdesc_default_depth())
+    )
+    scene = make_scene(renderer, assets, grid_size)
+    scene.cam.aspect_ratio = renderer.viewport_size.x / renderer.viewport_size.y
+    resources = (scene, assets, fb_gbuffer, SceneUniformBuffer(), InstanceBuffer(), IndirectDrawList(), glGenQueries(1))
+
+    print(f"{len(scene.objects)} objects, {renderer.viewport_size.x}x{renderer.viewport_size.y}, {num_frames} frames")
+    print(f"{'occlusion':>9} | {'instances':>9} | {'draw calls':>10} | {'cull ms':>8} | {'G-buffer ms':>11}")
+    for occlusion in (False, True):
+        result = run(num_frames, occlusion, *resources)
+        print(f"{'on' if occlusion else 'off':>9} | {result['instances']:9.1f} | {result['draw_calls']:10.1f} | {result['cull_ms']:8.3f} | {result['gbuffer_ms']:11.3f}")
+    renderer.deinit()
+
+
+if __name__ == "__main__":
+    main()
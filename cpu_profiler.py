@@ -0,0 +1,152 @@
+from collections import deque
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+
+import numpy as np
+
+# default number of frames of a Chrome trace and of a cProfile capture
+TRACE_NUM_FRAMES = 60
+CPROFILE_NUM_FRAMES = 120
+
+
+class CpuProfiler:
+    """
+    Scoped wall-clock timers based on time.perf_counter_ns. Scopes can be nested and used as context managers or decorators.
+    Keeps per-frame totals of each scope for aggregates, can capture a number of frames into a Chrome trace_event JSON file
+    (open in chrome://tracing or https://ui.perfetto.dev), and can run cProfile over a number of frames.
+    """
+    def __init__(self, history_size: int = 240):
+        self.enabled = True
+        self._history_size = history_size
+        # scope name -> per frame total durations in ms, in first seen order
+        self.timings: dict[str, deque] = {}
+        # scope name -> number of calls in the last frame
+        self.call_counts: dict[str, int] = {}
+        self._frame_totals_ns: dict[str, int] = {}
+        self._frame_calls: dict[str, int] = {}
+        self._frame_start_ns = 0
+        # Chrome trace capture
+        self._trace_frames_left = 0
+        self._trace_filename: str = None
+        self._trace_events: list[dict] = []
+        # cProfile capture
+        self._cprofile: cProfile.Profile = None
+        self._cprofile_frames_left = 0
+        self._cprofile_filename: str = None
+        self.last_cprofile_report = ""
+
+    def begin_frame(self):
+        self._frame_totals_ns = {}
+        self._frame_calls = {}
+        self._frame_start_ns = time.perf_counter_ns()
+
+    def end_frame(self):
+        frame_ns = time.perf_counter_ns() - self._frame_start_ns
+        self._frame_totals_ns["frame"] = frame_ns
+        self._frame_calls["frame"] = 1
+        if self._trace_frames_left > 0:
+            self._add_trace_event("frame", self._frame_start_ns, frame_ns)
+        for name, total_ns in self._frame_totals_ns.items():
+            self.timings.setdefault(name, deque(maxlen=self._history_size)).append(total_ns * 1e-6)
+        self.call_counts = self._frame_calls
+
+        if self._trace_frames_left > 0:
+            self._trace_frames_left -= 1
+            if self._trace_frames_left == 0:
+                self._write_trace()
+        if self._cprofile is not None:
+            self._cprofile_frames_left -= 1
+            if self._cprofile_frames_left == 0:
+                self._finish_cprofile()
+
+    @contextlib.contextmanager
+    def scope(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration_ns = time.perf_counter_ns() - start_ns
+            self._frame_totals_ns[name] = self._frame_totals_ns.get(name, 0) + duration_ns
+            self._frame_calls[name] = self._frame_calls.get(name, 0) + 1
+            if self._trace_frames_left > 0:
+                self._add_trace_event(name, start_ns, duration_ns)
+
+    def profile(self, name: str = None):
+        """Decorator version of scope(). Defaults to the function's qualified name"""
+        def decorator(func):
+            scope_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.scope(scope_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def get_summary(self, name: str) -> tuple[float, float, float]:
+        """(mean, p95, max) of the scope's per frame totals in ms over the history"""
+        durations = np.fromiter(self.timings[name], dtype=np.float64)
+        return float(durations.mean()), float(np.percentile(durations, 95)), float(durations.max())
+
+    # Chrome trace_event export
+    def capture_trace(self, num_frames: int, filename: str):
+        """Records the scopes of the next num_frames frames, and writes them into filename after the last one"""
+        if self.is_capturing_trace():
+            return
+        self._trace_frames_left = num_frames
+        self._trace_filename = filename
+        self._trace_events = []
+
+    def is_capturing_trace(self) -> bool:
+        return self._trace_frames_left > 0
+
+    def _add_trace_event(self, name: str, start_ns: int, duration_ns: int):
+        # complete events, timestamps in microseconds
+        self._trace_events.append({
+            "name": name,
+            "ph": "X",
+            "ts": start_ns / 1000,
+            "dur": duration_ns / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        })
+
+    def _write_trace(self):
+        with open(self._trace_filename, "w") as file:
+            json.dump({"traceEvents": self._trace_events, "displayTimeUnit": "ms"}, file)
+        print(f"CPU trace of {len(self._trace_events)} events written to {self._trace_filename}")
+        self._trace_events = []
+
+    # cProfile
+    def capture_cprofile(self, num_frames: int, filename: str = None, num_functions: int = 30):
+        """Runs cProfile from now on for num_frames frames, then prints the top functions by cumulative time"""
+        if self.is_capturing_cprofile():
+            return
+        self._cprofile_frames_left = num_frames
+        self._cprofile_filename = filename
+        self._cprofile_num_functions = num_functions
+        self._cprofile = cProfile.Profile()
+        self._cprofile.enable()
+
+    def is_capturing_cprofile(self) -> bool:
+        return self._cprofile is not None
+
+    def _finish_cprofile(self):
+        self._cprofile.disable()
+        if self._cprofile_filename is not None:
+            self._cprofile.dump_stats(self._cprofile_filename)
+        stream = io.StringIO()
+        pstats.Stats(self._cprofile, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self._cprofile_num_functions)
+        self.last_cprofile_report = stream.getvalue()
+        print(self.last_cprofile_report)
+        self._cprofile = None
@@ -0,0 +1,108 @@
+"""
+CPU implementations of the deferred point light post-process, i.e. cuda_interop.process_texture without CUDA.
+pos, norm: (rows, cols, 3) float32 world positions and normals, pixels: (rows, cols, 3) uint8 output, light_pos: (num_lights, 3)
+"""
+import math
+
+import numba
+from numba import njit, prange
+import numpy as np
+from OpenGL.GL import GL_RGB, GL_FLOAT, GL_UNSIGNED_BYTE, glGetTextureImage, glTextureSubImage2D
+
+from texture import Texture
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def shade_diffuse_numba(pos, norm, pixels, light_pos):
+    """Rows are distributed over numba's threads, see numba.set_num_threads(). Writes into pixels in place"""
+    for i in prange(pixels.shape[0]):
+        for j in range(pixels.shape[1]):
+            px, py, pz = pos[i, j, 0], pos[i, j, 1], pos[i, j, 2]
+            nx, ny, nz = norm[i, j, 0], norm[i, j, 1], norm[i, j, 2]
+            light = np.float32(0)
+            for li in range(light_pos.shape[0]):
+                dx = light_pos[li, 0] - px
+                dy = light_pos[li, 1] - py
+                dz = light_pos[li, 2] - pz
+                mag = math.sqrt(dx * dx + dy * dy + dz * dz)
+                if mag == 0:
+                    continue
+                diff = (nx * dx + ny * dy + nz * dz) / mag
+                if diff > 0:
+                    light += diff
+                # TODO: add specular highlights by Phong (or Blinn-Phong model)
+            if light > 1:
+                light = 1
+            value = np.uint8(light * 255.99)
+            pixels[i, j, 0] = value
+            pixels[i, j, 1] = value
+            pixels[i, j, 2] = value
+
+
+def shade_diffuse_numpy(pos, norm, pixels, light_pos):
+    """Same as shade_diffuse_numba() with NumPy array operations, single-threaded"""
+    light = np.zeros(pixels.shape[:2], dtype=np.float32)
+    for lp in light_pos:
+        surf_to_light = lp - pos
+        mag = np.linalg.norm(surf_to_light, axis=2)
+        diff = np.einsum('ijk,ijk->ij', norm, surf_to_light) / np.where(mag == 0, np.inf, mag)
+        light += np.maximum(diff, 0)
+    pixels[:, :, :] = (np.minimum(light, 1) * 255.99).astype(np.uint8)[:, :, None]
+
+
+class NumpyShadingPass:
+    """
+    shade_diffuse_numpy() without per frame allocations. Owns float32 scratch buffers of the viewport size, reads the G-buffer
+    textures into them, computes via out= ufuncs and writes into a reusable uint8 RGB buffer. Reallocates only on resize.
+    Arrays are (height, width, channels), the row order of glGetTextureImage.
+    """
+    def __init__(self, width: int, height: int, light_pos):
+        # float32, otherwise an int64 light position would promote all the math to float64
+        self.light_pos = np.asarray(light_pos, dtype=np.float32)
+        self.width = self.height = 0
+        self.resize_if_needed(width, height)
+
+    def resize_if_needed(self, width: int, height: int) -> bool:
+        if self.width == width and self.height == height:
+            return False
+        self.width, self.height = width, height
+        self.world_pos = np.empty((height, width, 3), dtype=np.float32)
+        self.world_normal = np.empty((height, width, 3), dtype=np.float32)
+        self._surf_to_light = np.empty((height, width, 3), dtype=np.float32)
+        self._mag = np.empty((height, width), dtype=np.float32)
+        self._diff = np.empty((height, width), dtype=np.float32)
+        self._light = np.empty((height, width), dtype=np.float32)
+        self.pixels = np.empty((height, width, 3), dtype=np.uint8)
+        return True
+
+    def read(self, world_pos: Texture, world_normal: Texture):
+        for tex, arr in ((world_pos, self.world_pos), (world_normal, self.world_normal)):
+            assert tex.desc.width == self.width and tex.desc.height == self.height
+            glGetTextureImage(tex.get_id(), 0, GL_RGB, GL_FLOAT, arr.nbytes, arr)
+
+    def shade(self):
+        """self.world_pos, self.world_normal -> self.pixels"""
+        surf_to_light, mag, diff, light = self._surf_to_light, self._mag, self._diff, self._light
+        light.fill(0)
+        for lp in self.light_pos:
+            np.subtract(lp, self.world_pos, out=surf_to_light)
+            np.einsum('ijk,ijk->ij', self.world_normal, surf_to_light, out=diff)
+            np.einsum('ijk,ijk->ij', surf_to_light, surf_to_light, out=mag)
+            np.sqrt(mag, out=mag)
+            # a surface point at the light gets 0 / tiny = 0
+            np.maximum(mag, np.finfo(np.float32).tiny, out=mag)
+            np.divide(diff, mag, out=diff)
+            np.maximum(diff, 0, out=diff)
+            np.add(light, diff, out=light)
+        np.minimum(light, 1, out=light)
+        np.multiply(light, 255.99, out=light)
+        np.copyto(self.pixels, light[:, :, np.newaxis], casting="unsafe")
+
+    def write(self, tex: Texture):
+        assert tex.desc.width == self.width and tex.desc.height == self.height
+        glTextureSubImage2D(tex.get_id(), 0, 0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE, self.pixels)
+
+
+def set_num_threads(num_threads: int):
+    """Clamped to [1, NUMBA_NUM_THREADS], the size of numba's thread pool"""
+    numba.set_num_threads(max(1, min(num_threads, numba.config.NUMBA_NUM_THREADS)))
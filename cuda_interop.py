@@ -0,0 +1,110 @@
+"""
+CUDA-OpenGL interop of Operation.TEX_TO_PBO_TO_DEV_ND_ARR: PBOs registered to CUDA and the point light kernel.
+Needs the CUDA Python bindings and a CUDA device, main.App imports it only with use_cuda=True.
+"""
+from texture import PixelBuffer
+
+from cuda import cudart
+import numba.cuda as nbcuda
+import numpy as np
+
+import ctypes
+import math
+
+
+def is_available() -> bool:
+    return nbcuda.is_available()
+
+
+# np.dot is not supported in CUDA numba
+@nbcuda.jit(device=True)
+def dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+@nbcuda.jit(device=True)
+def sub(a, b, res):
+    res[0] = a[0] - b[0]
+    res[1] = a[1] - b[1]
+    res[2] = a[2] - b[2]
+
+@nbcuda.jit(device=True)
+def scale(a, s, res):
+    res[0] = a[0] * s
+    res[1] = a[1] * s
+    res[2] = a[2] * s
+
+@nbcuda.jit(device=True)
+def length(a):
+    # can't use np.sqrt here :-( See https://github.com/numba/numba/issues/7112
+    return math.sqrt(dot(a, a))
+
+@nbcuda.jit(device=True)
+def normalize(a, n):
+    mag = length(a)
+    n[0] = a[0] / mag
+    n[1] = a[1] / mag
+    n[2] = a[2] / mag
+
+@nbcuda.jit
+def process_texture(pos, norm, pixels, light_pos):
+    i, j = nbcuda.grid(2)
+    N, M = nbcuda.gridsize(2)
+
+    if i >= pixels.shape[0] or j >= pixels.shape[1]:
+        return
+
+    # no need to copy light_pos to a local memory because it's physically the same as global dev RAM
+    light = np.float32(0)
+    for li in range(light_pos.shape[0]):
+        s2l = nbcuda.local.array(shape=3, dtype=np.float32)  # vec3
+        p = pos[i, j]
+        n = norm[i, j]
+        sub(light_pos[li], p, s2l)  # s2l = (l[0] - p[0], l[1] - p[1], l[2] - p[2])  
+        normalize(s2l, s2l)
+        diff = dot(n, s2l)
+        if diff < 0:
+            diff = 0
+        light += diff
+        # TODO: add specular highlights by Phong (or Blinn-Phong model)
+    if light > 1:
+        light = 1
+    light = np.uint8(light * 255.99)
+    pixels[i, j] = (light, light, light)
+
+    # x = np.dot(pos[i, j], norm[i, j])
+
+    # pixels[i, j, 0] = np.uint8(pos[i, j, 0] * 255)
+    # pixels[i, j, 1] = np.uint8(pos[i, j, 1] * 255)
+    # pixels[i, j, 2] = np.uint8(pos[i, j, 2] * 255)
+
+    # pixels[i, j, 0] = np.uint8(i / N * 255.99)
+    # pixels[i, j, 1] = np.uint8(j / M * 255.99)
+
+
+class CudaPixelBuffer:
+    def __init__(self, pbo: PixelBuffer):
+        self._pbo = pbo
+        err, self._gl_resource = cudart.cudaGraphicsGLRegisterBuffer(pbo.get_id(), cudart.cudaGraphicsRegisterFlags.cudaGraphicsRegisterFlagsNone)
+        assert err == cudart.cudaError_t.cudaSuccess
+    
+    def deinit(self):
+        (err,) = cudart.cudaGraphicsUnregisterResource(self._gl_resource)
+    
+    def map(self) -> nbcuda.cudadrv.devicearray.DeviceNDArray:
+        (err,) = cudart.cudaGraphicsMapResources(1, self._gl_resource, 0)
+        (err, dev_ptr, dev_buff_size) = cudart.cudaGraphicsResourceGetMappedPointer(self._gl_resource)
+        # For some reason, shape has to be (height, width, channels) and not (w, h, c). Otherwise 
+        shape, strides, dtype = nbcuda.api.prepare_shape_strides_dtype(
+            shape=(self._pbo.height, self._pbo.width, self._pbo.num_channels), strides=None, dtype=self._pbo.dtype, order="C")
+        mem_ptr = nbcuda.driver.MemoryPointer(context=nbcuda.current_context(), pointer=ctypes.c_uint64(dev_ptr), size=dev_buff_size)
+        dev_nd_array = nbcuda.cudadrv.devicearray.DeviceNDArray(shape, strides, dtype, gpu_data=mem_ptr)
+        return dev_nd_array
+
+    def unmap(self):
+        (err,) = cudart.cudaGraphicsUnmapResources(1, self._gl_resource, 0)
+    
+    def resize_if_needed(self, width: int, height: int):
+        if self._pbo.resize_if_needed(width, height):
+            (err,) = cudart.cudaGraphicsUnregisterResource(self._gl_resource)
+            err, self._gl_resource = cudart.cudaGraphicsGLRegisterBuffer(self._pbo.get_id(), cudart.cudaGraphicsRegisterFlags.cudaGraphicsRegisterFlagsNone)
+            assert err == cudart.cudaError_t.cudaSuccess
@@ -0,0 +1,191 @@
+from camera import Camera
+from scene import Object
+from texture import PixelBuffer, Texture
+
+import glm
+import numpy as np
+
+# (8, 3) bool, True where a box corner takes the max coordinate
+BOX_CORNERS = np.array([[(ix >> axis) & 1 for axis in range(3)] for ix in range(8)], dtype=bool)
+
+
+def frustum_planes(projection_from_world: glm.mat4) -> np.ndarray:
+    """
+    Gribb-Hartmann extraction of the 6 frustum planes (left, right, bottom, top, near, far) in world space.
+    Returns (6, 4) array of (nx, ny, nz, d) with inward pointing unit normals, i.e. n.p + d >= 0 inside.
+    """
+    m = np.array(projection_from_world, dtype=np.float32)  # mathematical row-major, unlike the GL upload
+    planes = np.array([
+        m[3] + m[0],
+        m[3] - m[0],
+        m[3] + m[1],
+        m[3] - m[1],
+        m[3] + m[2],
+        m[3] - m[2],
+    ])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def bounds_visible(planes: np.ndarray, world_from_object: np.ndarray, aabb_min: np.ndarray, aabb_max: np.ndarray,
+                   sphere_center: np.ndarray, sphere_radius: np.ndarray) -> np.ndarray:
+    """
+    Conservative test of N object space bounding volumes against the frustum planes, all at once.
+    world_from_object: (N, 4, 4) mathematical row-major matrices, aabb_min/aabb_max/sphere_center: (N, 3), sphere_radius: (N,)
+    Returns (N,) bool mask, False for objects that are fully outside of at least one plane.
+    """
+    linear = world_from_object[:, :3, :3]
+    translation = world_from_object[:, :3, 3]
+    normals, ds = planes[:, :3], planes[:, 3]
+
+    # sphere: center transformed, radius scaled by the largest axis scale
+    center = np.einsum('nij,nj->ni', linear, sphere_center) + translation
+    radius = sphere_radius * np.sqrt(np.max(np.einsum('nij,nij->nj', linear, linear), axis=1))
+    sphere_in = np.all(center @ normals.T + ds >= -radius[:, None], axis=1)
+
+    # AABB: world space box of the transformed box (Arvo), then the plane distance of its nearest corner
+    box_center = np.einsum('nij,nj->ni', linear, (aabb_min + aabb_max) * 0.5) + translation
+    box_extent = np.einsum('nij,nj->ni', np.abs(linear), (aabb_max - aabb_min) * 0.5)
+    box_in = np.all(box_center @ normals.T + ds >= -(box_extent @ np.abs(normals).T), axis=1)
+
+    return sphere_in & box_in
+
+
+class FrustumCuller:
+    """Drops objects whose world space bounds are outside of the camera frustum. Counts are of the last cull() call"""
+    def __init__(self):
+        self.enabled = True
+        self.num_visible = 0
+        self.num_culled = 0
+
+    def cull(self, objects: list[Object], cam: Camera) -> list[Object]:
+        if not self.enabled or len(objects) == 0:
+            self.num_visible, self.num_culled = len(objects), 0
+            return objects
+        planes = frustum_planes(cam.get_projection_from_view() * cam.get_view_from_world())
+        world_from_object = np.array([obj.get_world_matrix() for obj in objects], dtype=np.float32)
+        meshes = [obj.mesh for obj in objects]
+        visible = bounds_visible(
+            planes,
+            world_from_object,
+            np.array([mesh.aabb_min for mesh in meshes]),
+            np.array([mesh.aabb_max for mesh in meshes]),
+            np.array([mesh.sphere_center for mesh in meshes]),
+            np.array([mesh.sphere_radius for mesh in meshes]),
+        )
+        self.num_visible = int(np.count_nonzero(visible))
+        self.num_culled = len(objects) - self.num_visible
+        return [obj for obj, is_visible in zip(objects, visible) if is_visible]
+
+
+def build_depth_pyramid(depth: np.ndarray) -> list[np.ndarray]:
+    """
+    Hierarchical-Z pyramid of a (height, width) window space depth image. Each level's texel is the max (farthest)
+    of the 2x2 texels below it. Odd sizes are padded by repeating the last row/column, so that texel i of level L covers
+    pixels [i * 2^L, (i + 1) * 2^L) of level 0.
+    """
+    levels = [depth]
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        level = levels[-1]
+        h, w = level.shape
+        level = np.pad(level, ((0, h % 2), (0, w % 2)), mode='edge')
+        levels.append(level.reshape(level.shape[0] // 2, 2, level.shape[1] // 2, 2).max(axis=(1, 3)))
+    return levels
+
+
+def bounds_occluded(pyramid: list[np.ndarray], projection_from_world: np.ndarray, world_from_object: np.ndarray,
+                    aabb_min: np.ndarray, aabb_max: np.ndarray) -> np.ndarray:
+    """
+    Tests N object space AABBs against a depth pyramid rendered with projection_from_world.
+    Each box's screen rectangle is looked up at the mip level where it spans at most 2x2 texels.
+    Returns (N,) bool mask, True for boxes whose nearest depth is behind the farthest depth of the texels they cover.
+    """
+    height, width = pyramid[0].shape
+    num_objects = len(world_from_object)
+    corners = np.where(BOX_CORNERS[None, :, :], aabb_max[:, None, :], aabb_min[:, None, :])
+    corners = np.concatenate([corners, np.ones((num_objects, 8, 1), dtype=corners.dtype)], axis=2)
+    clip = np.einsum('nij,nkj->nki', projection_from_world[None, :, :] @ world_from_object, corners)
+    w = clip[..., 3]
+    # boxes crossing the near plane can't be projected, consider them visible
+    in_front = np.all(w > 1e-6, axis=1)
+    ndc = clip[..., :3] / np.where(w > 1e-6, w, 1.0)[..., None]
+    x0 = np.clip(np.floor((ndc[..., 0].min(axis=1) * 0.5 + 0.5) * width), 0, width - 1).astype(np.int64)
+    x1 = np.clip(np.floor((ndc[..., 0].max(axis=1) * 0.5 + 0.5) * width), 0, width - 1).astype(np.int64)
+    y0 = np.clip(np.floor((ndc[..., 1].min(axis=1) * 0.5 + 0.5) * height), 0, height - 1).astype(np.int64)
+    y1 = np.clip(np.floor((ndc[..., 1].max(axis=1) * 0.5 + 0.5) * height), 0, height - 1).astype(np.int64)
+    nearest = ndc[..., 2].min(axis=1) * 0.5 + 0.5
+
+    # smallest level at which the rectangle is at most 2 texels wide and high
+    extent = np.maximum(x1 - x0, y1 - y0)
+    levels = np.minimum(np.ceil(np.log2(extent + 1)).astype(np.int64), len(pyramid) - 1)
+    farthest = np.ones(num_objects, dtype=np.float32)
+    for level in np.unique(levels):
+        ixs = np.nonzero(levels == level)[0]
+        hz = pyramid[level]
+        lx0, lx1, ly0, ly1 = x0[ixs] >> level, x1[ixs] >> level, y0[ixs] >> level, y1[ixs] >> level
+        farthest[ixs] = np.maximum.reduce([hz[ly0, lx0], hz[ly0, lx1], hz[ly1, lx0], hz[ly1, lx1]])
+    return in_front & (nearest > farthest)
+
+
+class OcclusionCuller:
+    """
+    Drops objects hidden behind the previous frame's depth. capture() starts an asynchronous readback of the G-buffer
+    depth into a PBO after the G-buffer pass, the next frame's cull() maps it and builds the Hi-Z pyramid on the CPU.
+    Since the depth is a frame old, fast camera moves can briefly drop objects that just became visible.
+    Counts are of the last cull() call.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.num_tested = 0
+        self.num_occluded = 0
+        self._pbo: PixelBuffer = None
+        self._has_pending_depth = False
+        self._pending_projection_from_world: np.ndarray = None
+        self._pending_size: tuple[int, int] = None
+        self._pyramid: list[np.ndarray] = None
+        self._projection_from_world: np.ndarray = None
+
+    def capture(self, depth_tex: Texture, cam: Camera, size: glm.ivec2 = None):
+        """Call after the G-buffer pass, with the camera it was rendered with. size: of the rendered bottom-left sub-rectangle"""
+        if not self.enabled:
+            self._has_pending_depth = False
+            self._pyramid = None
+            return
+        desc = depth_tex.desc
+        if self._pbo is None:
+            self._pbo = PixelBuffer(desc.width, desc.height, desc.num_channels(), desc.dtype())
+        self._pbo.resize_if_needed(desc.width, desc.height)
+        self._pbo.read_tex(depth_tex)
+        self._has_pending_depth = True
+        self._pending_size = (desc.width, desc.height) if size is None else (size.x, size.y)
+        self._pending_projection_from_world = np.array(cam.get_projection_from_view() * cam.get_view_from_world(), dtype=np.float32)
+
+    def _update_pyramid(self):
+        if not self._has_pending_depth:
+            return
+        mapped = self._pbo.map_as_np_array()
+        width, height = self._pending_size
+        depth = mapped.reshape(self._pbo.height, self._pbo.width)[:height, :width].copy()
+        self._pbo.unmap_as_np_array()
+        self._pyramid = build_depth_pyramid(depth)
+        self._projection_from_world = self._pending_projection_from_world
+        self._has_pending_depth = False
+
+    def cull(self, objects: list[Object]) -> list[Object]:
+        if not self.enabled or len(objects) == 0:
+            self.num_tested, self.num_occluded = len(objects), 0
+            return objects
+        self._update_pyramid()
+        if self._pyramid is None:
+            self.num_tested, self.num_occluded = len(objects), 0
+            return objects
+        meshes = [obj.mesh for obj in objects]
+        occluded = bounds_occluded(
+            self._pyramid,
+            self._projection_from_world,
+            np.array([obj.get_world_matrix() for obj in objects], dtype=np.float32),
+            np.array([mesh.aabb_min for mesh in meshes]),
+            np.array([mesh.aabb_max for mesh in meshes]),
+        )
+        self.num_tested = len(objects)
+        self.num_occluded = int(np.count_nonzero(occluded))
+        return [obj for obj, is_occluded in zip(objects, occluded) if not is_occluded]
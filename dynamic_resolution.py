@@ -0,0 +1,63 @@
+from collections import deque
+
+import glm
+import numpy as np
+
+
+class DynamicResolution:
+    """
+    Picks the render scale, i.e. the size of the G-buffer relative to the viewport, that keeps the GPU frame time at
+    target_ms. The GPU time of the scaled passes grows about with the number of pixels, scale², so the scale is corrected
+    by sqrt(target / measured) of the median of the last `interval` measured frames, at most by max_step at once and
+    quantized to multiples of `granularity`. Medians within the deadband ratio around the target keep the scale, so that
+    noise doesn't make it oscillate. The viewport's RenderTargetPool targets fit any scale, changing it doesn't reallocate.
+    """
+    def __init__(self, target_ms: float = 16.0, min_scale: float = 0.5, max_scale: float = 1.0, interval: int = 15,
+                 deadband: float = 0.1, max_step: float = 0.1, granularity: float = 0.05):
+        self.enabled = False
+        self.target_ms = target_ms
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.interval = interval
+        self.deadband = deadband
+        self.max_step = max_step
+        self.granularity = granularity
+        self.scale = max_scale
+        self.num_adjustments = 0
+        # median of the last decision, None before the first one
+        self.last_median_ms: float = None
+        # measurements since the last adjustment
+        self._samples: deque = deque(maxlen=interval)
+
+    def update(self, frame_ms: float = None) -> float:
+        """Call once per frame, with the newest GPU frame time if there is one. Returns the scale for this frame"""
+        if not self.enabled:
+            self._samples.clear()
+            return self.scale
+        if frame_ms is not None:
+            self._samples.append(frame_ms)
+        if len(self._samples) < self.interval:
+            return self.scale
+        self.last_median_ms = float(np.median(self._samples))
+        ratio = self.target_ms / max(self.last_median_ms, 1e-3)
+        if abs(ratio - 1) > self.deadband:
+            step = float(np.clip(self.scale * (ratio ** 0.5 - 1), -self.max_step, self.max_step))
+            scale = round(round((self.scale + step) / self.granularity) * self.granularity, 6)
+            scale = float(np.clip(scale, self.min_scale, self.max_scale))
+            if scale != self.scale:
+                self.scale = scale
+                self.num_adjustments += 1
+                # the next measurements should be of the new scale. GPU timings arrive a few frames late, a few are not
+                self._samples.clear()
+                return self.scale
+        self._samples.popleft()
+        return self.scale
+
+    def set_enabled(self, enabled: bool):
+        """Disabling goes back to max_scale"""
+        self.enabled = enabled
+        if not enabled:
+            self.scale = self.max_scale
+
+    def get_render_size(self, viewport_size: glm.ivec2) -> glm.ivec2:
+        return glm.ivec2(max(1, round(viewport_size.x * self.scale)), max(1, round(viewport_size.y * self.scale)))
@@ -1,14 +1,15 @@
 from texture import Texture
 
-from OpenGL.GL import GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, GL_STENCIL_ATTACHMENT
+from OpenGL.GL import GL_COLOR_ATTACHMENT0, GL_DEPTH_ATTACHMENT, GL_STENCIL_ATTACHMENT, GL_NONE
 from OpenGL.GL import GL_DRAW_FRAMEBUFFER, GL_FRAMEBUFFER
 from OpenGL.GL import GL_FRAMEBUFFER_COMPLETE, glCheckFramebufferStatus
-from OpenGL.GL import glBindFramebuffer, glDrawBuffers, glFramebufferTexture2D, glGenFramebuffers
+from OpenGL.GL import glBindFramebuffer, glDeleteFramebuffers, glDrawBuffers, glFramebufferTexture2D, glGenFramebuffers
 from OpenGL.GL import GL_TEXTURE_2D
 
 
 class Framebuffer:
     def __init__(self, color_textures: list[Texture], depth_texture: Texture=None, stencil_texture: Texture=None):
+        """color_textures: None entries leave the fragment shader output of that location unattached, i.e. discarded"""
         self._id = glGenFramebuffers(1)
         self.color_textures = color_textures
         self.depth_texture = depth_texture
@@ -16,6 +17,9 @@ class Framebuffer:
         glBindFramebuffer(GL_DRAW_FRAMEBUFFER, self._id)
         draw_buffers = []
         for n, color_texture in enumerate(color_textures):
+            if color_texture is None:
+                draw_buffers.append(GL_NONE)
+                continue
             attachment = GL_COLOR_ATTACHMENT0 + n
             glFramebufferTexture2D(GL_FRAMEBUFFER, attachment, GL_TEXTURE_2D, color_texture.get_id(), 0)
             draw_buffers.append(attachment)
@@ -39,9 +43,14 @@ class Framebuffer:
     def unbind(self):
         glBindFramebuffer(GL_FRAMEBUFFER, 0)
 
+    def deinit(self):
+        """The attached textures are owned by the caller"""
+        glDeleteFramebuffers(1, [self._id])
+
     def resize_if_needed(self, width: int, height: int):
         for tex in self.color_textures:
-            tex.resize_if_needed(width, height)
+            if tex is not None:
+                tex.resize_if_needed(width, height)
         if self.depth_texture:
             self.depth_texture.resize_if_needed(width, height)
         if self.stencil_texture:
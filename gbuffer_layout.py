@@ -0,0 +1,38 @@
+from renderer import Renderer
+from texture import TextureDescription
+
+from enum import IntEnum
+
+
+class GBufferLayout(IntEnum):
+    """
+    Formats of the geometry attachments of the G-buffer. In sync with the GBUFFER_LAYOUT_* constants in lib/gbuffer.glsl
+    FULL_32F: world_pos RGB32F, world_normal RGB32F, uv RG32F. Needed by the CPU post-process operations
+    HALF: world_pos RGBA16F, world_normal RGB10_A2 as n * 0.5 + 0.5, uv RG16F
+    OCTAHEDRAL: world_pos RGBA16F, world_normal RG16_SNORM octahedral encoded, uv RG16F
+    DEPTH_ONLY_POS: no world_pos, the lighting pass reconstructs it from depth. world_normal and uv as OCTAHEDRAL
+    """
+    FULL_32F = 0
+    HALF = 1
+    OCTAHEDRAL = 2
+    DEPTH_ONLY_POS = 3
+
+
+def get_gbuffer_descs(renderer: Renderer, layout: GBufferLayout) -> dict[str, TextureDescription]:
+    """Descriptions of world_pos, world_normal and uv at the renderer's viewport size. world_pos is missing if not stored"""
+    if layout == GBufferLayout.FULL_32F:
+        return {
+            "world_pos": renderer.get_texdesc_3channel_flt32(),
+            "world_normal": renderer.get_texdesc_3channel_flt32(),
+            "uv": renderer.get_texdesc_2channel_flt32(),
+        }
+    descs = {}
+    if layout != GBufferLayout.DEPTH_ONLY_POS:
+        descs["world_pos"] = renderer.get_texdesc_4channel_flt16()
+    descs["world_normal"] = renderer.get_texdesc_rgb10_a2() if layout == GBufferLayout.HALF else renderer.get_texdesc_2channel_snorm16()
+    descs["uv"] = renderer.get_texdesc_2channel_flt16()
+    return descs
+
+
+def get_bytes_per_pixel(descs: dict[str, TextureDescription]) -> int:
+    return sum(desc.num_channels() * desc.dtype().itemsize for desc in descs.values())
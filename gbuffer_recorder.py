@@ -0,0 +1,240 @@
+from dataclasses import dataclass, field
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from camera import Camera
+from texture import Texture, PixelBuffer
+
+import glm
+
+# G-buffer attachments that are useful as training data
+RECORDABLE_ATTACHMENTS = ["world_pos", "world_normal", "uv", "my_depth", "mesh_id"]
+
+
+@dataclass
+class _Slot:
+    """One frame in flight: a persistent PixelBuffer per attachment, filled by the GPU, then drained by the writer thread"""
+    pbos: dict[str, PixelBuffer]
+    frame_meta: dict = None
+    # mapped arrays handed to the writer, (height, width, channels)
+    arrays: dict[str, np.ndarray] = field(default_factory=dict)
+
+
+class GBufferRecorder:
+    """
+    Records G-buffer attachments at full precision into a dataset directory, frame by frame.
+    record() reads the attachments into a free slot of persistent PixelBuffers and puts a fence (via read_tex), and hands
+    slots whose readbacks have finished to a writer thread, without waiting for the GPU. The writer copies them into
+    preallocated, chunked .npy memmaps, one file per attachment per chunk: <name>_<chunk>.npy of shape
+    (frames_per_chunk, height, width, channels), rows top first. index.json lists the frames with their camera pose.
+    Textures can be larger than the rendered size, see RenderTargetPool, only its bottom-left rectangle is written.
+
+    When all slots are busy, because the disk or the writer can't keep up, record() waits for the oldest slot instead of
+    dropping the frame. These waits are the writer's backpressure and are counted in num_backpressure_waits/backpressure_ms.
+    """
+    def __init__(self, textures: dict[str, Texture], num_slots: int = 4, frames_per_chunk: int = 64):
+        """textures: looked up by attachment name at each record(), ex: RenderGraph.textures"""
+        self._textures = textures
+        self._num_slots = num_slots
+        self.frames_per_chunk = frames_per_chunk
+        self.attachments = list(RECORDABLE_ATTACHMENTS)
+        self.is_recording = False
+        self.output_dir: str = None
+        self._slots: list[_Slot] = []
+        # slots in GPU readback, oldest first
+        self._reading: list[_Slot] = []
+        self._free: queue.Queue = None
+        self._to_write: queue.Queue = None
+        self._writer: threading.Thread = None
+        self._writer_error: Exception = None
+        # recorded size, and the size of the textures it's the bottom-left part of
+        self._size: tuple[int, int] = None
+        self._texture_size: tuple[int, int] = None
+        # dtype and channel count of each attachment, snapshot for the writer thread, the textures may change under it
+        self._formats: dict[str, tuple[np.dtype, int]] = None
+        self._index: dict = None
+        self._init_stats()
+
+    def _init_stats(self):
+        self.num_recorded = 0
+        self.num_written = 0
+        self.num_backpressure_waits = 0
+        self.backpressure_ms = 0.0
+        self.write_ms = 0.0
+
+    def start(self, output_dir: str, attachments: list[str] = None):
+        """The slots are allocated at the first record(), when the textures of the attachments exist"""
+        assert not self.is_recording
+        self.attachments = attachments or self.attachments
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self._slots = []
+        self._index = None
+        self._reading = []
+        self._free = queue.Queue()
+        self._to_write = queue.Queue()
+        self._init_stats()
+        self._writer_error = None
+        self._writer = threading.Thread(target=self._write_loop, name="gbuffer-writer", daemon=True)
+        self._writer.start()
+        self.is_recording = True
+
+    def _allocate_slots(self, size: glm.ivec2):
+        descs = {name: self._textures[name].desc for name in self.attachments}
+        first = descs[self.attachments[0]]
+        self._size = (size.x, size.y)
+        self._texture_size = (first.width, first.height)
+        assert all((desc.width, desc.height) == self._texture_size for desc in descs.values())
+        self._formats = {name: (desc.dtype(), desc.num_channels()) for name, desc in descs.items()}
+        self._slots = [
+            _Slot(pbos={name: PixelBuffer(desc.width, desc.height, desc.num_channels(), desc.dtype(), persistent=True) for name, desc in descs.items()})
+            for _ in range(self._num_slots)
+        ]
+        for slot in self._slots:
+            self._free.put(slot)
+        self._index = {
+            "width": size.x,
+            "height": size.y,
+            "frames_per_chunk": self.frames_per_chunk,
+            "attachments": {name: {"dtype": desc.dtype().name, "channels": desc.num_channels()} for name, desc in descs.items()},
+            "frames": [],
+        }
+        print(f"Recording {', '.join(self.attachments)} at {size.x}x{size.y} into {self.output_dir}")
+
+    def record(self, frame_id: int, cam: Camera, size: glm.ivec2):
+        """Call after the G-buffer pass, on the render thread. size: rendered size, the bottom-left part of the textures"""
+        if not self.is_recording:
+            return
+        if self._writer_error is not None:
+            print(f"G-buffer writer failed: {self._writer_error}")
+            self.stop()
+            return
+        if not self._slots:
+            self._allocate_slots(size)
+        desc = self._textures[self.attachments[0]].desc
+        if (size.x, size.y) != self._size or (desc.width, desc.height) != self._texture_size:
+            print(f"Viewport resized to {size.x}x{size.y}, stopped recording")
+            self.stop()
+            return
+        self._hand_over_finished_readbacks()
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            wait_start = time.perf_counter()
+            # the oldest readback has to go to the writer so that it can free a slot
+            self._hand_over_finished_readbacks(wait=True)
+            slot = None
+            while slot is None and self._writer.is_alive():
+                try:
+                    slot = self._free.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.num_backpressure_waits += 1
+            self.backpressure_ms += (time.perf_counter() - wait_start) * 1e3
+            if slot is None:
+                print(f"G-buffer writer failed: {self._writer_error}")
+                self.stop()
+                return
+        for name, pbo in slot.pbos.items():
+            pbo.read_tex(self._textures[name])
+        slot.frame_meta = {
+            "frame_id": frame_id,
+            "time": time.time(),
+            "cam_position": list(cam.position),
+            "cam_target": list(cam.target),
+            "fov": cam.fov,
+            "aspect_ratio": cam.aspect_ratio,
+            "near_clip": cam.near_clip,
+            "far_clip": cam.far_clip,
+            # row-major, i.e. M @ p
+            "view_from_world": np.array(cam.get_view_from_world()).tolist(),
+            "projection_from_view": np.array(cam.get_projection_from_view()).tolist(),
+        }
+        self._reading.append(slot)
+        self.num_recorded += 1
+
+    def _hand_over_finished_readbacks(self, wait: bool = False):
+        """Maps finished readbacks, in order, and queues them for the writer. wait: waits for at least the oldest one"""
+        while self._reading:
+            slot = self._reading[0]
+            if not wait and not all(pbo.is_ready() for pbo in slot.pbos.values()):
+                break
+            wait = False
+            # PixelBuffer arrays are (width, height, channels) shaped, the memory is height rows of width pixels
+            width, height = self._size
+            slot.arrays = {name: pbo.map_as_np_array().reshape(pbo.height, pbo.width, pbo.num_channels)[:height, :width] for name, pbo in slot.pbos.items()}
+            self._reading.pop(0)
+            self._to_write.put(slot)
+
+    def _write_loop(self):
+        chunk_ix = -1
+        chunk: dict[str, np.memmap] = {}
+        frame_in_chunk = self.frames_per_chunk
+        try:
+            while True:
+                slot = self._to_write.get()
+                if slot is None:
+                    break
+                write_start = time.perf_counter()
+                if frame_in_chunk == self.frames_per_chunk:
+                    self._flush_chunk(chunk)
+                    chunk_ix += 1
+                    frame_in_chunk = 0
+                    chunk = self._open_chunk(chunk_ix)
+                for name, arr in slot.arrays.items():
+                    np.copyto(chunk[name][frame_in_chunk], arr[::-1])  # OpenGL images are inverted on y-axis
+                self._index["frames"].append({**slot.frame_meta, "chunk": chunk_ix, "index_in_chunk": frame_in_chunk})
+                frame_in_chunk += 1
+                slot.arrays = {}
+                self._free.put(slot)
+                self.num_written += 1
+                self.write_ms += (time.perf_counter() - write_start) * 1e3
+        except Exception as e:
+            self._writer_error = e
+        finally:
+            self._flush_chunk(chunk)
+            if self._index is not None:
+                self._write_index()
+
+    def _open_chunk(self, chunk_ix: int) -> dict[str, np.memmap]:
+        width, height = self._size
+        chunk = {}
+        for name, (dtype, num_channels) in self._formats.items():
+            filename = os.path.join(self.output_dir, f"{name}_{chunk_ix:05d}.npy")
+            # preallocated to the full chunk, frames of an unfinished last chunk are zeros, see index.json
+            chunk[name] = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=(self.frames_per_chunk, height, width, num_channels))
+        return chunk
+
+    def _flush_chunk(self, chunk: dict[str, np.memmap]):
+        for arr in chunk.values():
+            arr.flush()
+        if chunk:
+            self._write_index()
+
+    def _write_index(self):
+        with open(os.path.join(self.output_dir, "index.json"), "w") as file:
+            json.dump(self._index, file)
+
+    def stop(self):
+        """Waits for the pending readbacks and writes, then writes index.json"""
+        if not self.is_recording:
+            return
+        self.is_recording = False
+        while self._reading:
+            self._hand_over_finished_readbacks(wait=True)
+        self._to_write.put(None)
+        self._writer.join()
+        for slot in self._slots:
+            for pbo in slot.pbos.values():
+                pbo.deinit()
+        self._slots = []
+        print(f"Recorded {self.num_written} frames into {self.output_dir}. Writer backpressure: {self.num_backpressure_waits} waits, {self.backpressure_ms:.1f} ms")
+
+    def get_queue_size(self) -> int:
+        """Frames read back or being read back but not written yet"""
+        return len(self._reading) + (self._to_write.qsize() if self._to_write is not None else 0)
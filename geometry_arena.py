@@ -0,0 +1,76 @@
+import numpy as np
+from OpenGL.GL import GL_DYNAMIC_STORAGE_BIT, GL_FLOAT, GL_FALSE
+from OpenGL.GL import glCreateBuffers, glNamedBufferStorage, glNamedBufferSubData, glCopyNamedBufferSubData, glDeleteBuffers
+from OpenGL.GL import glCreateVertexArrays, glVertexArrayVertexBuffer, glVertexArrayElementBuffer
+from OpenGL.GL import glEnableVertexArrayAttrib, glVertexArrayAttribFormat, glVertexArrayAttribBinding
+
+# pos 3, tex 2, nrm 3, col 4
+VERTEX_ATTRIBUTE_SIZES = [3, 2, 3, 4]
+VERTEX_SIZE = sum(VERTEX_ATTRIBUTE_SIZES)
+VERTEX_STRIDE = VERTEX_SIZE * np.dtype(np.float32).itemsize
+INDEX_DTYPE = np.dtype(np.uint32)
+
+
+class GeometryArena:
+    """
+    A single vertex buffer, index buffer and VAO all meshes are suballocated from, so that any set of meshes
+    can be drawn without switching buffers, ex: with one glMultiDrawElementsIndirect.
+    Buffers grow by doubling, by copying into a new buffer on the GPU. Allocations are never freed.
+    """
+    def __init__(self, vertex_capacity: int = 1 << 16, index_capacity: int = 1 << 18):
+        self.vao = glCreateVertexArrays(1)
+        offset = 0
+        for ix, size in enumerate(VERTEX_ATTRIBUTE_SIZES):
+            glEnableVertexArrayAttrib(self.vao, ix)
+            glVertexArrayAttribFormat(self.vao, ix, size, GL_FLOAT, GL_FALSE, offset * np.dtype(np.float32).itemsize)
+            glVertexArrayAttribBinding(self.vao, ix, 0)
+            offset += size
+        self.vertex_count = 0
+        self.index_count = 0
+        self.vertex_capacity = 0
+        self.index_capacity = 0
+        self.vbo = -1
+        self.ibo = -1
+        self._grow_vertices(vertex_capacity)
+        self._grow_indices(index_capacity)
+
+    def _grow(self, old_id: int, used_bytes: int, new_bytes: int) -> int:
+        new_id = glCreateBuffers(1)
+        glNamedBufferStorage(new_id, new_bytes, None, GL_DYNAMIC_STORAGE_BIT)
+        if old_id != -1:
+            if used_bytes > 0:
+                glCopyNamedBufferSubData(old_id, new_id, 0, 0, used_bytes)
+            glDeleteBuffers(1, [old_id])
+        return new_id
+
+    def _grow_vertices(self, capacity: int):
+        self.vbo = self._grow(self.vbo, self.vertex_count * VERTEX_STRIDE, capacity * VERTEX_STRIDE)
+        self.vertex_capacity = capacity
+        glVertexArrayVertexBuffer(self.vao, 0, self.vbo, 0, VERTEX_STRIDE)
+
+    def _grow_indices(self, capacity: int):
+        self.ibo = self._grow(self.ibo, self.index_count * INDEX_DTYPE.itemsize, capacity * INDEX_DTYPE.itemsize)
+        self.index_capacity = capacity
+        glVertexArrayElementBuffer(self.vao, self.ibo)
+
+    def allocate(self, np_vertices: np.ndarray, np_indices: np.ndarray = None) -> tuple[int, int, int, int]:
+        """
+        Appends a mesh. Non-indexed meshes get a trivial index buffer, so that all meshes are drawn the same way.
+        Returns (first_index, index_count, base_vertex, vertex_count)
+        """
+        vertex_count = len(np_vertices) // VERTEX_SIZE
+        if np_indices is None:
+            np_indices = np.arange(vertex_count, dtype=INDEX_DTYPE)
+        np_vertices = np.ascontiguousarray(np_vertices, dtype=np.float32)
+        np_indices = np.ascontiguousarray(np_indices, dtype=INDEX_DTYPE)
+        index_count = len(np_indices)
+        if self.vertex_count + vertex_count > self.vertex_capacity:
+            self._grow_vertices(max(2 * self.vertex_capacity, self.vertex_count + vertex_count))
+        if self.index_count + index_count > self.index_capacity:
+            self._grow_indices(max(2 * self.index_capacity, self.index_count + index_count))
+        base_vertex, first_index = self.vertex_count, self.index_count
+        glNamedBufferSubData(self.vbo, base_vertex * VERTEX_STRIDE, np_vertices.nbytes, np_vertices)
+        glNamedBufferSubData(self.ibo, first_index * INDEX_DTYPE.itemsize, np_indices.nbytes, np_indices)
+        self.vertex_count += vertex_count
+        self.index_count += index_count
+        return first_index, index_count, base_vertex, vertex_count
@@ -0,0 +1,117 @@
+from collections import deque
+import contextlib
+
+import numpy as np
+from OpenGL.GL import GL_TIME_ELAPSED, GL_QUERY_RESULT, GL_QUERY_RESULT_AVAILABLE
+from OpenGL.GL import GL_VERTICES_SUBMITTED, GL_PRIMITIVES_SUBMITTED, GL_CLIPPING_OUTPUT_PRIMITIVES, GL_FRAGMENT_SHADER_INVOCATIONS
+from OpenGL.GL import glGenQueries, glBeginQuery, glEndQuery, glGetQueryObjectiv, glGetQueryObjectui64v, glFinish
+
+# ARB_pipeline_statistics_query counters, core since OpenGL 4.6
+PIPELINE_STATISTICS = {
+    "vertices": GL_VERTICES_SUBMITTED,
+    "primitives": GL_PRIMITIVES_SUBMITTED,
+    "clipped primitives": GL_CLIPPING_OUTPUT_PRIMITIVES,
+    "fragment invocations": GL_FRAGMENT_SHADER_INVOCATIONS,
+}
+# pseudo pass of the sum of all passes of a frame
+FRAME_TOTAL = "frame total"
+
+
+class GpuProfiler:
+    """
+    Measures render passes with GL_TIME_ELAPSED queries, and optionally pipeline statistics queries.
+    Each of the last num_frames_in_flight frames has its own queries, a frame's results are read when its queries are about
+    to be reused, so reading never waits for the GPU. Results that are still not available then are dropped.
+    Passes can't be nested, since only one query per target can be active.
+    """
+    def __init__(self, num_frames_in_flight: int = 4, history_size: int = 240):
+        self.enabled = True
+        self.collect_pipeline_statistics = False
+        self.num_dropped_frames = 0
+        # frames whose results were read, for consumers of the newest FRAME_TOTAL, ex: DynamicResolution
+        self.num_collected_frames = 0
+        self._num_slots = num_frames_in_flight
+        # per slot: pass name -> [time query, *pipeline statistics queries]
+        self._queries: list[dict[str, list[int]]] = [{} for _ in range(num_frames_in_flight)]
+        # per slot: (pass name, has pipeline statistics) in the order they were recorded
+        self._recorded: list[list[tuple[str, bool]]] = [[] for _ in range(num_frames_in_flight)]
+        self._frame_ix = -1
+        self._active_pass: str = None
+        self._history_size = history_size
+        # pass name -> durations in ms, in first seen order
+        self.timings: dict[str, deque] = {}
+        # pass name -> statistic name -> counts
+        self.statistics: dict[str, dict[str, deque]] = {}
+
+    def begin_frame(self):
+        self._frame_ix += 1
+        slot = self._frame_ix % self._num_slots
+        self._collect(slot)
+        self._recorded[slot] = []
+
+    def finish(self):
+        """Waits for the GPU and collects the results of all frames in flight, oldest first. For benchmarks, not per frame"""
+        glFinish()
+        for offset in range(1, self._num_slots + 1):
+            slot = (self._frame_ix + offset) % self._num_slots
+            self._collect(slot)
+            self._recorded[slot] = []
+
+    @contextlib.contextmanager
+    def scope(self, name: str):
+        if not self.enabled or self._frame_ix < 0:
+            yield
+            return
+        assert self._active_pass is None, f"GPU pass '{name}' started within '{self._active_pass}'"
+        slot = self._frame_ix % self._num_slots
+        if name not in self._queries[slot]:
+            self._queries[slot][name] = list(glGenQueries(1 + len(PIPELINE_STATISTICS)))
+        queries = self._queries[slot][name]
+        with_statistics = self.collect_pipeline_statistics
+        self._active_pass = name
+        glBeginQuery(GL_TIME_ELAPSED, queries[0])
+        if with_statistics:
+            for query, target in zip(queries[1:], PIPELINE_STATISTICS.values()):
+                glBeginQuery(target, query)
+        try:
+            yield
+        finally:
+            glEndQuery(GL_TIME_ELAPSED)
+            if with_statistics:
+                for target in PIPELINE_STATISTICS.values():
+                    glEndQuery(target)
+            self._active_pass = None
+            self._recorded[slot].append((name, with_statistics))
+
+    def _collect(self, slot: int):
+        recorded = self._recorded[slot]
+        if not recorded:
+            return
+        for name, with_statistics in recorded:
+            queries = self._queries[slot][name]
+            for query in (queries if with_statistics else queries[:1]):
+                if not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                    self.num_dropped_frames += 1
+                    return
+        total_ms = 0.0
+        for name, with_statistics in recorded:
+            queries = self._queries[slot][name]
+            duration_ms = int(glGetQueryObjectui64v(queries[0], GL_QUERY_RESULT)) * 1e-6
+            total_ms += duration_ms
+            self.timings.setdefault(name, deque(maxlen=self._history_size)).append(duration_ms)
+            if with_statistics:
+                pass_statistics = self.statistics.setdefault(name, {})
+                for query, stat_name in zip(queries[1:], PIPELINE_STATISTICS.keys()):
+                    count = int(glGetQueryObjectui64v(query, GL_QUERY_RESULT))
+                    pass_statistics.setdefault(stat_name, deque(maxlen=self._history_size)).append(count)
+        self.timings.setdefault(FRAME_TOTAL, deque(maxlen=self._history_size)).append(total_ms)
+        self.num_collected_frames += 1
+
+    def get_summary(self, name: str) -> tuple[float, float, float, float]:
+        """(mean, p50, p95, p99) of the pass' durations in ms over the history"""
+        durations = np.fromiter(self.timings[name], dtype=np.float64)
+        p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+        return float(durations.mean()), float(p50), float(p95), float(p99)
+
+    def get_statistics_means(self, name: str) -> dict[str, float]:
+        return {stat_name: float(np.mean(counts)) for stat_name, counts in self.statistics.get(name, {}).items()}
@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+
+from geometry_arena import GeometryArena
+from mesh import Mesh
+from scene import Object
+from shader import Shader
+
+import numpy as np
+from OpenGL.GL import GL_SHADER_STORAGE_BUFFER, GL_DRAW_INDIRECT_BUFFER, GL_DYNAMIC_DRAW, GL_SHADER_STORAGE_BUFFER_OFFSET_ALIGNMENT
+from OpenGL.GL import GL_TRIANGLES, GL_UNSIGNED_INT
+from OpenGL.GL import glGenBuffers, glBindBuffer, glBufferData, glBufferSubData, glBindBufferBase, glBindBufferRange, glGetIntegerv
+from OpenGL.GL import glBindVertexArray, glMultiDrawElementsIndirect
+
+import ctypes
+
+# in sync with the values in instance_data.glsl
+INSTANCES_BINDING = 0
+DRAW_DATA_BINDING = 1
+
+# std430 layout of InstanceData in instance_data.glsl. Normal matrix is stored as a mat4 to avoid mat3 padding rules
+instance_dtype = np.dtype({
+    'names': ['worldFromObject', 'normalFromObject'],
+    'formats': [('<f4', (4, 4)), ('<f4', (4, 4))],
+    'offsets': [0, 64],
+    'itemsize': 128,
+})
+# std430 layout of DrawData in instance_data.glsl, indexed by gl_DrawID. std430 doesn't round struct alignment up to 16,
+# the array stride is 8
+draw_data_dtype = np.dtype({
+    'names': ['firstInstance', 'meshId'],
+    'formats': ['<i4', '<i4'],
+    'offsets': [0, 4],
+    'itemsize': 8,
+})
+# struct DrawElementsIndirectCommand of glMultiDrawElementsIndirect
+draw_command_dtype = np.dtype([
+    ('count', '<u4'),
+    ('instanceCount', '<u4'),
+    ('firstIndex', '<u4'),
+    ('baseVertex', '<i4'),
+    ('baseInstance', '<u4'),
+])
+
+
+@dataclass
+class Batch:
+    """Instances of the same mesh drawn with the same shader by a single draw command"""
+    mesh: Mesh
+    shader: Shader
+    first_instance: int
+    instance_count: int
+
+
+def make_batches(objects: list[Object]) -> tuple[list[Batch], list[Object]]:
+    """Groups objects by shader and mesh. Returns batches and the objects in instance order"""
+    groups: dict[tuple[int, int], list[Object]] = {}
+    for obj in objects:
+        groups.setdefault((obj.shader.get_id(), obj.mesh.mesh_id), []).append(obj)
+    batches = []
+    ordered = []
+    # sorted by shader, so that batches of a shader are consecutive and can be submitted together
+    for key in sorted(groups.keys()):
+        group = groups[key]
+        batches.append(Batch(mesh=group[0].mesh, shader=group[0].shader, first_instance=len(ordered), instance_count=len(group)))
+        ordered.extend(group)
+    return batches, ordered
+
+
+class InstanceBuffer:
+    """Per-instance data of all objects drawn in a frame, in a shader storage buffer"""
+    def __init__(self, capacity: int = 256):
+        self._id = glGenBuffers(1)
+        self.capacity = 0
+        self.data = np.zeros(0, dtype=instance_dtype)
+        self.reserve(capacity)
+
+    def get_id(self) -> int:
+        return self._id
+
+    def reserve(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        self.capacity = max(capacity, 2 * self.capacity)
+        self.data = np.zeros(self.capacity, dtype=instance_dtype)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self._id)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, self.capacity * instance_dtype.itemsize, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+    def upload(self, objects: list[Object]):
+        """objects: in instance order, see make_batches()"""
+        self.reserve(len(objects))
+        n = len(objects)
+        if n == 0:
+            return
+        data = self.data
+        # one NumPy assignment per field instead of per instance. Transposed because np.array() of a glm matrix is row-major
+        data['worldFromObject'][:n] = np.array([obj.get_world_matrix() for obj in objects]).transpose(0, 2, 1)
+        data['normalFromObject'][:n, :3, :3] = np.array([obj.get_normal_matrix() for obj in objects]).transpose(0, 2, 1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self._id)
+        glBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, n * instance_dtype.itemsize, data)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, INSTANCES_BINDING, self._id)
+
+
+class IndirectDrawList:
+    """
+    Draw commands of a frame's batches in an indirect buffer, plus per-draw data the shaders read via gl_DrawID.
+    All batches of a shader are submitted with a single glMultiDrawElementsIndirect.
+    """
+    def __init__(self, capacity: int = 64):
+        self._commands_id = glGenBuffers(1)
+        self._draw_data_id = glGenBuffers(1)
+        # gl_DrawID restarts from 0 at every multi-draw, so each shader's draw data is bound as a separate range
+        alignment = int(glGetIntegerv(GL_SHADER_STORAGE_BUFFER_OFFSET_ALIGNMENT))
+        # in elements, so that first * itemsize of every group is a multiple of the (power of two) offset alignment
+        self._align = max(1, -(-alignment // draw_data_dtype.itemsize))
+        self.capacity = 0
+        self.commands = np.zeros(0, dtype=draw_command_dtype)
+        self.draw_data = np.zeros(0, dtype=draw_data_dtype)
+        # (shader, first command, command count)
+        self._groups: list[tuple[Shader, int, int]] = []
+        self.reserve(capacity)
+
+    def reserve(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        self.capacity = max(capacity, 2 * self.capacity)
+        self.commands = np.zeros(self.capacity, dtype=draw_command_dtype)
+        self.draw_data = np.zeros(self.capacity, dtype=draw_data_dtype)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self._commands_id)
+        glBufferData(GL_DRAW_INDIRECT_BUFFER, self.capacity * draw_command_dtype.itemsize, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self._draw_data_id)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, self.capacity * draw_data_dtype.itemsize, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+    def build(self, batches: list[Batch]):
+        """batches: as returned by make_batches(), i.e. batches of a shader are consecutive"""
+        self._groups = []
+        # worst case padding of every group's start to the SSBO offset alignment
+        self.reserve(len(batches) * self._align + self._align)
+        ix = 0
+        for batch in batches:
+            if not self._groups or self._groups[-1][0] is not batch.shader:
+                ix = -(-ix // self._align) * self._align
+                self._groups.append((batch.shader, ix, 0))
+            shader, first, count = self._groups[-1]
+            self._groups[-1] = (shader, first, count + 1)
+            mesh = batch.mesh
+            self.commands[ix] = (mesh.index_count, batch.instance_count, mesh.first_index, mesh.base_vertex, batch.first_instance)
+            self.draw_data[ix] = (batch.first_instance, mesh.mesh_id)
+            ix += 1
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self._commands_id)
+        glBufferSubData(GL_DRAW_INDIRECT_BUFFER, 0, ix * draw_command_dtype.itemsize, self.commands)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self._draw_data_id)
+        glBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, ix * draw_data_dtype.itemsize, self.draw_data)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, 0)
+
+    def get_num_draw_calls(self) -> int:
+        return len(self._groups)
+
+    def submit(self, arena: GeometryArena):
+        glBindVertexArray(arena.vao)
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, self._commands_id)
+        for shader, first, count in self._groups:
+            shader.bind()
+            glBindBufferRange(GL_SHADER_STORAGE_BUFFER, DRAW_DATA_BINDING, self._draw_data_id, first * draw_data_dtype.itemsize, count * draw_data_dtype.itemsize)
+            glMultiDrawElementsIndirect(GL_TRIANGLES, GL_UNSIGNED_INT, ctypes.c_void_p(first * draw_command_dtype.itemsize), count, 0)
+            shader.unbind()
+        glBindBuffer(GL_DRAW_INDIRECT_BUFFER, 0)
+        glBindVertexArray(0)
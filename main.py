@@ -8,31 +8,41 @@ REF:
 * https://github.com/vug/render-graph-study
 """
 from assets import Assets
-from framebuffer import Framebuffer
+from cpu_shading import NumpyShadingPass, shade_diffuse_numba
+from culling import FrustumCuller, OcclusionCuller
+from dynamic_resolution import DynamicResolution
+from gbuffer_layout import GBufferLayout, get_gbuffer_descs
+from gbuffer_recorder import GBufferRecorder
+from cpu_profiler import CpuProfiler, TRACE_NUM_FRAMES, CPROFILE_NUM_FRAMES
+from gpu_profiler import GpuProfiler, FRAME_TOTAL
+from instancing import InstanceBuffer, IndirectDrawList, make_batches
 from lights import PointLight
+from render_graph import RenderGraph
+from render_target_pool import RenderTargetPool
 from renderer import Renderer
 from scene import Scene, Object
-from texture import Texture, PixelBuffer
+from scene_uniform_buffer import SceneUniformBuffer
+from shader import Shader
+from texture import PixelBuffer, PixelBufferRing
+from texture_saver import TextureSaver
 import ui
 import utils
 
-from cuda import cudart
 import glm
 import glfw
 import imgui
-import numba.cuda as nbcuda
 import numpy as np
 from OpenGL.GL import (
     GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, glClear, glClearColor,
     GL_TRIANGLES, glBindVertexArray, glDrawArrays,
     glActiveTexture, GL_TEXTURE0,
-    glReadBuffer, GL_COLOR_ATTACHMENT0, glReadPixels, GL_RGB, GL_FLOAT, glTexImage2D, GL_TEXTURE_2D, GL_UNSIGNED_BYTE, GL_RGB8, glPixelStorei, GL_UNPACK_ALIGNMENT,
-    GL_PACK_ALIGNMENT
+    glPixelStorei, GL_UNPACK_ALIGNMENT, GL_PACK_ALIGNMENT
 )
 
-import ctypes
+from datetime import datetime
 from enum import Enum
 import math
+import time
 import traceback
 
 renderer = Renderer()
@@ -40,143 +50,11 @@ class Operation(Enum):
     TEX_TO_NUMPY = 1
     TEX_TO_PBO_TO_MAP = 2
     TEX_TO_PBO_TO_DEV_ND_ARR = 3
+    CPU_NUMBA = 4
 
 operation = Operation.TEX_TO_PBO_TO_DEV_ND_ARR
 
-# np.dot is not supported in CUDA numba
-@nbcuda.jit(device=True)
-def dot(a, b):
-    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
-
-@nbcuda.jit(device=True)
-def sub(a, b, res):
-    res[0] = a[0] - b[0]
-    res[1] = a[1] - b[1]
-    res[2] = a[2] - b[2]
-
-@nbcuda.jit(device=True)
-def scale(a, s, res):
-    res[0] = a[0] * s
-    res[1] = a[1] * s
-    res[2] = a[2] * s
-
-@nbcuda.jit(device=True)
-def length(a):
-    # can't use np.sqrt here :-( See https://github.com/numba/numba/issues/7112
-    return math.sqrt(dot(a, a))
-
-@nbcuda.jit(device=True)
-def normalize(a, n):
-    mag = length(a)
-    n[0] = a[0] / mag
-    n[1] = a[1] / mag
-    n[2] = a[2] / mag
-
-@nbcuda.jit
-def process_texture(pos, norm, pixels, light_pos):
-    i, j = nbcuda.grid(2)
-    N, M = nbcuda.gridsize(2)
-
-    if i >= pixels.shape[0] or j >= pixels.shape[1]:
-        return
-
-    # no need to copy light_pos to a local memory because it's physically the same as global dev RAM
-    light = np.float32(0)
-    for li in range(light_pos.shape[0]):
-        s2l = nbcuda.local.array(shape=3, dtype=np.float32)  # vec3
-        p = pos[i, j]
-        n = norm[i, j]
-        sub(light_pos[li], p, s2l)  # s2l = (l[0] - p[0], l[1] - p[1], l[2] - p[2])  
-        normalize(s2l, s2l)
-        diff = dot(n, s2l)
-        if diff < 0:
-            diff = 0
-        light += diff
-        # TODO: add specular highlights by Phong (or Blinn-Phong model)
-    if light > 1:
-        light = 1
-    light = np.uint8(light * 255.99)
-    pixels[i, j] = (light, light, light)
-
-    # x = np.dot(pos[i, j], norm[i, j])
-
-    # pixels[i, j, 0] = np.uint8(pos[i, j, 0] * 255)
-    # pixels[i, j, 1] = np.uint8(pos[i, j, 1] * 255)
-    # pixels[i, j, 2] = np.uint8(pos[i, j, 2] * 255)
-
-    # pixels[i, j, 0] = np.uint8(i / N * 255.99)
-    # pixels[i, j, 1] = np.uint8(j / M * 255.99)
-
-
-class CudaPixelBuffer:
-    def __init__(self, pbo: PixelBuffer):
-        self._pbo = pbo
-        err, self._gl_resource = cudart.cudaGraphicsGLRegisterBuffer(pbo.get_id(), cudart.cudaGraphicsRegisterFlags.cudaGraphicsRegisterFlagsNone)
-        assert err == cudart.cudaError_t.cudaSuccess
-    
-    def deinit(self):
-        (err,) = cudart.cudaGraphicsUnregisterResource(self._gl_resource)
-    
-    def map(self) -> nbcuda.cudadrv.devicearray.DeviceNDArray:
-        (err,) = cudart.cudaGraphicsMapResources(1, self._gl_resource, 0)
-        (err, dev_ptr, dev_buff_size) = cudart.cudaGraphicsResourceGetMappedPointer(self._gl_resource)
-        # For some reason, shape has to be (height, width, channels) and not (w, h, c). Otherwise 
-        shape, strides, dtype = nbcuda.api.prepare_shape_strides_dtype(
-            shape=(self._pbo.height, self._pbo.width, self._pbo.num_channels), strides=None, dtype=self._pbo.dtype, order="C")
-        mem_ptr = nbcuda.driver.MemoryPointer(context=nbcuda.current_context(), pointer=ctypes.c_uint64(dev_ptr), size=dev_buff_size)
-        dev_nd_array = nbcuda.cudadrv.devicearray.DeviceNDArray(shape, strides, dtype, gpu_data=mem_ptr)
-        return dev_nd_array
-
-    def unmap(self):
-        (err,) = cudart.cudaGraphicsUnmapResources(1, self._gl_resource, 0)
-    
-    def resize_if_needed(self, width: int, height: int):
-        if self._pbo.resize_if_needed(width, height):
-            (err,) = cudart.cudaGraphicsUnregisterResource(self._gl_resource)
-            err, self._gl_resource = cudart.cudaGraphicsGLRegisterBuffer(self._pbo.get_id(), cudart.cudaGraphicsRegisterFlags.cudaGraphicsRegisterFlagsNone)
-            assert err == cudart.cudaError_t.cudaSuccess
-
-
-def main():
-    initial_viewport_size = utils.read_window_size_from_imgui_ini("Viewport")
-    renderer.init(win_size=glm.ivec2(1024, 768), viewport_size=initial_viewport_size)
-    glPixelStorei(GL_PACK_ALIGNMENT, 1)
-    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)    
-
-    assets = Assets(renderer)
-    assets.load_obj("monkey", "models/suzanne_smooth.obj")
-    assets.load_obj("ship", "models/ship.obj")
-    assets.load_obj("cube", "models/cube.obj")
-    assets.load_obj("quad", "models/plane.obj")
-    assets.load_obj("sphere", "models/sphere_ico_smooth.obj")
-    assets.load_shader("default", "shaders/default.vert", "shaders/default.frag")
-    assets.load_shader("fullscreen", "shaders/fullscreen_quad.vert", "shaders/fullscreen_quad.frag")
-    assets.make_texture("scene", renderer.get_texdesc_3channel_8bit())
-    assets.make_texture("world_pos", renderer.get_texdesc_3channel_flt32())
-    assets.make_texture("world_normal", renderer.get_texdesc_3channel_flt32())
-    assets.make_texture("uv", renderer.get_texdesc_2channel_flt32())
-    assets.make_texture("my_depth", renderer.get_texdesc_1channel_flt32())  # actually a color attachment
-    assets.make_texture("mesh_id", renderer.get_texdesc_1channel_int32())
-    assets.make_texture("mesh_id_colored", renderer.get_texdesc_3channel_8bit())
-    assets.make_texture("viewport", renderer.get_texdesc_3channel_8bit())
-    assets.make_texture("cpu", renderer.get_texdesc_3channel_8bit())
-    pbo_world_pos = PixelBuffer(initial_viewport_size.x, initial_viewport_size.y, assets.textures["world_pos"].desc.num_channels(), assets.textures["world_pos"].desc.dtype())
-    pbo_world_normal = PixelBuffer(initial_viewport_size.x, initial_viewport_size.y, assets.textures["world_normal"].desc.num_channels(), assets.textures["world_normal"].desc.dtype())
-    pbo_cpu = PixelBuffer(initial_viewport_size.x, initial_viewport_size.y, assets.textures["cpu"].desc.num_channels(), assets.textures["cpu"].desc.dtype())
-    fb_gbuffer = Framebuffer(
-        color_textures=[assets.textures[name] for name in ["scene", "world_pos", "world_normal", "uv", "my_depth", "mesh_id", "mesh_id_colored"]],
-        depth_texture=Texture(renderer.get_texdesc_default_depth())  # TODO: replace with has_depth, and has_stencil bools default to False
-    )
-    fb_viewport = Framebuffer([assets.textures["viewport"]])
-    # TODO: option to fill out a texture while constructing
-    if True:
-        assets.textures["world_pos"].fill_with_zeros()
-        assets.textures["world_normal"].fill_with_zeros()
-        assets.textures["cpu"].fill_with_zeros()
-        pbo_world_pos.read_tex(assets.textures["world_pos"])
-        pbo_world_normal.read_tex(assets.textures["world_normal"])
-        pbo_cpu.read_tex(assets.textures["cpu"])
-    
+def make_scene(renderer: Renderer, assets: Assets) -> Scene:
     scene = Scene(renderer)
     scene.clear_color = glm.vec3(0.1, 0.15, 0.2)
     scene.ambient_light.color = glm.vec3(0, 0, 0)
@@ -200,138 +78,363 @@ def main():
         transform=utils.Transform(translation=glm.vec3(0.5, 0.5, -0.5), rotation_yxz=glm.vec3(0, 0, 0), scale=glm.vec3(.1, .1, .1)),
         shader=assets.shaders["default"]
     )
-    
-    im_windows = ui.ImWindows(assets, scene, viewport_size=initial_viewport_size)
+    return scene
 
-    #globals().update(locals())
-    cuda_world_pos = CudaPixelBuffer(pbo_world_pos)
-    cuda_world_normal = CudaPixelBuffer(pbo_world_normal)
-    cuda_cpu = CudaPixelBuffer(pbo_cpu)
-    
-    while renderer.is_running():
-        glfw.poll_events()  # https://github.com/ocornut/imgui/issues/3575 Shouldn't poll events after ImGui starts
-        # TODO: separate renderer and ui. Call ui.begin_frame() before renderer.begin_frame() so that renderer gets viewport_size at the same frame, not a frame late
-        renderer.imgui_impl.process_inputs()
-        imgui.new_frame()  # removes CONFIG_VIEWPORTS_ENABLE from imgui.get_io().config_flags
-        utils.imgui_dockspace_over_viewport()        
-        im_windows.draw()
-        renderer.begin_frame(viewport_size=im_windows.viewport_size, fbos=[fb_gbuffer, fb_viewport], cam=scene.cam)
-        assets.textures["cpu"].resize_if_needed(im_windows.viewport_size.x, im_windows.viewport_size.y)
-        cuda_world_pos.resize_if_needed(im_windows.viewport_size.x, im_windows.viewport_size.y)
-        cuda_world_normal.resize_if_needed(im_windows.viewport_size.x, im_windows.viewport_size.y)
-        cuda_cpu.resize_if_needed(im_windows.viewport_size.x, im_windows.viewport_size.y)
+
+class App:
+    """
+    Assets, render targets, scene and per-frame GPU resources, and the passes rendering them into the "viewport" texture.
+    Independent of the UI, so that bench.py can render frames without a visible window.
+    """
+    def __init__(self, renderer: Renderer, viewport_size: glm.ivec2, use_cuda: bool = True, gbuffer_layout: GBufferLayout = GBufferLayout.FULL_32F):
+        """
+        use_cuda: register PBOs with CUDA for Operation.TEX_TO_PBO_TO_DEV_ND_ARR
+        gbuffer_layout: formats of world_pos, world_normal and uv. The CPU post-process operations need FULL_32F, with other
+        layouts the "cpu" texture is not rendered
+        """
+        self.renderer = renderer
+        self.gbuffer_layout = gbuffer_layout
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)    
+
+        assets = self.assets = Assets(renderer)
+        load_start = time.perf_counter()
+        assets.load_many(
+            objs={
+                "monkey": "models/suzanne_smooth.obj",
+                "ship": "models/ship.obj",
+                "cube": "models/cube.obj",
+                "quad": "models/plane.obj",
+                "sphere": "models/sphere_ico_smooth.obj",
+            },
+            shaders={
+                "default": ("shaders/default.vert", "shaders/default.frag"),
+                "fullscreen": ("shaders/fullscreen_quad.vert", "shaders/fullscreen_quad.frag"),
+            },
+        )
+        print(f"Assets loaded in {(time.perf_counter() - load_start) * 1e3:.1f} ms. {assets.mesh_cache.summary()}")
+        assets.make_texture("scene", renderer.get_texdesc_3channel_8bit())
+        for name, desc in get_gbuffer_descs(renderer, gbuffer_layout).items():
+            assets.make_texture(name, desc)
+        assets.make_texture("mesh_id", renderer.get_texdesc_1channel_int32())
+        assets.make_texture("viewport", renderer.get_texdesc_3channel_8bit())
+        assets.make_texture("cpu", renderer.get_texdesc_3channel_8bit())
+        # persistently mapped, unless registered to CUDA
+        persistent = not use_cuda
+        # the post-process operations read the world_pos and world_normal of the FULL_32F layout
+        float3_desc = renderer.get_texdesc_3channel_flt32()
+        self.pbo_world_pos = PixelBuffer(viewport_size.x, viewport_size.y, float3_desc.num_channels(), float3_desc.dtype(), persistent)
+        self.pbo_world_normal = PixelBuffer(viewport_size.x, viewport_size.y, float3_desc.num_channels(), float3_desc.dtype(), persistent)
+        self.pbo_cpu = PixelBuffer(viewport_size.x, viewport_size.y, assets.textures["cpu"].desc.num_channels(), assets.textures["cpu"].desc.dtype(), persistent)
+        # readbacks mapped by the CPU a few frames later, so that mapping never waits for the GPU
+        self.readback_rings = {
+            name: PixelBufferRing(viewport_size.x, viewport_size.y, float3_desc.num_channels(), float3_desc.dtype())
+            for name in ["world_pos"]
+        }
+        # single light at the same place as before, the scratch buffers are reused across frames
+        self.numpy_shading = NumpyShadingPass(viewport_size.x, viewport_size.y, light_pos=[[0, 5, 0]])
+        # TODO: option to fill out a texture while constructing
+        if True:
+            assets.textures["cpu"].fill_with_zeros()
+            self.pbo_cpu.read_tex(assets.textures["cpu"])
+            if gbuffer_layout == GBufferLayout.FULL_32F:
+                assets.textures["world_pos"].fill_with_zeros()
+                assets.textures["world_normal"].fill_with_zeros()
+                self.pbo_world_pos.read_tex(assets.textures["world_pos"])
+                self.pbo_world_normal.read_tex(assets.textures["world_normal"])
+        
+        self.scene = make_scene(renderer, assets)
+        self.frustum_culler = FrustumCuller()
+        self.occlusion_culler = OcclusionCuller()
+        self.gpu_profiler = GpuProfiler()
+        self.cpu_profiler = CpuProfiler()
+        self.scene_ubo = SceneUniformBuffer(gbuffer_layout)
+        self.instance_buffer = InstanceBuffer()
+        self.draw_list = IndirectDrawList()
+        # operation, viewport size and the scaled render size of the frame being rendered, for the passes
+        self._operation: Operation = None
+        self._viewport_size = viewport_size
+        self._render_size = viewport_size
+        # targets are allocated in 64 px buckets, resizing the viewport reallocates them and the PBOs only at bucket changes
+        self.render_target_pool = RenderTargetPool()
+        # off by default, the G-buffer is rendered at the full viewport size
+        self.dynamic_resolution = DynamicResolution()
+        self._num_gpu_frames_seen = 0
+        self.render_graph = self._build_render_graph()
+        self.gbuffer_recorder = GBufferRecorder(self.render_graph.textures)
+        self.gbuffer_recorder.attachments = [name for name in self.gbuffer_recorder.attachments if name in self.render_graph.get_texture_names()]
+        self.frame_ix = -1
+
+        self.cuda_world_pos, self.cuda_world_normal, self.cuda_cpu = None, None, None
+        if use_cuda:
+            # CUDA bindings are only needed for the CUDA operation, ex: bench.py runs without them
+            from cuda_interop import CudaPixelBuffer
+            self.cuda_world_pos = CudaPixelBuffer(self.pbo_world_pos)
+            self.cuda_world_normal = CudaPixelBuffer(self.pbo_world_normal)
+            self.cuda_cpu = CudaPixelBuffer(self.pbo_cpu)
+
+    def deinit(self):
+        self.gbuffer_recorder.stop()
+        if self.cuda_cpu is not None:
+            self.cuda_world_pos.deinit()    
+            self.cuda_world_normal.deinit()    
+            self.cuda_cpu.deinit()    
+
+    def begin_frame(self):
+        self.frame_ix += 1
+        Shader.new_frame()
+        self.gpu_profiler.begin_frame()
+        self.cpu_profiler.begin_frame()
+
+    def end_frame(self):
+        with self.cpu_profiler.scope("end frame"):
+            self.renderer.end_frame(self.gpu_profiler)
+        self.cpu_profiler.end_frame()
+
+    def render(self, viewport_size: glm.ivec2, operation: Operation):
+        renderer, assets, scene = self.renderer, self.assets, self.scene
+        cpu_profiler, gpu_profiler = self.cpu_profiler, self.gpu_profiler
+        pbo_world_pos, pbo_world_normal, pbo_cpu = self.pbo_world_pos, self.pbo_world_normal, self.pbo_cpu
+        cuda_world_pos, cuda_world_normal, cuda_cpu = self.cuda_world_pos, self.cuda_world_normal, self.cuda_cpu
+        render_graph = self.render_graph
+        assert operation != Operation.TEX_TO_PBO_TO_DEV_ND_ARR or cuda_cpu is not None, "CUDA operation needs App(use_cuda=True)"
+
+        with cpu_profiler.scope("begin frame"):
+            # glViewport of viewport_size, i.e. the bottom-left part of the pool's targets
+            renderer.begin_frame(viewport_size=viewport_size, fbos=[], cam=scene.cam)
+            allocated_size = self.render_target_pool.update(viewport_size)
+            # the G-buffer and post-process render at the scaled size within the same targets, the fullscreen pass upscales
+            # to the viewport. The scale is kept while recording, a dataset has one resolution
+            if not self.gbuffer_recorder.is_recording:
+                self.dynamic_resolution.update(self._get_new_gpu_frame_ms())
+            render_size = self.dynamic_resolution.get_render_size(viewport_size)
+            # the CPU operations process whole textures, the "cpu" texture has the same sub-rectangle as the G-buffer
+            assets.textures["cpu"].resize_if_needed(allocated_size.x, allocated_size.y)
+            for ring in self.readback_rings.values():
+                ring.resize_if_needed(allocated_size.x, allocated_size.y)
+            if cuda_cpu is not None:
+                cuda_world_pos.resize_if_needed(allocated_size.x, allocated_size.y)
+                cuda_world_normal.resize_if_needed(allocated_size.x, allocated_size.y)
+                cuda_cpu.resize_if_needed(allocated_size.x, allocated_size.y)
+            else:
+                pbo_world_pos.resize_if_needed(allocated_size.x, allocated_size.y)
+                pbo_world_normal.resize_if_needed(allocated_size.x, allocated_size.y)
+                pbo_cpu.resize_if_needed(allocated_size.x, allocated_size.y)
+
+        # camera and lights, used by both the G-buffer and the fullscreen pass
+        with cpu_profiler.scope("scene upload"):
+            self.scene_ubo.gbuffer_uv_scale = self.render_target_pool.get_uv_scale(render_size)
+            self.scene_ubo.upload(scene)
 
         glClearColor(0.1, 0.2, 0.3, 1)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)        
           
-        fb_gbuffer.bind()
-        # TODO: figure out how to clear scene tex differently then the rest of the color attachments        
-        glClearColor(0, 0, 0, 1.0)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        for _, obj in scene.objects.items():
-            # TODO maybe: a scene.render_object() method (might take uniforms)
-            obj.shader.bind()
-            glBindVertexArray(obj.mesh.vao)
-            obj.shader.set_uniform_mat4("worldFromObject", obj.transform.get_transform_mat())
-            obj.shader.set_uniform_mat4("viewFromWorld", scene.cam.get_view_from_world())
-            obj.shader.set_uniform_mat4("projectionFromView", scene.cam.get_projection_from_view())
-            obj.shader.set_uniform_vec3("eyePos", scene.cam.position)
-            obj.shader.set_uniform_int1("meshId", obj.mesh.vao)
-            scene.ambient_light.upload_to_shader(obj.shader)
-            scene.directional_light.upload_to_shader(obj.shader)
-            scene.hemispherical_light.upload_to_shader(obj.shader)
-            for pl in scene.point_lights:
-                pl.upload_to_shader(obj.shader)
-            glDrawArrays(GL_TRIANGLES, 0, obj.mesh.vertex_count)
-            glBindVertexArray(0)
-            obj.shader.unbind()
-        
+        # the passes resize and bind their framebuffers
+        self._operation = operation
+        self._viewport_size = viewport_size
+        self._render_size = render_size
+        render_graph.request("viewport")
+        if self.gbuffer_recorder.is_recording:
+            for name in self.gbuffer_recorder.attachments:
+                render_graph.request(name)
+        render_graph.execute(viewport_size, render_size)
+
+        if self.gbuffer_recorder.is_recording:
+            with cpu_profiler.scope("G-buffer record"), gpu_profiler.scope("G-buffer record"):
+                self.gbuffer_recorder.record(self.frame_ix, scene.cam, render_size)
+
+    def _build_render_graph(self) -> RenderGraph:
+        renderer, assets = self.renderer, self.assets
+        render_graph = RenderGraph(self.render_target_pool)
+        has_world_pos = self.gbuffer_layout != GBufferLayout.DEPTH_ONLY_POS
+        for name in ["scene", "world_pos", "world_normal", "uv", "mesh_id", "cpu", "viewport"]:
+            if name in assets.textures:
+                render_graph.import_texture(name, assets.textures[name])
+        # only the Texture Viewer and the recorder look at these, allocated while requested
+        render_graph.create_texture("my_depth", renderer.get_texdesc_1channel_flt32())
+        render_graph.create_texture("mesh_id_colored", renderer.get_texdesc_3channel_8bit())
+        render_graph.create_texture("depth", renderer.get_texdesc_default_depth())
+        render_graph.add_pass(
+            "G-buffer", self._gbuffer_pass,
+            # in the order of default.frag's output locations
+            color_outputs=["scene", "world_pos" if has_world_pos else None, "world_normal", "uv", "my_depth", "mesh_id", "mesh_id_colored"],
+            depth_output="depth",
+        )
+        # read back this frame's depth for the next frame's occlusion culling
+        render_graph.add_pass("depth readback", self._depth_readback_pass, reads=["depth"], side_effect=True)
+        # runs only while someone looks at the "cpu" texture
+        if self.gbuffer_layout == GBufferLayout.FULL_32F:
+            render_graph.add_pass("post-process", self._post_process_pass, reads=["world_pos", "world_normal"], writes=["cpu"])
+        render_graph.add_pass(
+            "fullscreen lighting", self._fullscreen_lighting_pass,
+            # without world_pos, positions are reconstructed from depth
+            reads=["scene", "world_pos" if has_world_pos else "depth", "world_normal", "uv", "mesh_id"],
+            color_outputs=["viewport"],
+            at_viewport_size=True,
+        )
+        return render_graph
+
+    def _get_new_gpu_frame_ms(self) -> float:
+        """GPU time of the newest frame whose timings arrived since the last call, None if none did"""
+        gpu_profiler = self.gpu_profiler
+        if gpu_profiler.num_collected_frames == self._num_gpu_frames_seen or FRAME_TOTAL not in gpu_profiler.timings:
+            return None
+        self._num_gpu_frames_seen = gpu_profiler.num_collected_frames
+        return gpu_profiler.timings[FRAME_TOTAL][-1]
+
+    def _gbuffer_pass(self):
+        assets, scene = self.assets, self.scene
+        cpu_profiler, gpu_profiler = self.cpu_profiler, self.gpu_profiler
+        with cpu_profiler.scope("G-buffer"), gpu_profiler.scope("G-buffer"):
+            # TODO: figure out how to clear scene tex differently then the rest of the color attachments        
+            glClearColor(0, 0, 0, 1.0)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            # objects sharing mesh and shader are instances of one draw command, all draw commands of a shader are one multi-draw
+            with cpu_profiler.scope("culling"):
+                visible_objects = self.frustum_culler.cull(list(scene.objects.values()), scene.cam)
+                visible_objects = self.occlusion_culler.cull(visible_objects)
+            with cpu_profiler.scope("batching"):
+                batches, instanced_objects = make_batches(visible_objects)
+                self.instance_buffer.upload(instanced_objects)
+                self.draw_list.build(batches)
+            self.draw_list.submit(assets.geometry_arena)
+
+    def _depth_readback_pass(self):
+        cpu_profiler, gpu_profiler = self.cpu_profiler, self.gpu_profiler
+        with cpu_profiler.scope("depth readback"), gpu_profiler.scope("depth readback"):
+            self.occlusion_culler.capture(self.render_graph.textures["depth"], self.scene.cam, self._render_size)
+
+    def _post_process_pass(self):
+        assets, operation, allocated_size = self.assets, self._operation, self.render_target_pool.allocated_size
+        cpu_profiler, gpu_profiler = self.cpu_profiler, self.gpu_profiler
+        pbo_world_pos, pbo_world_normal, pbo_cpu = self.pbo_world_pos, self.pbo_world_normal, self.pbo_cpu
+        cuda_world_pos, cuda_world_normal, cuda_cpu = self.cuda_world_pos, self.cuda_world_normal, self.cuda_cpu
         if operation == Operation.TEX_TO_NUMPY:
-            assert(assets.textures["world_pos"].desc.width == assets.textures["world_normal"].desc.width)
-            assert(assets.textures["world_pos"].desc.width == assets.textures["cpu"].desc.width)
-            glReadBuffer(GL_COLOR_ATTACHMENT0 + 1)
-            w, h = assets.textures["cpu"].desc.width, assets.textures["cpu"].desc.height
-            worldPos = glReadPixels(0, 0, w, h, GL_RGB, GL_FLOAT).reshape(-1, 3)
-            glReadBuffer(GL_COLOR_ATTACHMENT0 + 2)
-            worldNorm = glReadPixels(0, 0, w, h, GL_RGB, GL_FLOAT).reshape(-1, 3)
-            lightPos = np.array([[0, 5, 0]])
-            surfToLight = lightPos - worldPos
-            lightDir = surfToLight / np.linalg.norm(surfToLight, ord=2, axis=1).reshape(-1, 1)
-            dot = np.einsum('ij,ij->i', worldNorm, lightDir).reshape(-1, 1)
-            diffuse = np.maximum(0, dot) * 255
-            rgb = np.repeat(diffuse, repeats=3, axis=1)
-            pixels = np.asarray(rgb, dtype=np.uint8).flatten()
-            assets.textures["cpu"].bind()
-            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB8, w, h, 0, GL_RGB, GL_UNSIGNED_BYTE, pixels)
-            assets.textures["cpu"].unbind()
+            with cpu_profiler.scope("post-process"), gpu_profiler.scope("post-process"):
+                numpy_shading = self.numpy_shading
+                numpy_shading.resize_if_needed(allocated_size.x, allocated_size.y)
+                numpy_shading.read(assets.textures["world_pos"], assets.textures["world_normal"])
+                numpy_shading.shade()
+                numpy_shading.write(assets.textures["cpu"])
 
         elif operation == Operation.TEX_TO_PBO_TO_MAP:
-            pbo_world_pos.read_tex(assets.textures["world_pos"])
-            pbo_cpu.read_tex(assets.textures["cpu"])
-            arr_world_pos = pbo_world_pos.map_as_np_array()
-            arr_cpu = pbo_cpu.map_as_np_array()
-            # arr_cpu[:, :, 0] = 255
-            arr_cpu[:, :, :] = np.asarray(arr_world_pos * 255.99, dtype=np.uint8)
-            pbo_world_pos.unmap_as_np_array()
-            pbo_cpu.unmap_as_np_array()
-            pbo_cpu.write_tex(assets.textures["cpu"])
-
-        # TODO: Measure frame duration
+            ring_world_pos = self.readback_rings["world_pos"]
+            with cpu_profiler.scope("PBO readback"), gpu_profiler.scope("PBO readback"):
+                ring_world_pos.read_tex(assets.textures["world_pos"])
+            with cpu_profiler.scope("post-process"), gpu_profiler.scope("post-process"):
+                # latest finished readback, None while the GPU is still behind. Then the "cpu" texture keeps its previous content
+                arr_world_pos = ring_world_pos.map_latest_ready()
+                if arr_world_pos is not None:
+                    arr_cpu = pbo_cpu.map_as_np_array()
+                    # arr_cpu[:, :, 0] = 255
+                    arr_cpu[:, :, :] = np.asarray(arr_world_pos * 255.99, dtype=np.uint8)
+                    ring_world_pos.unmap()
+                    pbo_cpu.unmap_as_np_array()
+            if arr_world_pos is not None:
+                with cpu_profiler.scope("PBO upload"), gpu_profiler.scope("PBO upload"):
+                    pbo_cpu.write_tex(assets.textures["cpu"])
+
         # TODO: Implement point light via numba+cuda (via copying to pixel buffer)
         # TODO: Make an enum: 1) numpy, 2) numba+cuda.
         elif operation == Operation.TEX_TO_PBO_TO_DEV_ND_ARR:
-            pbo_cpu.read_tex(assets.textures["cpu"])
-            pbo_world_pos.read_tex(assets.textures["world_pos"])
-            pbo_world_normal.read_tex(assets.textures["world_normal"])
-            dev_arr_world_pos = cuda_world_pos.map()
-            dev_arr_world_normal = cuda_world_normal.map()
-            dev_arr_cpu = cuda_cpu.map()
-
-            threadsperblock = (16, 16)
-            blockspergrid_x = math.ceil(dev_arr_world_pos.shape[0] / threadsperblock[0])
-            blockspergrid_y = math.ceil(dev_arr_world_pos.shape[1] / threadsperblock[1])
-            blockspergrid = (blockspergrid_x, blockspergrid_y)
-            light_pos = np.array([[0, 5, 0], [0, 0, 5]], dtype=np.float32)
-            dev_light_pos = nbcuda.to_device(light_pos)
-            process_texture[blockspergrid, threadsperblock](dev_arr_world_pos, dev_arr_world_normal, dev_arr_cpu, dev_light_pos)     
-
-            cuda_world_pos.unmap()
-            cuda_world_normal.unmap()
-            cuda_cpu.unmap()
-            pbo_cpu.write_tex(assets.textures["cpu"])
-        fb_gbuffer.unbind()
-
-        fb_viewport.bind()
-        glClearColor(scene.clear_color.r, scene.clear_color.g, scene.clear_color.b, 1)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glActiveTexture(GL_TEXTURE0 + 0)
-        assets.textures["scene"].bind()
-        glActiveTexture(GL_TEXTURE0 + 1)
-        assets.textures["world_pos"].bind()
-        glActiveTexture(GL_TEXTURE0 + 2)
-        assets.textures["world_normal"].bind()
-        glActiveTexture(GL_TEXTURE0 + 3)
-        assets.textures["uv"].bind()
-        glActiveTexture(GL_TEXTURE0 + 4)
-        assets.textures["mesh_id"].bind()        
-        fullscreen_shader = assets.shaders["fullscreen"]
-        fullscreen_shader.bind()
-        fullscreen_shader.set_uniform_vec3("eyePos", scene.cam.position)
-        scene.ambient_light.upload_to_shader(fullscreen_shader)
-        scene.directional_light.upload_to_shader(fullscreen_shader)
-        scene.hemispherical_light.upload_to_shader(fullscreen_shader)
-        for pl in scene.point_lights:
-            pl.upload_to_shader(fullscreen_shader)        
-        glBindVertexArray(renderer.empty_vao)
-        glDrawArrays(GL_TRIANGLES, 0, 3)
-        fullscreen_shader.unbind()
-        fb_viewport.unbind()
+            from cuda_interop import nbcuda, process_texture
+            with cpu_profiler.scope("PBO readback"), gpu_profiler.scope("PBO readback"):
+                pbo_cpu.read_tex(assets.textures["cpu"])
+                pbo_world_pos.read_tex(assets.textures["world_pos"])
+                pbo_world_normal.read_tex(assets.textures["world_normal"])
+            with cpu_profiler.scope("post-process"), gpu_profiler.scope("post-process"):
+                dev_arr_world_pos = cuda_world_pos.map()
+                dev_arr_world_normal = cuda_world_normal.map()
+                dev_arr_cpu = cuda_cpu.map()
+
+                threadsperblock = (16, 16)
+                blockspergrid_x = math.ceil(dev_arr_world_pos.shape[0] / threadsperblock[0])
+                blockspergrid_y = math.ceil(dev_arr_world_pos.shape[1] / threadsperblock[1])
+                blockspergrid = (blockspergrid_x, blockspergrid_y)
+                light_pos = np.array([[0, 5, 0], [0, 0, 5]], dtype=np.float32)
+                dev_light_pos = nbcuda.to_device(light_pos)
+                process_texture[blockspergrid, threadsperblock](dev_arr_world_pos, dev_arr_world_normal, dev_arr_cpu, dev_light_pos)     
+
+                cuda_world_pos.unmap()
+                cuda_world_normal.unmap()
+                cuda_cpu.unmap()
+            with cpu_profiler.scope("PBO upload"), gpu_profiler.scope("PBO upload"):
+                pbo_cpu.write_tex(assets.textures["cpu"])
+
+        # same point lights as process_texture, on all CPU cores. Thread count via cpu_shading.set_num_threads()
+        elif operation == Operation.CPU_NUMBA:
+            with cpu_profiler.scope("PBO readback"), gpu_profiler.scope("PBO readback"):
+                pbo_world_pos.read_tex(assets.textures["world_pos"])
+                pbo_world_normal.read_tex(assets.textures["world_normal"])
+            with cpu_profiler.scope("post-process"), gpu_profiler.scope("post-process"):
+                arr_world_pos = pbo_world_pos.map_as_np_array()
+                arr_world_normal = pbo_world_normal.map_as_np_array()
+                arr_cpu = pbo_cpu.map_as_np_array()
+                light_pos = np.array([[0, 5, 0], [0, 0, 5]], dtype=np.float32)
+                shade_diffuse_numba(arr_world_pos, arr_world_normal, arr_cpu, light_pos)
+                pbo_world_pos.unmap_as_np_array()
+                pbo_world_normal.unmap_as_np_array()
+                pbo_cpu.unmap_as_np_array()
+            with cpu_profiler.scope("PBO upload"), gpu_profiler.scope("PBO upload"):
+                pbo_cpu.write_tex(assets.textures["cpu"])
+
+    def _fullscreen_lighting_pass(self):
+        renderer, assets, scene = self.renderer, self.assets, self.scene
+        cpu_profiler, gpu_profiler = self.cpu_profiler, self.gpu_profiler
+        textures = self.render_graph.textures
+        with cpu_profiler.scope("fullscreen lighting"), gpu_profiler.scope("fullscreen lighting"):
+            glClearColor(scene.clear_color.r, scene.clear_color.g, scene.clear_color.b, 1)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            glActiveTexture(GL_TEXTURE0 + 0)
+            assets.textures["scene"].bind()
+            glActiveTexture(GL_TEXTURE0 + 1)
+            if "world_pos" in textures:
+                textures["world_pos"].bind()
+            else:
+                glActiveTexture(GL_TEXTURE0 + 5)
+                textures["depth"].bind()
+            glActiveTexture(GL_TEXTURE0 + 2)
+            assets.textures["world_normal"].bind()
+            glActiveTexture(GL_TEXTURE0 + 3)
+            assets.textures["uv"].bind()
+            glActiveTexture(GL_TEXTURE0 + 4)
+            assets.textures["mesh_id"].bind()        
+            fullscreen_shader = assets.shaders["fullscreen"]
+            fullscreen_shader.bind()
+            glBindVertexArray(renderer.empty_vao)
+            glDrawArrays(GL_TRIANGLES, 0, 3)
+            fullscreen_shader.unbind()
+
+def main():
+    initial_viewport_size = utils.read_window_size_from_imgui_ini("Viewport")
+    renderer.init(win_size=glm.ivec2(1024, 768), viewport_size=initial_viewport_size)
+    app = App(renderer, initial_viewport_size)
+    cpu_profiler = app.cpu_profiler
+    texture_saver = TextureSaver()
+    im_windows = ui.ImWindows(app.assets, app.scene, viewport_size=initial_viewport_size, frustum_culler=app.frustum_culler, occlusion_culler=app.occlusion_culler,
+                              gpu_profiler=app.gpu_profiler, cpu_profiler=cpu_profiler, readback_rings=app.readback_rings, texture_saver=texture_saver,
+                              gbuffer_recorder=app.gbuffer_recorder, render_graph=app.render_graph, dynamic_resolution=app.dynamic_resolution)
     
-        renderer.end_frame()
+    while renderer.is_running():
+        app.begin_frame()
+        with cpu_profiler.scope("poll events"):
+            glfw.poll_events()  # https://github.com/ocornut/imgui/issues/3575 Shouldn't poll events after ImGui starts
+        # TODO: separate renderer and ui. Call ui.begin_frame() before renderer.begin_frame() so that renderer gets viewport_size at the same frame, not a frame late
+        with cpu_profiler.scope("ui"):
+            renderer.imgui_impl.process_inputs()
+            imgui.new_frame()  # removes CONFIG_VIEWPORTS_ENABLE from imgui.get_io().config_flags
+            utils.imgui_dockspace_over_viewport()        
+            im_windows.draw()
+        # same as the Profiler window's buttons
+        if imgui.is_key_pressed(glfw.KEY_F9):
+            cpu_profiler.capture_trace(TRACE_NUM_FRAMES, f"trace_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+        if imgui.is_key_pressed(glfw.KEY_F10):
+            cpu_profiler.capture_cprofile(CPROFILE_NUM_FRAMES, f"cprofile_{datetime.now().strftime('%Y%m%dT%H%M%S')}.prof")
+        app.render(im_windows.viewport_size, operation)
+        app.end_frame()
 
-    cuda_world_pos.deinit()    
-    cuda_world_normal.deinit()    
-    cuda_cpu.deinit()    
+    texture_saver.deinit()
+    app.deinit()
     renderer.deinit()
 
 if __name__ == "__main__":
@@ -339,4 +442,4 @@ if __name__ == "__main__":
         main()
     except Exception:
         traceback.print_exc()
-        renderer.deinit()
\ No newline at end of file
+        renderer.deinit()
@@ -1,36 +1,31 @@
+from geometry_arena import GeometryArena, VERTEX_SIZE
+
 import numpy as np
-from OpenGL.GL import GL_STATIC_DRAW, glBindBuffer, glBufferData, glGenBuffers
-from OpenGL.GL import glBindVertexArray, GL_ARRAY_BUFFER, glGenVertexArrays
-from OpenGL.GL import glEnableVertexAttribArray, glVertexAttribPointer
-from OpenGL.GL import GL_FLOAT, GL_FALSE
 
-import ctypes
 
 class Mesh:
-    def __init__(self, np_vertices):
-        self.vao = glGenVertexArrays(1)
-
-        glBindVertexArray(self.vao)
-        vbo = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, vbo)
-        glBufferData(GL_ARRAY_BUFFER, np_vertices, GL_STATIC_DRAW)
-        # glBufferData(GL_ARRAY_BUFFER, np_vertices.size * np_vertices.itemsize, np_vertices, GL_STATIC_DRAW)
-        offset = 0
-        # pos 3, tex 2, nrm 3, col 4
-        sizes = [3, 2, 3, 4]
-        vertex_size = sum(sizes)
-        for ix, size in enumerate(sizes):
-            stride = vertex_size * np.dtype('float32').itemsize
-            offset_ptr = ctypes.c_void_p(offset * np.dtype('float32').itemsize)
-            glVertexAttribPointer(ix, size, GL_FLOAT, GL_FALSE, stride, offset_ptr)
-            glEnableVertexAttribArray(ix)
-            # print(f"vertex attribute[{ix}]: {attrib}, size: {size}, offset: {offset}, stride: {stride}")
-            offset += size
-        glBindBuffer(GL_ARRAY_BUFFER, 0)
-        glBindVertexArray(0)
+    """A range of vertices and indices in a GeometryArena. Drawn via IndirectDrawList"""
+    num_meshes = 0
 
-        assert(len(np_vertices) / vertex_size % 3 == 0)
-        self.vertex_count = len(np_vertices) // vertex_size
+    def __init__(self, np_vertices, np_indices, arena: GeometryArena):
+        """np_indices: None for non-indexed triangle lists"""
+        if np_indices is None:
+            assert(len(np_vertices) / VERTEX_SIZE % 3 == 0)
+        else:
+            assert(len(np_indices) % 3 == 0)
+            assert(np_indices.dtype in (np.uint16, np.uint32))
+        self.arena = arena
+        # object space bounding volumes for culling. Indexed meshes reference all their vertices, so indices are not needed
+        positions = np.asarray(np_vertices, dtype=np.float32).reshape(-1, VERTEX_SIZE)[:, :3]
+        self.aabb_min = positions.min(axis=0)
+        self.aabb_max = positions.max(axis=0)
+        self.sphere_center = (self.aabb_min + self.aabb_max) * 0.5
+        self.sphere_radius = float(np.linalg.norm(positions - self.sphere_center, axis=1).max())
+        self.first_index, self.index_count, self.base_vertex, self.vertex_count = arena.allocate(np_vertices, np_indices)
+        # 0 is reserved for "no mesh" in the G-buffer's mesh_id texture
+        Mesh.num_meshes += 1
+        self.mesh_id = Mesh.num_meshes
 
-def pointer_offset(n=0):
-    return ctypes.c_void_p(4 * n)
+    @property
+    def vao(self) -> int:
+        return self.arena.vao
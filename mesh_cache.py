@@ -0,0 +1,109 @@
+"""
+On-disk cache of processed mesh arrays (vertices, indices etc.) so that OBJ files are not re-parsed on every start.
+
+An entry per source file is stored under cache_dir as one .npy file per array and a meta.json. An entry is valid
+when the source file's size and mtime match, or, if only the mtime changed, when the content hash still matches.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+# Increment when mesh processing changes the produced arrays, so that stale entries are ignored
+MESH_CACHE_VERSION = 3
+
+
+def hash_file(filename: str) -> str:
+    with open(filename, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+class MeshCache:
+    def __init__(self, cache_dir: str = ".cache/meshes", enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        # seconds spent on loading cached entries and on processing + storing the missing ones
+        self.hit_duration = 0.0
+        self.miss_duration = 0.0
+
+    def _entry_dir(self, filename: str) -> str:
+        key = f"{os.path.abspath(filename)}|{MESH_CACHE_VERSION}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, filename: str) -> dict[str, np.ndarray] | None:
+        """Returns the memory-mapped arrays of a valid entry, None otherwise."""
+        entry_dir = self._entry_dir(filename)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as file:
+            meta = json.load(file)
+        stat = os.stat(filename)
+        if meta["size"] != stat.st_size:
+            return None
+        if meta["mtime_ns"] != stat.st_mtime_ns:
+            # touched but maybe not modified (ex: git checkout)
+            if meta["sha1"] != hash_file(filename):
+                return None
+            meta["mtime_ns"] = stat.st_mtime_ns
+            self._write_meta(meta_path, meta)
+        return {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r") for name in meta["arrays"]}
+
+    def put(self, filename: str, arrays: dict[str, np.ndarray]):
+        entry_dir = self._entry_dir(filename)
+        os.makedirs(entry_dir, exist_ok=True)
+        stat = os.stat(filename)
+        for name, arr in arrays.items():
+            np.save(os.path.join(entry_dir, f"{name}.npy"), arr)
+        meta = {
+            "source": os.path.abspath(filename),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": hash_file(filename),
+            "arrays": list(arrays.keys()),
+        }
+        # meta is written last, an entry without it is never read
+        self._write_meta(os.path.join(entry_dir, "meta.json"), meta)
+
+    def _write_meta(self, meta_path: str, meta: dict):
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(meta, file, indent=2)
+        os.replace(tmp_path, meta_path)
+
+    def lookup(self, filename: str) -> dict[str, np.ndarray] | None:
+        """get() that counts hits"""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        arrays = self.get(filename)
+        if arrays is not None:
+            self.hits += 1
+            self.hit_duration += time.perf_counter() - start
+        return arrays
+
+    def store(self, filename: str, arrays: dict[str, np.ndarray], process_duration: float):
+        """put() that counts misses. process_duration: seconds spent producing the arrays"""
+        start = time.perf_counter()
+        if self.enabled:
+            self.put(filename, arrays)
+        self.misses += 1
+        self.miss_duration += process_duration + time.perf_counter() - start
+
+    def get_or_process(self, filename: str, process) -> dict[str, np.ndarray]:
+        """process: function that takes the filename and returns the arrays to cache"""
+        arrays = self.lookup(filename)
+        if arrays is not None:
+            return arrays
+        start = time.perf_counter()
+        arrays = process(filename)
+        self.store(filename, arrays, time.perf_counter() - start)
+        return arrays
+
+    def summary(self) -> str:
+        return (f"Mesh cache: {self.hits} hits in {self.hit_duration * 1e3:.1f} ms, "
+                f"{self.misses} misses in {self.miss_duration * 1e3:.1f} ms")
@@ -0,0 +1,128 @@
+"""
+CPU-side mesh processing that doesn't need an OpenGL context: vertex deduplication and
+triangle/vertex reordering for post-transform vertex cache and vertex fetch locality.
+
+REF:
+* Tipsify: Sander, Nehab, Barczak. "Fast Triangle Reordering for Vertex Locality and Reduced Overdraw", 2007
+* https://tomforsyth1000.github.io/papers/fast_vert_cache_opt.html
+"""
+import numpy as np
+
+# Roughly the size of post-transform caches on current hardware. Used both for optimization and measurement.
+VERTEX_CACHE_SIZE = 16
+
+
+def deduplicate_vertices(vertices: np.ndarray, vertex_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    vertices: flat float32 array of de-indexed vertices, vertex_size floats each
+    Returns flat unique vertices (in order of first occurrence) and an index per input vertex into them.
+    Vertices are compared bitwise.
+    """
+    rows = np.ascontiguousarray(vertices, dtype=np.float32).reshape(-1, vertex_size)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * vertex_size))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    # np.unique sorts by bytes, renumber unique vertices by their first occurrence instead
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+    indices = remap[inverse.ravel()]
+    return rows[first[order]].reshape(-1), indices
+
+
+def tipsify(indices: np.ndarray, num_vertices: int, cache_size: int = VERTEX_CACHE_SIZE) -> np.ndarray:
+    """Reorders triangles of an index buffer for post-transform vertex cache locality. Linear in number of triangles."""
+    tris = indices.reshape(-1, 3).tolist()
+    num_tris = len(tris)
+    # vertex -> adjacent triangles, as a CSR-like offsets + triangle id array
+    counts = np.bincount(indices, minlength=num_vertices)
+    offsets = np.concatenate(([0], np.cumsum(counts))).tolist()
+    adjacency = (np.argsort(indices, kind="stable") // 3).tolist()
+
+    live = counts.tolist()
+    cache_time = [0] * num_vertices
+    emitted = [False] * num_tris
+    dead_end = []
+    out = []
+    time_stamp = cache_size + 1
+    cursor = 0
+    fanning = 0 if num_tris else -1
+    while fanning >= 0:
+        candidates = []
+        for t in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            for v in tris[t]:
+                out.append(v)
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time_stamp - cache_time[v] > cache_size:
+                    cache_time[v] = time_stamp
+                    time_stamp += 1
+            emitted[t] = True
+
+        # next fanning vertex: the candidate that'll still be in the cache after its remaining triangles are emitted
+        fanning, best_priority = -1, -1
+        for v in candidates:
+            if live[v] <= 0:
+                continue
+            priority = 0
+            if time_stamp - cache_time[v] + 2 * live[v] <= cache_size:
+                priority = time_stamp - cache_time[v]
+            if priority > best_priority:
+                fanning, best_priority = v, priority
+        if fanning != -1:
+            continue
+        # dead-end: recently emitted vertices first, then any vertex with triangles left
+        while dead_end:
+            v = dead_end.pop()
+            if live[v] > 0:
+                fanning = v
+                break
+        while fanning == -1 and cursor < num_vertices:
+            if live[cursor] > 0:
+                fanning = cursor
+                break
+            cursor += 1
+    return np.array(out, dtype=indices.dtype)
+
+
+def reorder_vertices_for_fetch(vertices: np.ndarray, indices: np.ndarray, vertex_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """Renumbers vertices in the order the index buffer first uses them. Unreferenced vertices are dropped."""
+    used, first_use = np.unique(indices, return_index=True)
+    order = used[np.argsort(first_use)]
+    remap = np.empty(vertices.size // vertex_size, dtype=indices.dtype)
+    remap[order] = np.arange(len(order), dtype=indices.dtype)
+    rows = vertices.reshape(-1, vertex_size)
+    return rows[order].reshape(-1), remap[indices]
+
+
+def compute_acmr(indices: np.ndarray, cache_size: int = VERTEX_CACHE_SIZE) -> float:
+    """Average cache miss ratio (transformed vertices per triangle) of a FIFO post-transform cache. 3.0 is worst, ~0.5 is ideal."""
+    if len(indices) == 0:
+        return 0.0
+    cache_time = {}
+    time_stamp = cache_size + 1
+    misses = 0
+    for v in indices.tolist():
+        if time_stamp - cache_time.get(v, 0) > cache_size:
+            cache_time[v] = time_stamp
+            time_stamp += 1
+            misses += 1
+    return misses / (len(indices) / 3)
+
+
+def build_indexed_mesh(vertices: np.ndarray, vertex_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    De-indexed triangle list -> (unique vertices, cache optimized triangle indices). Indices are uint16 when they fit, which
+    halves them in the MeshCache. The GeometryArena widens them to its uint32 index buffer at upload.
+    """
+    unique_vertices, indices = deduplicate_vertices(vertices, vertex_size)
+    num_vertices = unique_vertices.size // vertex_size
+    index_dtype = np.uint16 if num_vertices <= np.iinfo(np.uint16).max else np.uint32
+    indices = indices.astype(index_dtype)
+    optimized = tipsify(indices, num_vertices)
+    # exported meshes are sometimes already in a cache friendly order, don't make them worse
+    if compute_acmr(optimized) < compute_acmr(indices):
+        indices = optimized
+    return reorder_vertices_for_fetch(unique_vertices, indices, vertex_size)
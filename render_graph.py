@@ -0,0 +1,217 @@
+from dataclasses import dataclass, field
+from typing import Callable
+
+from framebuffer import Framebuffer
+from render_target_pool import RenderTargetPool, format_key
+from texture import Texture, TextureDescription
+
+import glm
+from OpenGL.GL import glViewport
+
+
+@dataclass
+class RenderPass:
+    """
+    color_outputs: textures rendered into, in the order of the fragment shader's output locations. None for an unused location
+    depth_output: depth texture of the pass' framebuffer
+    reads: textures sampled or read back, writes: textures written without a framebuffer, ex: PBO uploads
+    side_effect: kept even if nothing in the graph reads its outputs, ex: readbacks for the CPU
+    at_viewport_size: renders at the viewport size instead of the render size, ex: upscaling to the viewport
+    """
+    name: str
+    execute: Callable[[], None]
+    color_outputs: list[str] = field(default_factory=list)
+    depth_output: str = None
+    reads: list[str] = field(default_factory=list)
+    writes: list[str] = field(default_factory=list)
+    side_effect: bool = False
+    at_viewport_size: bool = False
+    # set by compile, None for dropped color outputs
+    framebuffer: Framebuffer = None
+
+    def get_outputs(self) -> list[str]:
+        return [name for name in self.color_outputs if name is not None] + ([self.depth_output] if self.depth_output else []) + self.writes
+
+
+class RenderGraph:
+    """
+    Passes declare the textures they read and write, the graph decides what runs. Each frame, outside consumers (UI, readbacks
+    after the graph) request() the textures they need. compile() then
+    - orders the passes so that writers of a texture run before its readers, stable w.r.t. the order they were added
+    - culls passes whose outputs no kept pass reads and nobody requested, unless they have side effects
+    - drops color attachments nobody consumes, their draw buffers become GL_NONE
+    - allocates transient textures (create_texture) from the RenderTargetPool, where textures of the same format whose
+      lifetimes, from first to last use by the kept passes, don't overlap share one GL texture. Requested textures live
+      until the frame ends. Textures of the previous compile go back to the pool, which deletes them if they stay unused.
+    - builds a Framebuffer per rendering pass, cached by its attachments
+    Imported textures (import_texture) are owned by the caller and never aliased. compile() reruns only when the requests
+    change. self.textures maps texture names to the GL textures of the current compile, it's the same dict across frames.
+    All attachments are sized to the pool's allocation size, passes render into its bottom-left sub-rectangle of the render
+    size, or of the viewport size, set by glViewport. self.texture_sizes has the size each texture was last written at.
+    """
+    def __init__(self, pool: RenderTargetPool = None):
+        self.pool = pool or RenderTargetPool()
+        self._passes: list[RenderPass] = []
+        self._transient_descs: dict[str, TextureDescription] = {}
+        self._imported: dict[str, Texture] = {}
+        self._requested: set[str] = set()
+        self._compiled_requests: frozenset[str] = None
+        # physical transient textures of the current compile, acquired from the pool
+        self._acquired: list[Texture] = []
+        self._framebuffers: dict[tuple, Framebuffer] = {}
+        self.textures: dict[str, Texture] = {}
+        self.texture_sizes: dict[str, glm.ivec2] = {}
+        # results of the last compile
+        self.executed_passes: list[RenderPass] = []
+        self.culled_passes: list[str] = []
+        self.dropped_attachments: list[str] = []
+        self.aliases: dict[str, str] = {}
+
+    def create_texture(self, name: str, desc: TextureDescription):
+        """A transient texture of the graph, sized to the viewport. desc's size is ignored"""
+        assert name not in self._imported and name not in self._transient_descs, f"texture '{name}' declared twice"
+        self._transient_descs[name] = desc
+        self._compiled_requests = None
+
+    def import_texture(self, name: str, tex: Texture):
+        assert name not in self._imported and name not in self._transient_descs, f"texture '{name}' declared twice"
+        self._imported[name] = tex
+        self.textures[name] = tex
+        self._compiled_requests = None
+
+    def add_pass(self, name: str, execute: Callable[[], None], color_outputs: list[str] = None, depth_output: str = None,
+                 reads: list[str] = None, writes: list[str] = None, side_effect: bool = False, at_viewport_size: bool = False) -> RenderPass:
+        render_pass = RenderPass(name, execute, color_outputs or [], depth_output, reads or [], writes or [], side_effect, at_viewport_size)
+        for tex_name in render_pass.get_outputs() + render_pass.reads:
+            assert tex_name in self._imported or tex_name in self._transient_descs, f"pass '{name}' uses undeclared texture '{tex_name}'"
+        self._passes.append(render_pass)
+        self._compiled_requests = None
+        return render_pass
+
+    def request(self, name: str):
+        """Marks a texture as needed after the graph executes this frame, ex: by the Texture Viewer"""
+        self._requested.add(name)
+
+    def get_texture_names(self) -> list[str]:
+        return list(self._imported) + list(self._transient_descs)
+
+    def is_transient(self, name: str) -> bool:
+        return name in self._transient_descs
+
+    def execute(self, viewport_size: glm.ivec2, render_size: glm.ivec2 = None):
+        """
+        Runs the passes with attachments of the pool's allocation size, call after RenderTargetPool.update(viewport_size)
+        render_size: of the passes not at_viewport_size, at most viewport_size. Default viewport_size
+        """
+        render_size = viewport_size if render_size is None else render_size
+        requests = frozenset(self._requested)
+        self._requested = set()
+        if requests != self._compiled_requests:
+            self._compile(requests)
+            self._compiled_requests = requests
+        released_ids = set(self.pool.release_idle())
+        for key in [key for key in self._framebuffers if released_ids & set(key[0] + (key[1], ))]:
+            self._framebuffers.pop(key).deinit()
+        allocated_size = self.pool.allocated_size
+        for render_pass in self.executed_passes:
+            fb = render_pass.framebuffer
+            if fb is not None:
+                # reallocates only when the pool's allocation size changes
+                fb.resize_if_needed(allocated_size.x, allocated_size.y)
+                fb.bind()
+            size = viewport_size if render_pass.at_viewport_size else render_size
+            glViewport(0, 0, size.x, size.y)
+            for name in render_pass.get_outputs():
+                self.texture_sizes[name] = size
+            render_pass.execute()
+            if fb is not None:
+                fb.unbind()
+
+    def _sort(self) -> list[RenderPass]:
+        """Kahn's algorithm, always picking the earliest added ready pass"""
+        dependencies: dict[int, set[int]] = {ix: set() for ix in range(len(self._passes))}
+        for reader_ix, reader in enumerate(self._passes):
+            for tex_name in reader.reads:
+                writers = [ix for ix, p in enumerate(self._passes) if ix != reader_ix and tex_name in p.get_outputs()]
+                # a read-modify-write pass depends only on the writers added before it
+                if tex_name in reader.get_outputs():
+                    writers = [ix for ix in writers if ix < reader_ix]
+                dependencies[reader_ix].update(writers)
+        order = []
+        done = set()
+        while len(order) < len(self._passes):
+            ready = [ix for ix in range(len(self._passes)) if ix not in done and dependencies[ix] <= done]
+            if not ready:
+                cycle = [self._passes[ix].name for ix in range(len(self._passes)) if ix not in done]
+                raise ValueError(f"Render graph has a cycle among passes {cycle}")
+            done.add(ready[0])
+            order.append(self._passes[ready[0]])
+        return order
+
+    def _compile(self, requests: frozenset[str]):
+        order = self._sort()
+        # cull from the back: a pass is needed if it has side effects or writes something needed, then its reads are needed
+        needed = set(requests)
+        kept = []
+        for render_pass in reversed(order):
+            if render_pass.side_effect or any(name in needed for name in render_pass.get_outputs()):
+                kept.append(render_pass)
+                needed.update(render_pass.reads)
+                # the depth buffer is needed for depth testing, even if nobody reads it
+                if render_pass.depth_output:
+                    needed.add(render_pass.depth_output)
+        kept.reverse()
+        self.culled_passes = [p.name for p in order if p not in kept]
+        self.dropped_attachments = [f"{p.name}.{name}" for p in kept for name in p.color_outputs if name is not None and name not in needed]
+
+        # lifetimes of the needed transient textures, as [first, last] kept pass indices
+        lifetimes: dict[str, list[int]] = {}
+        for ix, render_pass in enumerate(kept):
+            for name in render_pass.get_outputs() + render_pass.reads:
+                if name in needed and name in self._transient_descs:
+                    lifetimes.setdefault(name, [ix, ix])[1] = ix
+        for name in requests:
+            if name in lifetimes:
+                lifetimes[name][1] = len(kept)
+        self._allocate(lifetimes)
+
+        for render_pass in kept:
+            color_textures = [self.textures[name] if name in needed else None for name in render_pass.color_outputs]
+            depth_texture = self.textures[render_pass.depth_output] if render_pass.depth_output else None
+            if not color_textures and depth_texture is None:
+                render_pass.framebuffer = None
+                continue
+            key = (tuple(tex.get_id() if tex else None for tex in color_textures), depth_texture.get_id() if depth_texture else None)
+            if key not in self._framebuffers:
+                self._framebuffers[key] = Framebuffer(color_textures, depth_texture)
+            render_pass.framebuffer = self._framebuffers[key]
+        self.executed_passes = kept
+
+    def _allocate(self, lifetimes: dict[str, list[int]]):
+        """Greedy interval assignment of the transient textures to textures acquired from the pool"""
+        for name in self._transient_descs:
+            self.textures.pop(name, None)
+        self.aliases = {}
+        # released first, so that acquire() hands back the same textures when the formats are the same
+        for tex in self._acquired:
+            self.pool.release(tex)
+        self._acquired = []
+        # acquired index -> last pass index of its current occupant, and that occupant
+        busy_until: dict[int, int] = {}
+        occupant: dict[int, str] = {}
+        for name, (first, last) in sorted(lifetimes.items(), key=lambda item: item[1][0]):
+            desc = self._transient_descs[name]
+            free = [ix for ix, tex in enumerate(self._acquired) if format_key(tex.desc) == format_key(desc) and busy_until[ix] < first]
+            if free:
+                ix = free[0]
+                self.aliases[name] = occupant[ix]
+            else:
+                self._acquired.append(self.pool.acquire(desc))
+                ix = len(self._acquired) - 1
+            busy_until[ix] = last
+            occupant[ix] = name
+            self.textures[name] = self._acquired[ix]
+
+    def get_num_pool_textures(self) -> int:
+        """Transient textures allocated for the current compile"""
+        return len(self._acquired)
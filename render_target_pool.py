@@ -0,0 +1,91 @@
+from texture import Texture, TextureDescription
+
+import glm
+
+from dataclasses import replace
+import time
+
+
+def format_key(desc: TextureDescription) -> tuple:
+    """Textures with the same key are interchangeable, their size follows the pool's allocation size"""
+    return (desc.internal_format, desc.format, desc.type, desc.min_filter, desc.mag_filter)
+
+
+def round_up_to_bucket(size: int, granularity: int = 64, power_of_two: bool = False) -> int:
+    if power_of_two:
+        return 1 << max(0, size - 1).bit_length()
+    return max(1, (size + granularity - 1) // granularity * granularity)
+
+
+class RenderTargetPool:
+    """
+    Render targets are allocated in size buckets, rounded up to a multiple of granularity or to a power of two, and passes
+    render into their bottom-left sub-rectangle of the rendered size via glViewport. Shaders sampling a target scale their
+    [0, 1] viewport UVs by get_uv_scale(). While the viewport is being resized, targets are reallocated only when it grows
+    past the bucket, or shrinks below shrink_ratio of it, per axis. That's the hysteresis.
+
+    Also keeps released targets for reuse by acquire(), and deletes the ones idle for longer than idle_timeout seconds.
+    """
+    def __init__(self, granularity: int = 64, power_of_two: bool = False, shrink_ratio: float = 0.5, idle_timeout: float = 10.0):
+        self.granularity = granularity
+        self.power_of_two = power_of_two
+        self.shrink_ratio = shrink_ratio
+        self.idle_timeout = idle_timeout
+        # size of all pooled targets, and the size rendered into them at the last update()
+        self.allocated_size = glm.ivec2(0, 0)
+        self.size = glm.ivec2(0, 0)
+        self.num_reallocations = 0
+        self.num_released_idle = 0
+        # released textures and the time they were released at
+        self._free: list[tuple[Texture, float]] = []
+
+    def _fit_axis(self, allocated: int, size: int) -> int:
+        if size > allocated or size < allocated * self.shrink_ratio:
+            return round_up_to_bucket(size, self.granularity, self.power_of_two)
+        return allocated
+
+    def fit(self, size: glm.ivec2) -> glm.ivec2:
+        """The allocation size update(size) would choose, without changing it"""
+        return glm.ivec2(self._fit_axis(self.allocated_size.x, size.x), self._fit_axis(self.allocated_size.y, size.y))
+
+    def update(self, size: glm.ivec2) -> glm.ivec2:
+        """Call once per frame, before rendering, with the size to render at. Returns the allocation size"""
+        self.size = glm.ivec2(size)
+        allocated_size = self.fit(size)
+        if allocated_size != self.allocated_size:
+            self.allocated_size = allocated_size
+            self.num_reallocations += 1
+        return self.allocated_size
+
+    def get_uv_scale(self, size: glm.ivec2 = None) -> glm.vec2:
+        """Maps [0, 1] UVs over the rendered rectangle of size, default the last update()'s, to UVs of the targets"""
+        size = self.size if size is None else size
+        return glm.vec2(size) / glm.vec2(glm.max(self.allocated_size, glm.ivec2(1)))
+
+    def acquire(self, desc: TextureDescription) -> Texture:
+        """A released texture of the same format if there is one, otherwise a new one. desc's size is ignored"""
+        for ix, (tex, _) in enumerate(self._free):
+            if format_key(tex.desc) == format_key(desc):
+                self._free.pop(ix)
+                tex.resize_if_needed(self.allocated_size.x, self.allocated_size.y)
+                return tex
+        return Texture(replace(desc, width=max(1, self.allocated_size.x), height=max(1, self.allocated_size.y)))
+
+    def release(self, tex: Texture):
+        self._free.append((tex, time.perf_counter()))
+
+    def release_idle(self) -> list[int]:
+        """Deletes textures that have been released for longer than idle_timeout. Returns their ids"""
+        now = time.perf_counter()
+        idle = [tex for tex, released_at in self._free if now - released_at > self.idle_timeout]
+        if not idle:
+            return []
+        self._free = [(tex, released_at) for tex, released_at in self._free if tex not in idle]
+        ids = [tex.get_id() for tex in idle]
+        for tex in idle:
+            tex.deinit()
+        self.num_released_idle += len(idle)
+        return ids
+
+    def get_num_free(self) -> int:
+        return len(self._free)
@@ -1,4 +1,5 @@
 from camera import Camera
+from gpu_profiler import GpuProfiler
 from texture import TextureDescription
 from framebuffer import Framebuffer
 import utils
@@ -13,6 +14,7 @@ from OpenGL.GL import GL_DEPTH_COMPONENT, GL_DEPTH_COMPONENT32
 from OpenGL.GL import GL_RGB, GL_RGB8, GL_UNSIGNED_BYTE, GL_RGB32F
 from OpenGL.GL import GL_RED, GL_R32F, GL_RG, GL_RG32F
 from OpenGL.GL import GL_R32I, GL_RED_INTEGER
+from OpenGL.GL import GL_RGBA, GL_RGBA16F, GL_RG16F, GL_HALF_FLOAT, GL_RG16_SNORM, GL_SHORT, GL_RGB10_A2, GL_UNSIGNED_INT_2_10_10_10_REV
 # OpenGL queries realted imports
 from OpenGL.GL import GL_MAX_COLOR_ATTACHMENTS, GL_SHADING_LANGUAGE_VERSION, GL_RENDERER, GL_VERSION, glGetIntegerv, glGetString
 # Graphics pipeline settings related imports
@@ -23,9 +25,16 @@ from OpenGL.GL import GL_MAX_UNIFORM_LOCATIONS, GL_MAX_FRAGMENT_UNIFORM_COMPONEN
 #
 from OpenGL.GL import glViewport
 
+import contextlib
+
 
 class Renderer:
-    def init(self, win_size: glm.ivec2, viewport_size: glm.ivec2):
+    def init(self, win_size: glm.ivec2, viewport_size: glm.ivec2, visible: bool = True, egl: bool = False):
+        """
+        visible: False for offscreen rendering into a hidden window, ex: benchmarks
+        egl: create the context via EGL instead of GLX/WGL. Needs PYOPENGL_PLATFORM=egl set before importing OpenGL. Only the
+        context creation changes, GLFW still needs an X11/Wayland display, ex: Xvfb for Mesa llvmpipe on a headless machine
+        """
         self.win_size = win_size
         self.viewport_size = viewport_size
         self._has_frame_begun = False
@@ -33,6 +42,9 @@ class Renderer:
         glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 4)
         glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 6)
         glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+        glfw.window_hint(glfw.VISIBLE, visible)
+        if egl:
+            glfw.window_hint(glfw.CONTEXT_CREATION_API, glfw.EGL_CONTEXT_API)
         # glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_COMPAT_PROFILE)
         # glfw.window_hint(glfw.SAMPLES, 4)
         # glfw.window_hint(glfw.OPENGL_DEBUG_CONTEXT, True)  # TODO: bring debug context
@@ -93,9 +105,10 @@ class Renderer:
         self._has_frame_begun = True
 
 
-    def end_frame(self):
+    def end_frame(self, gpu_profiler: GpuProfiler = None):
         imgui.render()
-        self.imgui_impl.render(imgui.get_draw_data())
+        with gpu_profiler.scope("ImGui") if gpu_profiler is not None else contextlib.nullcontext():
+            self.imgui_impl.render(imgui.get_draw_data())
 
         # CONFIG_VIEWPORTS_ENABLE is removed from imgui.get_io().config_flags at imgui.new_frame()
         # also render_platform_windows_default() has not been implemented yet https://github.com/pyimgui/pyimgui/issues/259#issuecomment-1039239640
@@ -142,6 +155,43 @@ class Renderer:
         )
         return desc
     
+    def get_texdesc_4channel_flt16(self) -> TextureDescription:
+        desc = TextureDescription(
+            width=self.viewport_size.x, height=self.viewport_size.y,
+            internal_format=GL_RGBA16F,
+            format=GL_RGBA,
+            type=GL_HALF_FLOAT,
+        )
+        return desc
+
+    def get_texdesc_2channel_flt16(self) -> TextureDescription:
+        desc = TextureDescription(
+            width=self.viewport_size.x, height=self.viewport_size.y,
+            internal_format=GL_RG16F,
+            format=GL_RG,
+            type=GL_HALF_FLOAT,
+        )
+        return desc
+
+    def get_texdesc_2channel_snorm16(self) -> TextureDescription:
+        desc = TextureDescription(
+            width=self.viewport_size.x, height=self.viewport_size.y,
+            internal_format=GL_RG16_SNORM,
+            format=GL_RG,
+            type=GL_SHORT,
+        )
+        return desc
+
+    def get_texdesc_rgb10_a2(self) -> TextureDescription:
+        """Read back as one packed uint32 per pixel, see texture.unpack_rgb10_a2()"""
+        desc = TextureDescription(
+            width=self.viewport_size.x, height=self.viewport_size.y,
+            internal_format=GL_RGB10_A2,
+            format=GL_RGBA,
+            type=GL_UNSIGNED_INT_2_10_10_10_REV,
+        )
+        return desc
+
     def get_texdesc_1channel_flt32(self) -> TextureDescription:
         desc = TextureDescription(
             width=self.viewport_size.x, height=self.viewport_size.y,
@@ -1,5 +1,6 @@
 from camera import Camera
 from lights import AmbientLight, DirectionalLight, HemisphericalLight, PointLight
+from scene_graph import Node
 
 import glm
 
@@ -14,8 +15,8 @@ class Scene:
         self.hemispherical_light: HemisphericalLight = HemisphericalLight()
         self.point_lights: list[PointLight] = []
 
-class Object:
-    def __init__(self, mesh, transform, shader):
+class Object(Node):
+    def __init__(self, mesh, transform, shader, parent: Node = None):
+        super().__init__(transform, parent)
         self.mesh = mesh
-        self.transform = transform
         self.shader = shader
\ No newline at end of file
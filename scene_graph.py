@@ -0,0 +1,65 @@
+from utils import Transform
+
+import glm
+
+
+class Node:
+    """
+    Scene graph node with a local Transform. World and normal matrices are cached and only recomputed after
+    the node's transform or one of its ancestors' transforms changed, or the node got reparented.
+    A dirty node's descendants are always dirty too, hence marking stops at already dirty nodes.
+    """
+    def __init__(self, transform: Transform = None, parent: "Node" = None):
+        self.transform = transform if transform is not None else Transform(glm.vec3(0), glm.vec3(0), glm.vec3(1))
+        self.transform.on_change = self.mark_dirty
+        self.parent: Node = None
+        self.children: list[Node] = []
+        self._world_mat: glm.mat4 = None  # None when dirty
+        self._normal_mat: glm.mat3 = None
+        if parent is not None:
+            parent.add_child(self)
+
+    def add_child(self, child: "Node"):
+        if child.parent is not None:
+            child.parent.children.remove(child)
+        child.parent = self
+        self.children.append(child)
+        child.mark_dirty()
+
+    def remove_child(self, child: "Node"):
+        self.children.remove(child)
+        child.parent = None
+        child.mark_dirty()
+
+    def is_dirty(self) -> bool:
+        return self._world_mat is None
+
+    def mark_dirty(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._world_mat is None:
+                continue
+            node._world_mat = None
+            node._normal_mat = None
+            stack.extend(node.children)
+
+    def get_world_matrix(self) -> glm.mat4:
+        if self._world_mat is None:
+            local = self.transform.get_transform_mat()
+            self._world_mat = self.parent.get_world_matrix() * local if self.parent is not None else local
+        return self._world_mat
+
+    def get_normal_matrix(self) -> glm.mat3:
+        """Transforms object space normals to world space"""
+        if self._normal_mat is None:
+            self._normal_mat = glm.transpose(glm.inverse(glm.mat3(self.get_world_matrix())))
+        return self._normal_mat
+
+    def traverse(self):
+        """Yields this node and its descendants, parents before children"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
@@ -0,0 +1,130 @@
+from gbuffer_layout import GBufferLayout
+from lights import PointLight
+from scene import Scene
+
+import glm
+import numpy as np
+from OpenGL.GL import GL_UNIFORM_BUFFER, GL_DYNAMIC_DRAW, GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT
+from OpenGL.GL import glGenBuffers, glBindBuffer, glBufferData, glBufferSubData, glBindBufferRange, glGetIntegerv
+
+# Binding points of the uniform blocks, in sync with the values in scene_uniforms.glsl and lib/*Light.glsl
+CAMERA_BINDING = 0
+AMBIENT_LIGHT_BINDING = 1
+DIRECTIONAL_LIGHT_BINDING = 2
+HEMISPHERICAL_LIGHT_BINDING = 3
+POINT_LIGHTS_BINDING = 4
+
+MAX_POINT_LIGHTS = PointLight.MAX_POINT_LIGHTS
+
+# std140 layouts of the blocks. vec3s are 16-byte aligned, a float can fill the gap after a vec3
+_vec3 = ('<f4', 3)
+_mat4 = ('<f4', (4, 4))
+camera_dtype = np.dtype({
+    'names': ['viewFromWorld', 'projectionFromView', 'eyePos', 'gbufferLayout', 'worldFromProjection', 'gbufferUvScale'],
+    'formats': [_mat4, _mat4, _vec3, '<i4', _mat4, ('<f4', 2)],
+    'offsets': [0, 64, 128, 140, 144, 208],
+    'itemsize': 224,
+})
+ambient_light_dtype = np.dtype({'names': ['color'], 'formats': [_vec3], 'offsets': [0], 'itemsize': 16})
+directional_light_dtype = np.dtype({
+    'names': ['direction', 'color', 'intensity'],
+    'formats': [_vec3, _vec3, '<f4'],
+    'offsets': [0, 16, 28],
+    'itemsize': 32,
+})
+hemispherical_light_dtype = np.dtype({
+    'names': ['northColor', 'southColor', 'intensity'],
+    'formats': [_vec3, _vec3, '<f4'],
+    'offsets': [0, 16, 28],
+    'itemsize': 32,
+})
+point_light_dtype = np.dtype({
+    'names': ['position', 'color', 'intensity'],
+    'formats': [_vec3, _vec3, '<f4'],
+    'offsets': [0, 16, 28],
+    'itemsize': 32,
+})
+point_lights_dtype = np.dtype({
+    'names': ['pointLights', 'numPointLights'],
+    'formats': [(point_light_dtype, MAX_POINT_LIGHTS), '<i4'],
+    'offsets': [0, MAX_POINT_LIGHTS * point_light_dtype.itemsize],
+    'itemsize': MAX_POINT_LIGHTS * point_light_dtype.itemsize + 16,
+})
+
+
+def mat4_to_std140(mat: glm.mat4) -> np.ndarray:
+    # np.array() of a glm matrix is row-major, GLSL expects column-major
+    return np.array(mat).T
+
+
+class SceneUniformBuffer:
+    """
+    Camera and lights of a Scene packed into a single NumPy struct that's uploaded once per frame into one uniform buffer.
+    Each uniform block reads its own range of the buffer via its fixed binding point.
+    """
+    def __init__(self, gbuffer_layout: GBufferLayout = GBufferLayout.FULL_32F):
+        self.gbuffer_layout = gbuffer_layout
+        # set before upload(), see RenderTargetPool.get_uv_scale()
+        self.gbuffer_uv_scale = glm.vec2(1, 1)
+        alignment = int(glGetIntegerv(GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT))
+        blocks = [
+            ('camera', camera_dtype, CAMERA_BINDING),
+            ('ambientLight', ambient_light_dtype, AMBIENT_LIGHT_BINDING),
+            ('directionalLight', directional_light_dtype, DIRECTIONAL_LIGHT_BINDING),
+            ('hemisphericalLight', hemispherical_light_dtype, HEMISPHERICAL_LIGHT_BINDING),
+            ('pointLights', point_lights_dtype, POINT_LIGHTS_BINDING),
+        ]
+        # glBindBufferRange offsets have to be multiples of the alignment
+        offsets = []
+        offset = 0
+        for _, dtype, _ in blocks:
+            offsets.append(offset)
+            offset += (dtype.itemsize + alignment - 1) // alignment * alignment
+        self.dtype = np.dtype({
+            'names': [name for name, _, _ in blocks],
+            'formats': [dtype for _, dtype, _ in blocks],
+            'offsets': offsets,
+            'itemsize': offset,
+        })
+        self._ranges = [(binding, offsets[ix], dtype.itemsize) for ix, (_, dtype, binding) in enumerate(blocks)]
+        self.data = np.zeros(1, dtype=self.dtype)
+
+        self._id = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self._id)
+        glBufferData(GL_UNIFORM_BUFFER, self.dtype.itemsize, None, GL_DYNAMIC_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def get_id(self) -> int:
+        return self._id
+
+    def pack(self, scene: Scene):
+        d = self.data[0]
+        cam = scene.cam
+        d['camera']['viewFromWorld'] = mat4_to_std140(cam.get_view_from_world())
+        d['camera']['projectionFromView'] = mat4_to_std140(cam.get_projection_from_view())
+        d['camera']['eyePos'] = cam.position
+        d['camera']['gbufferLayout'] = self.gbuffer_layout
+        d['camera']['worldFromProjection'] = mat4_to_std140(glm.inverse(cam.get_projection_from_view() * cam.get_view_from_world()))
+        d['camera']['gbufferUvScale'] = self.gbuffer_uv_scale
+        d['ambientLight']['color'] = scene.ambient_light.color
+        d['directionalLight']['direction'] = scene.directional_light.direction
+        d['directionalLight']['color'] = scene.directional_light.color
+        d['directionalLight']['intensity'] = scene.directional_light.intensity
+        d['hemisphericalLight']['northColor'] = scene.hemispherical_light.north_color
+        d['hemisphericalLight']['southColor'] = scene.hemispherical_light.south_color
+        d['hemisphericalLight']['intensity'] = scene.hemispherical_light.intensity
+        point_lights = d['pointLights']['pointLights']
+        for pl in scene.point_lights:
+            point_lights[pl.ix]['position'] = pl.position
+            point_lights[pl.ix]['color'] = pl.color
+            point_lights[pl.ix]['intensity'] = pl.intensity
+        d['pointLights']['numPointLights'] = PointLight.numPointLights
+
+    def upload(self, scene: Scene):
+        """Call once per frame, after camera's aspect ratio is updated and before drawing"""
+        self.pack(scene)
+        glBindBuffer(GL_UNIFORM_BUFFER, self._id)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.dtype.itemsize, self.data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+        for binding, offset, size in self._ranges:
+            glBindBufferRange(GL_UNIFORM_BUFFER, binding, self._id, offset, size)
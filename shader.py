@@ -1,16 +1,73 @@
+from dataclasses import dataclass
+
 import glm
 # Shader related imports
 from OpenGL.GL import GL_FALSE
 from OpenGL.GL import GL_FRAGMENT_SHADER, GL_VERTEX_SHADER, glCompileShader, glCreateShader, glDeleteShader, glDetachShader, glGetShaderiv, glGetShaderInfoLog, glGetProgramInfoLog
-from OpenGL.GL import glGetUniformLocation, glUniform1i, glUniform1f, glUniform3fv, glUniformMatrix4fv
+from OpenGL.GL import glUniform1i, glUniform1f, glUniform3fv, glUniformMatrix3fv, glUniformMatrix4fv
 from OpenGL.GL import GL_COMPILE_STATUS, GL_LINK_STATUS, glAttachShader, glCreateProgram, glGetProgramiv, glLinkProgram, glShaderSource, glUseProgram, GL_INFO_LOG_LENGTH
 from OpenGL.GL import glShaderBinary, glSpecializeShader, GL_SHADER_BINARY_FORMAT_SPIR_V, glProgramUniformMatrix4fv, glGetShaderSource
+from OpenGL.GL import GL_TRUE, GL_PROGRAM_BINARY_LENGTH, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, glGetProgramBinary, glProgramBinary, glProgramParameteri
+from OpenGL.GL import GL_RENDERER, GL_VENDOR, GL_VERSION, glGetString
+# Uniform reflection related imports
+from OpenGL.GL import GL_UNIFORM, GL_ACTIVE_RESOURCES, GL_NAME_LENGTH, GL_TYPE, GL_LOCATION, GL_ARRAY_SIZE
+from OpenGL.GL import glGetProgramInterfaceiv, glGetProgramResourceiv, glGetProgramResourceName
+from OpenGL.GL import GL_INT, GL_BOOL, GL_FLOAT, GL_FLOAT_VEC3, GL_FLOAT_MAT3, GL_FLOAT_MAT4, GL_SAMPLER_2D, GL_INT_SAMPLER_2D, GL_UNSIGNED_INT_SAMPLER_2D
+import numpy as np
 import pyshaderc
 
+import shader_cache
+
+
+def compile_file_into_spirv(filepath: str, stage: str, optimization: str = 'zero') -> bytes | None:
+    """
+    Doesn't need an OpenGL context, hence can be run in worker processes. Returns None on compilation errors.
+    optimization: 'zero' or 'performance' (slower compilation)
+    """
+    key = shader_cache.spirv_key(filepath, stage, optimization)
+    spirv_bytes = shader_cache.load_spirv(key)
+    if spirv_bytes is not None:
+        return spirv_bytes
+    try:
+        spirv_bytes = pyshaderc.compile_file_into_spirv(filepath, stage, optimization=optimization)
+    except pyshaderc.CompilationError as ce:
+        print("[ERROR] ShaderC SPIRV Compilation Error: ", str(ce))
+        return None
+    shader_cache.store_spirv(key, spirv_bytes)
+    return spirv_bytes
+
+
+def get_driver_string() -> str:
+    return "|".join(glGetString(name).decode() for name in (GL_VENDOR, GL_RENDERER, GL_VERSION))
+
+
+@dataclass
+class UniformInfo:
+    location: int
+    type: int  # GLenum such as GL_FLOAT_VEC3
+    size: int  # number of array elements, 1 for non-arrays
+
+
 class Shader:
-    def __init__(self, vertex_file, fragment_file, use_spirv=True):
+    # Uniform upload counts of all shaders in current and previous frame. See new_frame()
+    frame_uploads_issued = 0
+    frame_uploads_skipped = 0
+    last_frame_uploads_issued = 0
+    last_frame_uploads_skipped = 0
+
+    def __init__(self, vertex_file, fragment_file, use_spirv=True, spirv_binaries: dict[str, bytes] = None, optimization='zero'):
+        """
+        spirv_binaries: optional already compiled {'vert': ..., 'frag': ...} SPIR-V used instead of compiling at construction
+        optimization: shaderc optimization level of SPIR-V compilation, 'zero' or 'performance'
+        """
         self.vertex_file = vertex_file
         self.fragment_file = fragment_file
+        self.optimization = optimization
+        self.is_from_program_cache = False
+        # active uniforms not in a block, filled after each successful link
+        self.uniforms: dict[str, UniformInfo] = {}
+        # last value uploaded per location, a program keeps its uniform values until it's relinked
+        self._uniform_shadow: dict[int, object] = {}
 
         self._id = glCreateProgram()
         self._vert_id = -1
@@ -21,7 +78,7 @@ class Shader:
 
         if not self.use_spirv:
             self.__load()
-        self.__compile()
+        self.__compile(spirv_binaries)
 
     def get_id(self):
         return self._id
@@ -54,21 +111,73 @@ class Shader:
     def unbind(self):
         glUseProgram(0)
 
+    @staticmethod
+    def new_frame():
+        """Call once per frame to roll the upload counters over"""
+        Shader.last_frame_uploads_issued = Shader.frame_uploads_issued
+        Shader.last_frame_uploads_skipped = Shader.frame_uploads_skipped
+        Shader.frame_uploads_issued = 0
+        Shader.frame_uploads_skipped = 0
+
+    def __location_to_upload(self, name, gl_types, val) -> int:
+        """Returns the location of uniform name if val has to be uploaded, -1 if it's inactive or already has val"""
+        info = self.uniforms.get(name)
+        if info is None:
+            return -1
+        assert info.type in gl_types, f"Uniform '{name}' of shader ({self.vertex_file}, {self.fragment_file}) has type 0x{info.type:x}, not one of {[hex(t) for t in gl_types]}"
+        if self._uniform_shadow.get(info.location) == val:
+            Shader.frame_uploads_skipped += 1
+            return -1
+        # copy, glm values are often mutated in place (ex: by ImGui widgets)
+        self._uniform_shadow[info.location] = type(val)(val)
+        Shader.frame_uploads_issued += 1
+        return info.location
+
     def set_uniform_int1(self, name, val):
-      loc = glGetUniformLocation(self._id, name)
-      glUniform1i(loc, val)
+      loc = self.__location_to_upload(name, (GL_INT, GL_BOOL, GL_SAMPLER_2D, GL_INT_SAMPLER_2D, GL_UNSIGNED_INT_SAMPLER_2D), val)
+      if loc != -1:
+        glUniform1i(loc, val)
 
     def set_uniform_float1(self, name, val):
-      loc = glGetUniformLocation(self._id, name)
-      glUniform1f(loc, val)
+      loc = self.__location_to_upload(name, (GL_FLOAT, ), val)
+      if loc != -1:
+        glUniform1f(loc, val)
 
     def set_uniform_vec3(self, name, val):
-        loc = glGetUniformLocation(self._id, name)
-        glUniform3fv(loc, 1, glm.value_ptr(val))
+        loc = self.__location_to_upload(name, (GL_FLOAT_VEC3, ), val)
+        if loc != -1:
+            glUniform3fv(loc, 1, glm.value_ptr(val))
+
+    def set_uniform_mat3(self, name, val):
+        loc = self.__location_to_upload(name, (GL_FLOAT_MAT3, ), val)
+        if loc != -1:
+            glUniformMatrix3fv(loc, 1, GL_FALSE, glm.value_ptr(val))
 
     def set_uniform_mat4(self, name, val):
-        loc = glGetUniformLocation(self._id, name)
-        glUniformMatrix4fv(loc, 1, GL_FALSE, glm.value_ptr(val))
+        loc = self.__location_to_upload(name, (GL_FLOAT_MAT4, ), val)
+        if loc != -1:
+            glUniformMatrix4fv(loc, 1, GL_FALSE, glm.value_ptr(val))
+
+    def __reflect_uniforms(self):
+        self.uniforms = {}
+        self._uniform_shadow = {}
+        num_uniforms = np.zeros(1, dtype=np.int32)
+        glGetProgramInterfaceiv(self.get_id(), GL_UNIFORM, GL_ACTIVE_RESOURCES, num_uniforms)
+        props = np.array([GL_NAME_LENGTH, GL_TYPE, GL_LOCATION, GL_ARRAY_SIZE], dtype=np.uint32)
+        values = np.zeros(len(props), dtype=np.int32)
+        for ix in range(num_uniforms[0]):
+            glGetProgramResourceiv(self.get_id(), GL_UNIFORM, ix, len(props), props, len(values), None, values)
+            name_length, gl_type, location, array_size = (int(v) for v in values)
+            if location == -1:  # member of a uniform block
+                continue
+            name_buffer = np.zeros(name_length, dtype=np.uint8)
+            glGetProgramResourceName(self.get_id(), GL_UNIFORM, ix, name_length, None, name_buffer)
+            name = name_buffer.tobytes().rstrip(b"\0").decode()
+            info = UniformInfo(location=location, type=gl_type, size=array_size)
+            self.uniforms[name] = info
+            # arrays of basic types are reported as "name[0]" but can be set via "name" too
+            if name.endswith("[0]"):
+                self.uniforms[name[:-3]] = info
 
     def __load(self):
         with open(self.vertex_file, 'r') as file:
@@ -76,18 +185,47 @@ class Shader:
         with open(self.fragment_file, 'r') as file:
             self._frag_src = file.read()
     
-    def __compile_file_into_spirv(self, shader_id, filepath, stage):
-        try:
-            spirv_bytes = pyshaderc.compile_file_into_spirv(filepath, stage, optimization='zero')
-            glShaderBinary(1, shader_id, GL_SHADER_BINARY_FORMAT_SPIR_V, spirv_bytes, len(spirv_bytes))
-            glSpecializeShader(shader_id, 'main', 0, None, None)
-        except pyshaderc.CompilationError as ce:
-            print("[ERROR] ShaderC SPIRV Compilation Error: ", str(ce))
-
-    def __compile(self):
+    def __compile_file_into_spirv(self, shader_id, filepath, stage, spirv_bytes=None):
+        if spirv_bytes is None:
+            spirv_bytes = compile_file_into_spirv(filepath, stage, self.optimization)
+        if spirv_bytes is None:
+            return
+        glShaderBinary(1, shader_id, GL_SHADER_BINARY_FORMAT_SPIR_V, spirv_bytes, len(spirv_bytes))
+        glSpecializeShader(shader_id, 'main', 0, None, None)
+
+    def __load_program_binary(self, key: str) -> bool:
+        cached = shader_cache.load_program_binary(key)
+        if cached is None:
+            return False
+        binary_format, binary = cached
+        glProgramBinary(self.get_id(), binary_format, binary, len(binary))
+        # driver can reject binaries of another driver build with the same version string
+        return glGetProgramiv(self.get_id(), GL_LINK_STATUS) == 1
+
+    def __store_program_binary(self, key: str):
+        length = glGetProgramiv(self.get_id(), GL_PROGRAM_BINARY_LENGTH)
+        if length <= 0:
+            return
+        binary = np.empty(length, dtype=np.uint8)
+        binary_format = np.zeros(1, dtype=np.uint32)
+        written = np.zeros(1, dtype=np.int32)
+        glGetProgramBinary(self.get_id(), length, written, binary_format, binary)
+        shader_cache.store_program_binary(key, int(binary_format[0]), binary[:written[0]].tobytes())
+
+    def __compile(self, spirv_binaries: dict[str, bytes] = None):
+        spirv_binaries = spirv_binaries or {}
+        program_key = None
+        if self.use_spirv:
+            stage_keys = [shader_cache.spirv_key(self.vertex_file, 'vert', self.optimization), shader_cache.spirv_key(self.fragment_file, 'frag', self.optimization)]
+            program_key = shader_cache.program_key(stage_keys, get_driver_string())
+            self.is_from_program_cache = self.__load_program_binary(program_key)
+            if self.is_from_program_cache:
+                self.__reflect_uniforms()
+                return self.get_id()
+
         vs = glCreateShader(GL_VERTEX_SHADER)
         if self.use_spirv:
-            self.__compile_file_into_spirv(vs, self.vertex_file, 'vert')
+            self.__compile_file_into_spirv(vs, self.vertex_file, 'vert', spirv_binaries.get('vert'))
         else:
             glShaderSource(vs, [self._vert_src], None)  # TODO: try non-array
             glCompileShader(vs)
@@ -100,7 +238,7 @@ class Shader:
 
         fs = glCreateShader(GL_FRAGMENT_SHADER)
         if self.use_spirv:
-            self.__compile_file_into_spirv(fs, self.fragment_file, 'frag')
+            self.__compile_file_into_spirv(fs, self.fragment_file, 'frag', spirv_binaries.get('frag'))
         else:
             glShaderSource(fs, [self._frag_src], None)
             glCompileShader(fs)
@@ -112,12 +250,14 @@ class Shader:
             glDeleteShader(fs)
             return -1
 
-        if self.is_valid():
+        # program might be invalid while still having shaders attached, ex: after a rejected program binary
+        if self.get_vert_id() != -1:
             glDetachShader(self.get_id(), self.get_vert_id())
             glDetachShader(self.get_id(), self.get_frag_id())
 
         glAttachShader(self.get_id(), vs)
         glAttachShader(self.get_id(), fs)
+        glProgramParameteri(self.get_id(), GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
         glLinkProgram(self.get_id())
         status = glGetProgramiv(self.get_id(), GL_LINK_STATUS)
         if status != 1:
@@ -129,6 +269,9 @@ class Shader:
 
         self._vert_id = vs
         self._frag_id = fs
+        self.__reflect_uniforms()
+        if program_key is not None:
+            self.__store_program_binary(program_key)
 
         # glDeleteShader(vs)
         # glDeleteShader(fs)
@@ -0,0 +1,80 @@
+"""
+Two-level on-disk shader cache.
+1) SPIR-V binaries keyed by the source of a stage, its transitive #include files, the stage and the compile options.
+2) Linked program binaries (glGetProgramBinary) keyed by the SPIR-V keys of its stages and the driver's vendor/renderer/version.
+A warm start skips both shaderc and the linker. Neither level needs explicit invalidation, changed inputs give new keys.
+"""
+import hashlib
+import os
+import re
+
+# Increment when the way shaders are compiled changes without the keys changing
+SHADER_CACHE_VERSION = 1
+SHADER_CACHE_DIR = ".cache/shaders"
+
+_include_pattern = re.compile(r'^\s*#\s*include\s+"([^"]+)"', re.MULTILINE)
+
+
+def collect_include_files(filepath: str) -> list[str]:
+    """Transitive #include "..." files of a shader, each once, in discovery order. Includes are relative to the including file."""
+    found = []
+    stack = [filepath]
+    while stack:
+        including_file = stack.pop()
+        with open(including_file, "r") as file:
+            src = file.read()
+        for include in _include_pattern.findall(src):
+            path = os.path.normpath(os.path.join(os.path.dirname(including_file), include))
+            if path not in found and os.path.exists(path):
+                found.append(path)
+                stack.append(path)
+    return found
+
+
+def spirv_key(filepath: str, stage: str, optimization: str) -> str:
+    sha = hashlib.sha1(f"{SHADER_CACHE_VERSION}|{stage}|{optimization}".encode())
+    for path in [filepath] + collect_include_files(filepath):
+        with open(path, "rb") as file:
+            sha.update(path.encode())
+            sha.update(file.read())
+    return sha.hexdigest()
+
+
+def program_key(stage_keys: list[str], driver: str) -> str:
+    return hashlib.sha1("|".join(stage_keys + [driver]).encode()).hexdigest()
+
+
+def _read(path: str) -> bytes | None:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def _write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write and rename so that concurrent readers (ex: worker processes) never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_spirv(key: str) -> bytes | None:
+    return _read(os.path.join(SHADER_CACHE_DIR, "spirv", f"{key}.spv"))
+
+
+def store_spirv(key: str, spirv: bytes):
+    _write(os.path.join(SHADER_CACHE_DIR, "spirv", f"{key}.spv"), spirv)
+
+
+def load_program_binary(key: str) -> tuple[int, bytes] | None:
+    """Returns (binary_format, binary)"""
+    data = _read(os.path.join(SHADER_CACHE_DIR, "program", f"{key}.bin"))
+    if data is None or len(data) < 4:
+        return None
+    return int.from_bytes(data[:4], "little"), data[4:]
+
+
+def store_program_binary(key: str, binary_format: int, binary: bytes):
+    _write(os.path.join(SHADER_CACHE_DIR, "program", f"{key}.bin"), binary_format.to_bytes(4, "little") + binary)
@@ -5,8 +5,10 @@
 #include "lib/vertex_data.glsl"
 #include "lib/scene_uniforms.glsl"
 #include "lib/common.glsl"
+#include "lib/gbuffer.glsl"
 
 layout(location = 0) in VertexData v;
+layout(location = 7) flat in int meshId;
 
 #include "lib/AmbientLight.glsl"
 #include "lib/HemisphericalLight.glsl"
@@ -37,8 +39,9 @@ void main () {
     outColor = vec4(mix(color, vec3(0.2, 0.2, 0.2), wire), 1.0);
 
     // Data for deferred rendering
+    // formats per gbufferLayout. Without a world_pos attachment, location 1 has no draw buffer and the write is discarded
     outWorldPos = v.worldPosition;
-    outWorldNormal = worldNormal;
+    outWorldNormal = encodeNormal(worldNormal, gbufferLayout);
     outUV = v.texCoord;
     outDepth = log(length(v.worldPosition - eyePos));  // TODO: add depthViz, and rename meshIdColored to meshIdViz
     outMeshId = meshId;
@@ -3,6 +3,7 @@
 
 #include "lib/vertex_data.glsl"
 #include "lib/scene_uniforms.glsl"
+#include "lib/instance_data.glsl"
 #include "lib/common.glsl"
 
 layout(location = 0) in vec3 objectPosition;
@@ -12,8 +13,11 @@ layout(location = 3) in vec4 color;
 vec4 custom = vec4(0);
 
 layout(location = 0) out VertexData v;
+layout(location = 7) flat out int meshId; // after the 7 locations of VertexData
 
 void main () {
-    v = fillVertexData(worldFromObject, objectPosition, objectNormal, texCoord, color, custom);
+    InstanceData instance = getInstanceData();
+    v = fillVertexData(instance.worldFromObject, mat3(instance.normalFromObject), objectPosition, objectNormal, texCoord, color, custom);
+    meshId = getDrawData().meshId;
     gl_Position = projectionFromView * viewFromWorld * vec4(v.worldPosition, 1);
 }
\ No newline at end of file
@@ -4,6 +4,7 @@ layout (location = 1) in vec2 texCoord;
 
 #include "lib/scene_uniforms.glsl"
 #include "lib/common.glsl"
+#include "lib/gbuffer.glsl"
 
 #include "lib/AmbientLight.glsl"
 #include "lib/DirectionalLight.glsl"
@@ -15,11 +16,14 @@ layout (binding = 1) uniform sampler2D worldPosTex;
 layout (binding = 2) uniform sampler2D worldNormalTex;
 layout (binding = 3) uniform sampler2D uvTex;
 layout (binding = 4) uniform isampler2D meshIdTex;
+layout (binding = 5) uniform sampler2D depthTex; // only bound for GBUFFER_LAYOUT_DEPTH_ONLY_POS
 
 layout (location = 0) out vec4 outColor;
 
 void main () { 
-    int meshId = texture(meshIdTex, texCoord).r;
+    // the G-buffer fills the bottom-left gbufferUvScale part of its textures, texCoord spans the viewport
+    vec2 gbufferUv = texCoord * gbufferUvScale;
+    int meshId = texture(meshIdTex, gbufferUv).r;
     // Discarding might not look good with MSAA
     if (meshId == 0)
         discard;
@@ -27,10 +31,12 @@ void main () {
     const float specularCoef = 32.0;
 
     // retrieve data from G-buffer
-    vec3 sceneRender = texture(sceneRenderTex, texCoord).rgb;
-    vec3 worldPos = texture(worldPosTex, texCoord).rgb;
-    vec3 worldNormal = texture(worldNormalTex, texCoord).rgb;
-    vec2 uv = texture(uvTex, texCoord).rg;
+    vec3 sceneRender = texture(sceneRenderTex, gbufferUv).rgb;
+    vec3 worldPos = gbufferLayout == GBUFFER_LAYOUT_DEPTH_ONLY_POS
+      ? worldPosFromDepth(texCoord, texture(depthTex, gbufferUv).r, worldFromProjection)
+      : texture(worldPosTex, gbufferUv).rgb;
+    vec3 worldNormal = decodeNormal(texture(worldNormalTex, gbufferUv).rgb, gbufferLayout);
+    vec2 uv = texture(uvTex, gbufferUv).rg;
 
     vec3 pointLightIllumination = vec3(0);
     for (int i = 0; i < numPointLights; i++)
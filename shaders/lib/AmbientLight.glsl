@@ -2,7 +2,9 @@ struct AmbientLight {
   vec3 color;
 };
 
-layout(location = 5) uniform AmbientLight ambientLight;
+layout(std140, binding = 1) uniform AmbientLightUniforms {
+  AmbientLight ambientLight;
+};
 
 vec3 illuminate(AmbientLight light) {
   return light.color;
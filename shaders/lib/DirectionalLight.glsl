@@ -4,7 +4,9 @@ struct DirectionalLight {
   float intensity;
 };
 
-layout(location = 6) uniform DirectionalLight directionalLight;
+layout(std140, binding = 2) uniform DirectionalLightUniforms {
+  DirectionalLight directionalLight;
+};
 
 vec3 illuminateDiffuse(DirectionalLight light, vec3 normal) {
   vec3 fragToLightN = normalize(-light.direction);
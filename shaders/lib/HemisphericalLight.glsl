@@ -4,7 +4,9 @@ struct HemisphericalLight {
   float intensity;
 };
 
-layout(location = 9) uniform HemisphericalLight hemisphericalLight;
+layout(std140, binding = 3) uniform HemisphericalLightUniforms {
+  HemisphericalLight hemisphericalLight;
+};
 
 vec3 illuminate(HemisphericalLight light, vec3 normal) {
   const vec3 northDir = vec3(0, 1, 0);
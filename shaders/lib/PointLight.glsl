@@ -5,8 +5,10 @@ struct PointLight {
 };
 
 #define MAX_POINT_LIGHTS 8
-layout(location = 12) uniform PointLight[MAX_POINT_LIGHTS] pointLights;
-layout(location = 36) uniform int numPointLights;
+layout(std140, binding = 4) uniform PointLightUniforms {
+  PointLight pointLights[MAX_POINT_LIGHTS];
+  int numPointLights;
+};
 
 vec3 illuminateDiffuse(PointLight light, vec3 position, vec3 normal) {
   vec3 fragToLight = light.position - position;
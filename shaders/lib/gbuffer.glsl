@@ -0,0 +1,46 @@
+// Encoding of the G-buffer's geometry attachments. In sync with GBufferLayout in gbuffer_layout.py, the layout is camera's gbufferLayout
+const int GBUFFER_LAYOUT_FULL_32F = 0;
+const int GBUFFER_LAYOUT_HALF = 1;
+const int GBUFFER_LAYOUT_OCTAHEDRAL = 2;
+const int GBUFFER_LAYOUT_DEPTH_ONLY_POS = 3;
+
+vec2 signNotZero(vec2 v) {
+  return vec2(v.x >= 0.0 ? 1.0 : -1.0, v.y >= 0.0 ? 1.0 : -1.0);
+}
+
+// unit normal -> [-1, 1]^2, by projecting onto the octahedron |x| + |y| + |z| = 1 and folding the lower half over the upper
+vec2 octEncode(vec3 n) {
+  vec2 p = n.xy / (abs(n.x) + abs(n.y) + abs(n.z));
+  return n.z <= 0.0 ? (1.0 - abs(p.yx)) * signNotZero(p) : p;
+}
+
+// same as texture.octahedral_decode()
+vec3 octDecode(vec2 e) {
+  vec3 n = vec3(e, 1.0 - abs(e.x) - abs(e.y));
+  float t = max(-n.z, 0.0);
+  n.xy -= t * signNotZero(n.xy);
+  return normalize(n);
+}
+
+vec3 encodeNormal(vec3 n, int gbufferLayout) {
+  if (gbufferLayout == GBUFFER_LAYOUT_FULL_32F)
+    return n;
+  if (gbufferLayout == GBUFFER_LAYOUT_HALF)
+    return n * 0.5 + 0.5;  // unsigned normalized RGB10_A2
+  return vec3(octEncode(n), 0.0);
+}
+
+vec3 decodeNormal(vec3 stored, int gbufferLayout) {
+  if (gbufferLayout == GBUFFER_LAYOUT_FULL_32F)
+    return stored;
+  if (gbufferLayout == GBUFFER_LAYOUT_HALF)
+    return normalize(stored * 2.0 - 1.0);
+  return octDecode(stored.xy);
+}
+
+// depth: window-space depth in [0, 1] of the default glDepthRange, texCoord: [0, 1] over the viewport
+vec3 worldPosFromDepth(vec2 texCoord, float depth, mat4 worldFromProjection) {
+  vec4 ndc = vec4(texCoord * 2.0 - 1.0, depth * 2.0 - 1.0, 1.0);
+  vec4 world = worldFromProjection * ndc;
+  return world.xyz / world.w;
+}
@@ -0,0 +1,27 @@
+// Keep std430 layouts and bindings in sync with instancing.py
+struct InstanceData {
+  mat4 worldFromObject;
+  mat4 normalFromObject; // only upper-left mat3 is used
+};
+
+layout(std430, binding = 0) readonly buffer InstanceBuffer {
+  InstanceData instances[];
+};
+
+// One per draw command of a glMultiDrawElementsIndirect, indexed by gl_DrawID
+struct DrawData {
+  int firstInstance;
+  int meshId;
+};
+
+layout(std430, binding = 1) readonly buffer DrawDataBuffer {
+  DrawData drawData[];
+};
+
+DrawData getDrawData() {
+  return drawData[gl_DrawID];
+}
+
+InstanceData getInstanceData() {
+  return instances[getDrawData().firstInstance + gl_InstanceID];
+}
\ No newline at end of file
@@ -1,10 +1,15 @@
-layout(location = 0) uniform mat4 worldFromObject; // Model
-layout(location = 1) uniform mat4 viewFromWorld; // View
-layout(location = 2) uniform mat4 projectionFromView; // Projection
-layout(location = 3) uniform vec3 eyePos;
-layout(location = 4) uniform int meshId;
-// layout(location = 5) uniform AmbientLight ambientLight; // declared in AmbientLight.glsl
-// layout(location = 6) uniform DirectionalLight directionalLight; // declared in DirectionalLight.glsl
-// layout(location = 9) uniform HemisphericalLight hemisphericalLight; // declared in HemisphericalLight.glsl
-// layout(location = 12) uniform PointLight[MAX_POINT_LIGHTS] pointLights; // declared in PointLight.glsl
-// layout(location = 36) uniform int numPointLights; // declared in PointLight.glsl
\ No newline at end of file
+// Per-object model and normal matrices are read from the InstanceBuffer, meshId from the DrawDataBuffer in instance_data.glsl
+
+// Per-frame uniforms are uploaded once per frame by SceneUniformBuffer. Keep std140 layouts and bindings in sync with scene_uniform_buffer.py
+layout(std140, binding = 0) uniform CameraUniforms {
+  mat4 viewFromWorld; // View
+  mat4 projectionFromView; // Projection
+  vec3 eyePos;
+  int gbufferLayout; // GBUFFER_LAYOUT_* of lib/gbuffer.glsl
+  mat4 worldFromProjection; // inverse of projectionFromView * viewFromWorld, for reconstructing positions from depth
+  vec2 gbufferUvScale; // rendered sub-rectangle of the RenderTargetPool's targets, [0, 1] viewport UVs -> G-buffer UVs
+};
+// layout(std140, binding = 1) uniform AmbientLightUniforms // declared in AmbientLight.glsl
+// layout(std140, binding = 2) uniform DirectionalLightUniforms // declared in DirectionalLight.glsl
+// layout(std140, binding = 3) uniform HemisphericalLightUniforms // declared in HemisphericalLight.glsl
+// layout(std140, binding = 4) uniform PointLightUniforms // declared in PointLight.glsl
\ No newline at end of file
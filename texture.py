@@ -3,12 +3,18 @@ from dataclasses import dataclass
 
 from more_itertools import flatten
 import numpy as np
-from OpenGL.GL import GL_UNSIGNED_BYTE, GLubyte, GLfloat
+from OpenGL.GL import GL_UNSIGNED_BYTE
 from OpenGL.GL import GL_RED, GL_RED_INTEGER, GL_RG, GL_RGB, GL_RGBA, GL_RGBA8, GL_FLOAT, GL_RGB32F, GL_RG32F, GL_R32F, GL_INT, GL_R32I
+from OpenGL.GL import GL_DEPTH_COMPONENT, GL_DEPTH_COMPONENT32, GL_DEPTH_COMPONENT32F
+from OpenGL.GL import GL_HALF_FLOAT, GL_RGBA16F, GL_RGB16F, GL_RG16F, GL_R16F, GL_SHORT, GL_RGBA16_SNORM, GL_RG16_SNORM, GL_R16_SNORM
+from OpenGL.GL import GL_UNSIGNED_INT_2_10_10_10_REV, GL_RGB10_A2
 from OpenGL.GL import GL_TEXTURE_2D, GL_NEAREST, GL_TEXTURE_MIN_FILTER, GL_TEXTURE_MAG_FILTER
 from OpenGL.GL import GLint, GLenum
-from OpenGL.GL import glBindTexture, glGenTextures, glTexImage2D, glTexParameteri
+from OpenGL.GL import glBindTexture, glGenTextures, glDeleteTextures, glTexImage2D, glTexParameteri
 from OpenGL.GL import glGenBuffers, glBindBuffer, glBufferData, GL_PIXEL_PACK_BUFFER, GL_PIXEL_UNPACK_BUFFER, glTexSubImage2D, GL_STREAM_DRAW, glGetTextureImage, glMapBuffer, glUnmapBuffer, GL_READ_ONLY
+from OpenGL.GL import glCreateBuffers, glDeleteBuffers, glNamedBufferStorage, glMapNamedBufferRange, glUnmapNamedBuffer
+from OpenGL.GL import GL_MAP_READ_BIT, GL_MAP_WRITE_BIT, GL_MAP_PERSISTENT_BIT, GL_MAP_COHERENT_BIT
+from OpenGL.GL import glFenceSync, glClientWaitSync, glDeleteSync, GL_SYNC_GPU_COMMANDS_COMPLETE, GL_SYNC_FLUSH_COMMANDS_BIT, GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED, GL_TIMEOUT_IGNORED
 from OpenGL.GL import glGetTexLevelParameteriv, glGetTextureLevelParameteriv, GL_TEXTURE_BUFFER_SIZE
 from OpenGL.GL import arrays, GL_TEXTURE_WIDTH, GL_TEXTURE_HEIGHT, GL_TEXTURE_DEPTH, GL_TEXTURE_INTERNAL_FORMAT, GL_TEXTURE_RED_SIZE, GL_TEXTURE_GREEN_SIZE, GL_TEXTURE_BLUE_SIZE, GL_TEXTURE_ALPHA_SIZE
 
@@ -24,14 +30,21 @@ class TextureDescription:
     min_filter: GLint = GL_NEAREST
     mag_filter: GLint = GL_NEAREST
 
+    def is_packed(self) -> bool:
+        """All channels of a pixel in a single integer"""
+        return self.type == GL_UNSIGNED_INT_2_10_10_10_REV
+
     def num_channels(self) -> int:
+        """Channels of the pixel arrays read from or written into the texture. 1 for packed types"""
+        if self.is_packed():
+            return 1
         if self.format == GL_RGBA:
             return 4
         if self.format == GL_RGB:
             return 3
         if self.format == GL_RG:
             return 2
-        if self.format == GL_RED or self.format == GL_RED_INTEGER:
+        if self.format == GL_RED or self.format == GL_RED_INTEGER or self.format == GL_DEPTH_COMPONENT:
             return 1
         else:
             raise NotImplementedError("TODO: Implement num_channels for other formats!")
@@ -39,11 +52,21 @@ class TextureDescription:
     def dtype(self) -> np.dtype:
         # Probably I'll only use 32-bit floats and integers
         if self.type == GL_FLOAT:
-            assert(self.internal_format in (GL_RGB32F, GL_RG32F, GL_R32F))
+            assert(self.internal_format in (GL_RGB32F, GL_RG32F, GL_R32F, GL_DEPTH_COMPONENT32, GL_DEPTH_COMPONENT32F))
             return np.dtype(np.float32)
         if self.type == GL_INT:
             assert(self.internal_format in (GL_R32I, ))
             return np.dtype(np.int32)
+        if self.type == GL_HALF_FLOAT:
+            assert(self.internal_format in (GL_RGBA16F, GL_RGB16F, GL_RG16F, GL_R16F))
+            return np.dtype(np.float16)
+        if self.type == GL_SHORT:
+            # raw SNORM values, divide by 32767 for [-1, 1]
+            assert(self.internal_format in (GL_RGBA16_SNORM, GL_RG16_SNORM, GL_R16_SNORM))
+            return np.dtype(np.int16)
+        if self.type == GL_UNSIGNED_INT_2_10_10_10_REV:
+            assert(self.internal_format in (GL_RGB10_A2, ) and self.format == GL_RGBA)
+            return np.dtype(np.uint32)
         if self.type == GL_UNSIGNED_BYTE:
             return np.dtype(np.uint8)
         else:
@@ -95,6 +118,9 @@ class Texture:
         glTexImage2D(GL_TEXTURE_2D, 0, self.desc.internal_format, self.desc.width, self.desc.height, 0, self.desc.format, self.desc.type, None)
         self.unbind()
 
+    def deinit(self):
+        glDeleteTextures(1, [self._id])
+
     def create_example_texture():
         texDesc = TextureDescription()
         texData = np.array(list(flatten([[i, j, 128, 255] for i in range(texDesc.height) for j in range(texDesc.width)])))
@@ -114,24 +140,83 @@ class Texture:
         # TODO: add GL_TEXTURE_BUFFER_OFFSET, GL_TEXTURE_BUFFER_SIZE
 
 
+def unpack_rgb10_a2(pixels: np.ndarray) -> np.ndarray:
+    """uint32 pixels of GL_UNSIGNED_INT_2_10_10_10_REV -> float32 RGBA in [0, 1], with an extra last axis of 4"""
+    pixels = pixels.reshape(pixels.shape[:-1]) if pixels.shape[-1] == 1 else pixels
+    shifts = np.array([0, 10, 20, 30], dtype=np.uint32)
+    masks = np.array([0x3FF, 0x3FF, 0x3FF, 0x3], dtype=np.uint32)
+    return ((pixels[..., np.newaxis] >> shifts) & masks).astype(np.float32) / masks
+
+
+def octahedral_decode(encoded: np.ndarray) -> np.ndarray:
+    """(..., 2) octahedral normals in [-1, 1] (RG16_SNORM / 32767) -> (..., 3) unit normals. Same as octDecode() in lib/gbuffer.glsl"""
+    x, y = encoded[..., 0], encoded[..., 1]
+    z = 1.0 - np.abs(x) - np.abs(y)
+    t = np.maximum(-z, 0.0)
+    x = x - np.where(x >= 0, t, -t)
+    y = y - np.where(y >= 0, t, -t)
+    n = np.stack([x, y, z], axis=-1)
+    return n / np.linalg.norm(n, axis=-1, keepdims=True)
+
+
 class PixelBuffer:
-    def __init__(self, width: int, height: int, num_channels: int, dtype: np.dtype):
-        self._id = glGenBuffers(1)
+    """
+    A pixel buffer object for reading textures into and writing textures from.
+    persistent: allocates immutable storage with glNamedBufferStorage and maps it once, persistently and coherently.
+    Then read_tex() does not reallocate, and map_as_np_array() returns the same long-lived array without mapping, after
+    waiting for the last read_tex()/write_tex() on a fence. The buffer, hence its id and array, is replaced only on resize.
+    Persistent buffers should not be registered to CUDA.
+    """
+    def __init__(self, width: int, height: int, num_channels: int, dtype: np.dtype, persistent: bool = False):
         self.width = width
         self.height = height
         self.num_channels = num_channels
         self.dtype = dtype
         self.size_in_bytes = 0
+        self.persistent = persistent
+        self._array: np.ndarray = None
+        self._fence = None
+        if persistent:
+            self._id = -1
+            self._allocate_persistent()
+        else:
+            self._id = glGenBuffers(1)
+
+    def _allocate_persistent(self):
+        if self._id != -1:
+            glUnmapNamedBuffer(self._id)
+            glDeleteBuffers(1, [self._id])
+        self._delete_fence()
+        self.size_in_bytes = self.width * self.height * self.num_channels * np.dtype(self.dtype).itemsize
+        self._id = glCreateBuffers(1)
+        flags = GL_MAP_READ_BIT | GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+        glNamedBufferStorage(self._id, self.size_in_bytes, None, flags)
+        pixels_ptr = glMapNamedBufferRange(self._id, 0, self.size_in_bytes, flags)
+        map_array_ctype = (ctypes.c_ubyte * self.size_in_bytes).from_address(pixels_ptr)
+        # same shape as map_as_np_array() of non-persistent buffers
+        self._array = np.frombuffer(map_array_ctype, dtype=self.dtype).reshape((self.width, self.height, self.num_channels))
+
+    def _delete_fence(self):
+        if self._fence is not None:
+            glDeleteSync(self._fence)
+            self._fence = None
+
+    def _put_fence(self):
+        self._delete_fence()
+        self._fence = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
     
     def read_tex(self, tex: Texture):
         desc = tex.desc
         assert self.width == desc.width and self.height == desc.height
         assert self.num_channels == desc.num_channels() and self.dtype == desc.dtype()
-        self.size_in_bytes = desc.size_in_bytes()
         glBindBuffer(GL_PIXEL_PACK_BUFFER, self._id)
-        glBufferData(GL_PIXEL_PACK_BUFFER, self.size_in_bytes, None, GL_STREAM_DRAW)  # assuming will update every frame
+        if not self.persistent:
+            self.size_in_bytes = desc.size_in_bytes()
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.size_in_bytes, None, GL_STREAM_DRAW)  # assuming will update every frame
         glGetTextureImage(tex.get_id(), 0, desc.format, desc.type, self.size_in_bytes, ctypes.c_void_p(0))
         glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        if self.persistent:
+            self._put_fence()
     
     def write_tex(self, tex: Texture):
         desc = tex.desc
@@ -143,39 +228,130 @@ class PixelBuffer:
         glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, desc.width, desc.height, desc.format, desc.type, ctypes.c_void_p(0))
         glBindTexture(GL_TEXTURE_2D, 0)
         glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        if self.persistent:
+            # CPU must not overwrite the array before the upload has read it
+            self._put_fence()
 
     def resize_if_needed(self, width: int, height: int) -> bool:
         if (self.width == width and self.height == height):
             return False
+        self.width, self.height = width, height
+        if self.persistent:
+            self._allocate_persistent()
+            return True
         glBindBuffer(GL_PIXEL_PACK_BUFFER, self._id)
         glBufferData(GL_PIXEL_PACK_BUFFER, width * height * self.num_channels * self.dtype.itemsize, None, GL_STREAM_DRAW)
         glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
-        self.width, self.height = width, height
         return True
     
     def map_as_np_array(self):
+        if self.persistent:
+            # mapping a non-persistent buffer waits for pending transfers implicitly, do the same
+            if self._fence is not None:
+                glClientWaitSync(self._fence, GL_SYNC_FLUSH_COMMANDS_BIT, GL_TIMEOUT_IGNORED)
+                self._delete_fence()
+            return self._array
         glBindBuffer(GL_PIXEL_PACK_BUFFER, self._id)
         pixels_ptr = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
-        ctype = GLubyte
-        if self.dtype == np.uint8:
-            ctype = GLubyte
-        elif self.dtype == np.float32:
-            ctype = GLfloat
-        else:
-            raise NotImplementedError("Add ctype for given dtype")
-        map_array_ctype = (ctype * self.width * self.height * self.num_channels).from_address(pixels_ptr)
-        map_array = np.ctypeslib.as_array(map_array_ctype).reshape((self.width, self.height, self.num_channels))
+        size_in_bytes = self.width * self.height * self.num_channels * np.dtype(self.dtype).itemsize
+        map_array_ctype = (ctypes.c_ubyte * size_in_bytes).from_address(pixels_ptr)
+        map_array = np.frombuffer(map_array_ctype, dtype=self.dtype).reshape((self.width, self.height, self.num_channels))
         glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
         return map_array
     
     def unmap_as_np_array(self):
+        if self.persistent:
+            return
         glBindBuffer(GL_PIXEL_PACK_BUFFER, self._id)
         glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
         glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
     
+    def is_ready(self) -> bool:
+        """Whether the last read_tex()/write_tex() of a persistent buffer has finished, without waiting for the GPU"""
+        if self._fence is None:
+            return True
+        status = glClientWaitSync(self._fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0)
+        return status in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED)
+
     def get_id(self) -> int:
         return self._id
 
     def deinit(self):
-        raise NotImplementedError("Delete PBO")
+        self._delete_fence()
+        if self.persistent:
+            glUnmapNamedBuffer(self._id)
+            self._array = None
+        glDeleteBuffers(1, [self._id])
+        self._id = -1
+
+
+class PixelBufferRing:
+    """
+    Stall-free readback of a texture through a ring of PixelBuffers. read_tex() fills the next PixelBuffer and puts a fence
+    after it, map_latest_ready() maps the most recent PixelBuffer whose fence has been signaled, without waiting.
+    Hence the mapped pixels are a few frames old. Older unmapped readbacks are dropped when a newer one is ready.
+    """
+    def __init__(self, width: int, height: int, num_channels: int, dtype: np.dtype, num_buffers: int = 3, persistent: bool = True):
+        assert num_buffers >= 2
+        self.pbos = [PixelBuffer(width, height, num_channels, dtype, persistent) for _ in range(num_buffers)]
+        self._fences = [None] * num_buffers
+        self._next_ix = 0
+        self._mapped_ix = -1
+        # number of map_latest_ready() calls that found nothing ready and returned None instead of waiting for the GPU
+        self.num_stalls_avoided = 0
+        self.num_maps = 0
+        # readbacks that were never mapped, overwritten or superseded by a newer one
+        self.num_dropped = 0
+
+    def read_tex(self, tex: Texture):
+        assert self._mapped_ix == -1, "unmap before the next read_tex"
+        ix = self._next_ix
+        if self._fences[ix] is not None:
+            glDeleteSync(self._fences[ix])
+            self.num_dropped += 1
+        self.pbos[ix].read_tex(tex)
+        self._fences[ix] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self._next_ix = (ix + 1) % len(self.pbos)
 
+    def map_latest_ready(self):
+        """Returns the mapped array of the newest finished readback, or None if none has finished yet"""
+        num_buffers = len(self.pbos)
+        # newest first
+        for age in range(1, num_buffers + 1):
+            ix = (self._next_ix - age) % num_buffers
+            fence = self._fences[ix]
+            if fence is None:
+                continue
+            status = glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0)
+            if status not in (GL_ALREADY_SIGNALED, GL_CONDITION_SATISFIED):
+                continue
+            # this one and all older ones are done
+            for older_age in range(age, num_buffers + 1):
+                older_ix = (self._next_ix - older_age) % num_buffers
+                if self._fences[older_ix] is not None:
+                    glDeleteSync(self._fences[older_ix])
+                    self._fences[older_ix] = None
+                    if older_ix != ix:
+                        self.num_dropped += 1
+            self._mapped_ix = ix
+            self.num_maps += 1
+            return self.pbos[ix].map_as_np_array()
+        self.num_stalls_avoided += 1
+        return None
+
+    def unmap(self):
+        if self._mapped_ix == -1:
+            return
+        self.pbos[self._mapped_ix].unmap_as_np_array()
+        self._mapped_ix = -1
+
+    def resize_if_needed(self, width: int, height: int) -> bool:
+        resized = [pbo.resize_if_needed(width, height) for pbo in self.pbos]
+        if not any(resized):
+            return False
+        # pending readbacks are of the old size
+        for ix, fence in enumerate(self._fences):
+            if fence is not None:
+                glDeleteSync(fence)
+                self._fences[ix] = None
+        return True
@@ -0,0 +1,115 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+import multiprocessing
+
+import numpy as np
+import png
+
+from texture import Texture, PixelBuffer, unpack_rgb10_a2
+
+# png: 8-bit per channel, non-uint8 textures are scaled by 255 and clipped. npy: lossless, the texture's own dtype
+SAVE_FORMATS = ["png", "npy"]
+
+
+def encode_and_write(pixels: np.ndarray, filename: str, file_format: str, size: tuple[int, int] = None) -> str:
+    """
+    Runs in a worker process. pixels: (height, width, channels) as read from OpenGL, bottom row first
+    size: (width, height) of the bottom-left rectangle to save, default all
+    """
+    if size is not None:
+        pixels = pixels[:size[1], :size[0]]
+    pixels = np.flip(pixels, axis=0)  # OpenGL images are inverted on y-axis
+    if file_format == "npy":
+        np.save(filename, pixels)
+        return filename
+    if pixels.dtype == np.uint32:
+        pixels = unpack_rgb10_a2(pixels)  # the only packed format, see TextureDescription.is_packed()
+    elif pixels.dtype == np.int16:
+        pixels = pixels / 32767  # SNORM
+    num_channels = pixels.shape[2]
+    if pixels.dtype != np.uint8:
+        pixels = (pixels * 255.99).clip(min=0.0, max=255.99).astype(np.uint8)
+    # Make 2- and 1-channel images 3-channel RGB (png module saves 2-channel images as grayscale w/alpha)
+    if num_channels < 3:
+        pixels = np.concatenate((pixels, np.zeros(shape=(pixels.shape[0], pixels.shape[1], 3 - num_channels), dtype=pixels.dtype)), axis=2)
+        num_channels = 3
+    pixels = pixels.reshape(pixels.shape[0], -1)
+    png_mode = {4: "RGBA", 3: "RGB"}[num_channels]
+    png.from_array(pixels, mode=png_mode).save(filename)
+    return filename
+
+
+@dataclass
+class SaveJob:
+    tex_name: str
+    filename: str
+    file_format: str
+    size: tuple[int, int] = None
+    pbo: PixelBuffer = None
+    future: Future = None
+    error: str = None
+
+    # stages in order, for the progress bar
+    STAGES = ("reading back", "encoding", "done")
+
+    def get_stage(self) -> str:
+        if self.future is None:
+            return "reading back"
+        if not self.future.done():
+            return "encoding"
+        return "done" if self.future.exception() is None else "failed"
+
+    def get_progress(self) -> float:
+        stage = self.get_stage()
+        return 1.0 if stage == "failed" else SaveJob.STAGES.index(stage) / (len(SaveJob.STAGES) - 1)
+
+
+class TextureSaver:
+    """
+    Saves textures without blocking the render thread. save() starts an async readback into a persistent PixelBuffer with a
+    fence, update() polls the fences each frame and hands finished readbacks to a worker process, which flips, converts,
+    encodes and writes the file. A process instead of a thread because PNG encoding is pure Python and would hold the GIL.
+    """
+    def __init__(self, history_size: int = 5):
+        # spawn, forking a process with a GL context and CUDA is not safe
+        self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self._history_size = history_size
+        self.jobs: list[SaveJob] = []
+
+    def save(self, tex: Texture, tex_name: str, filename_stem: str, file_format: str, size: tuple[int, int] = None) -> SaveJob:
+        """size: (width, height) of the rendered bottom-left rectangle of tex to save, see RenderTargetPool. Default all"""
+        assert file_format in SAVE_FORMATS
+        desc = tex.desc
+        pbo = PixelBuffer(desc.width, desc.height, desc.num_channels(), desc.dtype(), persistent=True)
+        pbo.read_tex(tex)
+        job = SaveJob(tex_name=tex_name, filename=f"{filename_stem}.{file_format}", file_format=file_format, size=size, pbo=pbo)
+        self.jobs.append(job)
+        return job
+
+    def update(self):
+        """Call once per frame on the render thread"""
+        for job in self.jobs:
+            if job.future is None and job.pbo.is_ready():
+                # PixelBuffer arrays are (width, height, channels) shaped, the memory is height rows of width pixels
+                pbo = job.pbo
+                pixels = pbo.map_as_np_array().reshape(pbo.height, pbo.width, pbo.num_channels)
+                # arguments are pickled later on the executor's thread, the mapped PBO is kept until the job is done
+                job.future = self._executor.submit(encode_and_write, pixels, job.filename, job.file_format, job.size)
+            elif job.future is not None and job.future.done() and job.pbo is not None:
+                job.pbo.deinit()
+                job.pbo = None
+                if job.future.exception() is not None:
+                    job.error = str(job.future.exception())
+                    print(f"saving {job.filename} failed: {job.error}")
+        # keep the last few finished jobs for the UI
+        finished = [job for job in self.jobs if job.pbo is None]
+        for job in finished[:max(0, len(finished) - self._history_size)]:
+            self.jobs.remove(job)
+
+    def deinit(self):
+        """Waits for pending encodes. Readbacks that haven't finished yet are dropped"""
+        self._executor.shutdown(wait=True)
+        for job in self.jobs:
+            if job.pbo is not None:
+                job.pbo.deinit()
+                job.pbo = None
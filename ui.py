@@ -1,15 +1,22 @@
 from datetime import datetime
 import math
-import png
 
 import glm
 import imgui
-import numpy as np
-from OpenGL.GL import glGetTextureImage
+import numba
 
 from assets import Assets
+from cpu_profiler import CpuProfiler, TRACE_NUM_FRAMES, CPROFILE_NUM_FRAMES
+from cpu_shading import set_num_threads
+from culling import FrustumCuller, OcclusionCuller
+from dynamic_resolution import DynamicResolution
+from gbuffer_recorder import GBufferRecorder
+from gpu_profiler import GpuProfiler
+from render_graph import RenderGraph
 from scene import Scene, Object
-from texture import Texture
+from shader import Shader
+from texture import Texture, PixelBufferRing
+from texture_saver import TextureSaver, SAVE_FORMATS
 import utils
 
 
@@ -37,16 +44,34 @@ def transform_widget(obj: Object):
 
 
 class ImWindows:
-    def __init__(self, assets: Assets, scene: Scene, viewport_size: glm.ivec2):
+    def __init__(self, assets: Assets, scene: Scene, viewport_size: glm.ivec2, frustum_culler: FrustumCuller = None, occlusion_culler: OcclusionCuller = None,
+                 gpu_profiler: GpuProfiler = None, cpu_profiler: CpuProfiler = None, readback_rings: dict[str, PixelBufferRing] = None,
+                 texture_saver: TextureSaver = None, gbuffer_recorder: GBufferRecorder = None, render_graph: RenderGraph = None,
+                 dynamic_resolution: DynamicResolution = None):
         self._assets = assets
         self._scene = scene
+        self._frustum_culler = frustum_culler
+        self._occlusion_culler = occlusion_culler
+        self._gpu_profiler = gpu_profiler
+        self._cpu_profiler = cpu_profiler
+        self._readback_rings = readback_rings or {}
+        self._texture_saver = texture_saver or TextureSaver()
+        self._gbuffer_recorder = gbuffer_recorder
+        self._render_graph = render_graph
+        self._dynamic_resolution = dynamic_resolution
         self._show_assets_window = True
         self._show_texture_viewer_window = True
         self._show_inspector_window = True
+        self._show_profiler_window = gpu_profiler is not None or cpu_profiler is not None
         self._show_imgui_demo_window = False
         self._show_viewport_window = True
         self._obj_combo = ComboBox("Select Object", list(self._scene.objects.values()), list(self._scene.objects.keys()), 0)
-        self._tex_combo = ComboBox("Select Texture", list(self._assets.textures.values()), list(self._assets.textures.keys()))
+        if render_graph is not None:
+            # by name, transient textures of the graph exist only while requested
+            self._tex_combo = ComboBox("Select Texture", render_graph.get_texture_names(), render_graph.get_texture_names())
+        else:
+            self._tex_combo = ComboBox("Select Texture", list(self._assets.textures.values()), list(self._assets.textures.keys()))
+        self._save_format_combo = ComboBox("##format", SAVE_FORMATS, SAVE_FORMATS)
         self.viewport_size = viewport_size
 
         # Camera state (maybe should be somewhere else, scene?)
@@ -55,11 +80,14 @@ class ImWindows:
         self.cam_phi = math.pi / 8
     
     def draw(self):
+        self._texture_saver.update()
         if imgui.begin_main_menu_bar().opened:
             if imgui.begin_menu('View', True).opened:
                 _, self._show_assets_window = imgui.core.menu_item("Assets", None, self._show_assets_window)
                 _, self._show_texture_viewer_window = imgui.core.menu_item("Texture Viewer", None, self._show_texture_viewer_window)
                 _, self._show_inspector_window = imgui.core.menu_item("Inspector", None, self._show_inspector_window)
+                if self._gpu_profiler is not None or self._cpu_profiler is not None:
+                    _, self._show_profiler_window = imgui.core.menu_item("Profiler", None, self._show_profiler_window)
                 _, self._show_imgui_demo_window = imgui.core.menu_item("ImGui Demo Window", None, self._show_imgui_demo_window)
                 # _, self._show_viewport_window = imgui.core.menu_item("Viewport Window", None, self._show_viewport_window)
                 imgui.end_menu()
@@ -79,7 +107,9 @@ class ImWindows:
         if (self._show_assets_window):
             _, self._show_assets_window = ImWindows.draw_assets_window(self._assets)
         if (self._show_texture_viewer_window):
-            _, self._show_texture_viewer_window = ImWindows.draw_texture_viewer_window(self._tex_combo)
+            _, self._show_texture_viewer_window = ImWindows.draw_texture_viewer_window(self._tex_combo, self._save_format_combo, self._texture_saver, self._render_graph)
+        if (self._show_profiler_window):
+            _, self._show_profiler_window = ImWindows.draw_profiler_window(self._gpu_profiler, self._cpu_profiler, self._readback_rings, self._render_graph)
         if (self._show_imgui_demo_window):
             imgui.show_demo_window()
         if (self._show_viewport_window):
@@ -91,7 +121,12 @@ class ImWindows:
         has_clicked, is_open = imgui.begin("Viewport", False, imgui.WINDOW_NO_SCROLLBAR)
         w, h = imgui.get_content_region_available()
         self.viewport_size = glm.ivec2(w, h)
-        imgui.image(viewport_tex.get_id(), w, h, uv0=(0, 1), uv1=(1, 0), border_color=(1,1,0,1))
+        # rendered later this frame into the bottom-left part of the pool's targets, at the allocation size this size will get
+        uv_scale = glm.vec2(1, 1)
+        if self._render_graph is not None:
+            pool = self._render_graph.pool
+            uv_scale = glm.vec2(self.viewport_size) / glm.vec2(glm.max(pool.fit(self.viewport_size), glm.ivec2(1)))
+        imgui.image(viewport_tex.get_id(), w, h, uv0=(0, uv_scale.y), uv1=(uv_scale.x, 0), border_color=(1,1,0,1))
         imgui.end()
         imgui.pop_style_var(1)
         return has_clicked, is_open
@@ -110,6 +145,19 @@ class ImWindows:
         _, self.cam_theta = imgui.slider_float("cam pos theta", self.cam_theta, 0.0, math.pi, "%.3f")
         _, self.cam_phi = imgui.slider_float("cam pos phi", self.cam_phi, 0.01, 2.0 * math.pi, "%.3f")
         scene.cam.position = utils.spherical_to_cartesian(glm.vec3(self.cam_r, self.cam_theta, self.cam_phi))
+        if self._frustum_culler is not None:
+            _, self._frustum_culler.enabled = imgui.checkbox("frustum culling", self._frustum_culler.enabled)
+            imgui.text(f"visible: {self._frustum_culler.num_visible}, culled: {self._frustum_culler.num_culled}")
+        if self._occlusion_culler is not None:
+            _, self._occlusion_culler.enabled = imgui.checkbox("occlusion culling (previous frame's depth)", self._occlusion_culler.enabled)
+            imgui.text(f"tested: {self._occlusion_culler.num_tested}, occluded: {self._occlusion_culler.num_occluded}")
+        if self._gbuffer_recorder is not None:
+            ImWindows.draw_gbuffer_recorder(self._gbuffer_recorder)
+        if self._dynamic_resolution is not None:
+            ImWindows.draw_dynamic_resolution(self._dynamic_resolution, self.viewport_size)
+        changed, num_threads = imgui.slider_int("CPU shading threads", numba.get_num_threads(), 1, numba.config.NUMBA_NUM_THREADS)
+        if changed:
+            set_num_threads(num_threads)
         imgui.separator()
 
         _, (scene.clear_color.r, scene.clear_color.g, scene.clear_color.b) = imgui.color_edit3("Clear Color", *scene.clear_color)
@@ -129,46 +177,167 @@ class ImWindows:
 
     def draw_assets_window(assets):
         has_clicked, is_open = imgui.begin("Assets", True)
-        imgui.text("Meshes (name, vao, #vertices):")
+        imgui.text("Meshes (name, id, #vertices, #indices):")
         for name, mesh in assets.meshes.items():
-            imgui.text(f"{name}, {mesh.vao}, {mesh.vertex_count}")
+            imgui.text(f"{name}, {mesh.mesh_id}, {mesh.vertex_count}, {mesh.index_count}")
+        arena = assets.geometry_arena
+        imgui.text(f"Geometry arena: {arena.vertex_count}/{arena.vertex_capacity} vertices, {arena.index_count}/{arena.index_capacity} indices")
+        imgui.text(assets.mesh_cache.summary())
         imgui.separator()
         imgui.text("Shaders (name, program, vertex, fragment)")
         for name, shader in assets.shaders.items():
             imgui.text(f"{name}, {shader.get_id()}, {shader.vertex_file}, {shader.fragment_file}")
+        imgui.text(f"Uniform uploads last frame: {Shader.last_frame_uploads_issued} issued, {Shader.last_frame_uploads_skipped} skipped")
         imgui.end()
         return has_clicked, is_open
 
-    def draw_texture_viewer_window(tex_combo: ComboBox):
+    def draw_profiler_window(gpu_profiler: GpuProfiler, cpu_profiler: CpuProfiler, readback_rings: dict[str, PixelBufferRing], render_graph: RenderGraph = None):
+        has_clicked, is_open = imgui.begin("Profiler", True)
+        if cpu_profiler is not None:
+            ImWindows.draw_cpu_profiler(cpu_profiler)
+        if gpu_profiler is not None:
+            ImWindows.draw_gpu_profiler(gpu_profiler)
+        if readback_rings:
+            imgui.separator()
+            imgui.text("Readback rings (maps, stalls avoided, dropped)")
+            for name, ring in readback_rings.items():
+                imgui.text(f"{name}: {ring.num_maps}, {ring.num_stalls_avoided}, {ring.num_dropped}")
+        if render_graph is not None:
+            imgui.separator()
+            ImWindows.draw_render_graph(render_graph)
+        imgui.end()
+        return has_clicked, is_open
+
+    def draw_render_graph(render_graph: RenderGraph):
+        imgui.text(f"Render graph passes: {', '.join(p.name for p in render_graph.executed_passes)}")
+        imgui.text(f"culled passes: {', '.join(render_graph.culled_passes) or '-'}")
+        imgui.text(f"dropped attachments: {', '.join(render_graph.dropped_attachments) or '-'}")
+        aliases = ", ".join(f"{name} -> {other}" for name, other in render_graph.aliases.items())
+        imgui.text(f"transient textures: {render_graph.get_num_pool_textures()} allocated, aliased: {aliases or '-'}")
+        pool = render_graph.pool
+        imgui.text(f"render targets: {pool.allocated_size.x}x{pool.allocated_size.y} for {pool.size.x}x{pool.size.y}, "
+                   f"{pool.num_reallocations} reallocations, {pool.get_num_free()} idle, {pool.num_released_idle} released")
+
+    def draw_cpu_profiler(cpu_profiler: CpuProfiler):
+        _, cpu_profiler.enabled = imgui.checkbox("CPU scopes", cpu_profiler.enabled)
+        imgui.same_line()
+        if cpu_profiler.is_capturing_trace():
+            imgui.text("capturing trace...")
+        elif imgui.button("capture trace (F9)"):
+            cpu_profiler.capture_trace(TRACE_NUM_FRAMES, f"trace_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+        imgui.same_line()
+        if cpu_profiler.is_capturing_cprofile():
+            imgui.text("running cProfile...")
+        elif imgui.button("cProfile (F10)"):
+            cpu_profiler.capture_cprofile(CPROFILE_NUM_FRAMES, f"cprofile_{datetime.now().strftime('%Y%m%dT%H%M%S')}.prof")
+        imgui.columns(5, "cpu_timings")
+        for header in ["CPU scope", "calls", "mean ms", "p95 ms", "max ms"]:
+            imgui.text(header)
+            imgui.next_column()
+        imgui.separator()
+        for name in cpu_profiler.timings:
+            imgui.text(name)
+            imgui.next_column()
+            imgui.text(f"{cpu_profiler.call_counts.get(name, 0)}")
+            imgui.next_column()
+            for value in cpu_profiler.get_summary(name):
+                imgui.text(f"{value:.3f}")
+                imgui.next_column()
+        imgui.columns(1)
+        if cpu_profiler.last_cprofile_report and imgui.tree_node("last cProfile report"):
+            imgui.text_unformatted(cpu_profiler.last_cprofile_report)
+            imgui.tree_pop()
+        imgui.separator()
+
+    def draw_gpu_profiler(gpu_profiler: GpuProfiler):
+        _, gpu_profiler.enabled = imgui.checkbox("GPU timer queries", gpu_profiler.enabled)
+        imgui.same_line()
+        _, gpu_profiler.collect_pipeline_statistics = imgui.checkbox("pipeline statistics", gpu_profiler.collect_pipeline_statistics)
+        imgui.text(f"frames dropped (results not ready in time): {gpu_profiler.num_dropped_frames}")
+        imgui.separator()
+        imgui.columns(5, "gpu_timings")
+        for header in ["GPU pass", "mean ms", "p50 ms", "p95 ms", "p99 ms"]:
+            imgui.text(header)
+            imgui.next_column()
+        imgui.separator()
+        for name in gpu_profiler.timings:
+            imgui.text(name)
+            imgui.next_column()
+            for value in gpu_profiler.get_summary(name):
+                imgui.text(f"{value:.3f}")
+                imgui.next_column()
+        imgui.columns(1)
+        if gpu_profiler.statistics:
+            imgui.separator()
+            imgui.text("Pipeline statistics (mean per frame)")
+            for name in gpu_profiler.statistics:
+                stats = ", ".join(f"{stat_name} {count:,.0f}" for stat_name, count in gpu_profiler.get_statistics_means(name).items())
+                imgui.text(f"{name}: {stats}")
+
+    def draw_gbuffer_recorder(recorder: GBufferRecorder):
+        if not recorder.is_recording:
+            if imgui.button("record G-buffer dataset"):
+                recorder.start(f"dataset_{datetime.now().strftime('%Y%m%dT%H%M%S')}")
+            if imgui.is_item_hovered():
+                imgui.set_tooltip(f"full precision {', '.join(recorder.attachments)} of every frame, until stopped or resized")
+            return
+        if imgui.button("stop recording"):
+            recorder.stop()
+        imgui.same_line()
+        imgui.text(f"{recorder.output_dir}: {recorder.num_written}/{recorder.num_recorded} written, {recorder.get_queue_size()} queued")
+        mean_write_ms = recorder.write_ms / max(recorder.num_written, 1)
+        imgui.text(f"writer {mean_write_ms:.2f} ms/frame, backpressure: {recorder.num_backpressure_waits} waits, {recorder.backpressure_ms:.1f} ms")
+
+    def draw_dynamic_resolution(dynamic_resolution: DynamicResolution, viewport_size: glm.ivec2):
+        changed, enabled = imgui.checkbox("dynamic resolution", dynamic_resolution.enabled)
+        if changed:
+            dynamic_resolution.set_enabled(enabled)
+        if dynamic_resolution.enabled:
+            imgui.same_line()
+            imgui.push_item_width(100)
+            _, dynamic_resolution.target_ms = imgui.slider_float("target GPU ms", dynamic_resolution.target_ms, 1.0, 50.0, "%.1f")
+            imgui.pop_item_width()
+        else:
+            # fixed scale while the controller is off
+            _, dynamic_resolution.scale = imgui.slider_float("render scale", dynamic_resolution.scale, dynamic_resolution.min_scale, dynamic_resolution.max_scale, "%.2f")
+        render_size = dynamic_resolution.get_render_size(viewport_size)
+        median = f"{dynamic_resolution.last_median_ms:.2f} ms" if dynamic_resolution.last_median_ms is not None else "-"
+        imgui.text(f"scale {dynamic_resolution.scale:.2f}: {render_size.x}x{render_size.y} of {viewport_size.x}x{viewport_size.y}, "
+                   f"GPU frame median {median}, {dynamic_resolution.num_adjustments} adjustments")
+
+    def draw_texture_viewer_window(tex_combo: ComboBox, save_format_combo: ComboBox, texture_saver: TextureSaver, render_graph: RenderGraph = None):
             has_clicked, is_open = imgui.begin("Texture Viewer", True, imgui.WINDOW_NO_SCROLLBAR)
             _, tex_name, tex = tex_combo.draw()
+            if render_graph is not None:
+                render_graph.request(tex_name)
+                tex = render_graph.textures.get(tex_name)
+            if tex is None:
+                imgui.text("rendered from the next frame on")
+                imgui.end()
+                return has_clicked, is_open
+            imgui.same_line()
+            imgui.push_item_width(60)
+            _, _, file_format = save_format_combo.draw()
+            imgui.pop_item_width()
+            if imgui.is_item_hovered():
+                imgui.set_tooltip("png: 8-bit, float textures are clipped to [0, 1]\nnpy: lossless, the texture's own format")
             imgui.same_line()
+            # readback, conversion and encoding happen in the background, see TextureSaver
+            # size of the rendered part of the texture and its UVs
+            size, uv_scale = glm.ivec2(tex.desc.width, tex.desc.height), glm.vec2(1, 1)
+            if render_graph is not None and tex_name in render_graph.texture_sizes:
+                # G-buffer textures are rendered at the dynamic resolution's scale, "viewport" at the viewport's size
+                size = render_graph.texture_sizes[tex_name]
+                uv_scale = render_graph.pool.get_uv_scale(size)
             if imgui.button("save"):
-                filename = f"{tex_name}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.png"
-                print(f"saving {filename}...")
-                desc = tex.desc
-                num_channels = desc.num_channels()
-                pixels = np.empty(shape=(desc.width, desc.height, num_channels), dtype=desc.dtype())
-                # pixels[:, :, 3] = 255 if pixels.dtype == np.uint8 else 1
-                glGetTextureImage(tex.get_id(), 0, desc.format, desc.type, pixels.size * pixels.itemsize, pixels)
-                pixels = np.flip(pixels, axis=(0, 1))  # OpenGL images are inverted on y-axis
-                # TODO: for now we only have PNG format. Can bring TIFF to save image files with floating point channels
-                if pixels.dtype != np.uint8:
-                    pixels = (pixels * 255.99).clip(min=0.0, max=255.99).astype(np.uint8)
-                # Make 2- and 1-channel images 3-channel RGB (png module saves 2-channel images as grayscale w/alpha)
-                if num_channels == 2:
-                    pixels = np.concatenate((pixels, np.zeros(shape=(pixels.shape[0], pixels.shape[1], 1), dtype=pixels.dtype)), axis=2)
-                    num_channels = 3
-                if num_channels == 1:
-                    pixels = np.concatenate((pixels, np.zeros(shape=(pixels.shape[0], pixels.shape[1], 2), dtype=pixels.dtype)), axis=2)
-                    num_channels = 3
-                pixels = pixels.reshape(-1, desc.width * num_channels)
-                png_mode = {4: "RGBA", 3: "RGB", 2: "RGB", 1: "RGB"}[desc.num_channels()]  # correct: {4: "RGBA", 3: "RGB", 2: "LA", 1: "L"}
-                png.from_array(pixels, mode=png_mode).save(filename)
+                job = texture_saver.save(tex, tex_name, f"{tex_name}_{datetime.now().strftime('%Y%m%dT%H%M%S')}", file_format, (size.x, size.y))
+                print(f"saving {job.filename}...")
+            for job in texture_saver.jobs:
+                imgui.progress_bar(job.get_progress(), (0, 0), f"{job.filename}: {job.get_stage()}")
             imgui.separator()
             available_sz = imgui.get_content_region_available()
             win_ar = available_sz.x / available_sz.y
-            tex_ar = tex.desc.width / tex.desc.height
+            tex_ar = size.x / max(size.y, 1)
             w, h = 1, 1
             if tex_ar >= win_ar:
                 w = available_sz.x
@@ -176,6 +345,6 @@ class ImWindows:
             else:
                 h = available_sz.y
                 w = h * tex_ar
-            imgui.image(tex.get_id(), w, h, uv0=(0, 1), uv1=(1, 0))  # border_color=(1,1,0,1)
+            imgui.image(tex.get_id(), w, h, uv0=(0, uv_scale.y), uv1=(uv_scale.x, 0))  # border_color=(1,1,0,1)
             imgui.end()
             return has_clicked, is_open
\ No newline at end of file
@@ -16,25 +16,72 @@ def spherical_to_cartesian(spherical: glm.vec3):
     return glm.vec3(x, y, z)
 
 class Transform:
+    """
+    Local translation, rotation and scale. The composed matrix is cached until one of them is assigned a different value.
+    Getters return copies: assign new values instead of mutating in place, otherwise the cache can't know about the change.
+    """
     def __init__(self, translation: glm.vec3, rotation_yxz: glm.vec3, scale: glm.vec3):
-        self.translation = translation
-        self.rotation_yxz = rotation_yxz
-        self.scale = scale
-    
+        self._translation = glm.vec3(translation)
+        self._rotation_yxz = glm.vec3(rotation_yxz)
+        self._scale = glm.vec3(scale)
+        self._mat = None  # None when dirty
+        # called when the transform changes, ex: by the scene graph node that owns the transform
+        self.on_change = None
+
+    @property
+    def translation(self) -> glm.vec3:
+        return glm.vec3(self._translation)
+
+    @translation.setter
+    def translation(self, value: glm.vec3):
+        if value != self._translation:
+            self._translation = glm.vec3(value)
+            self._invalidate()
+
+    @property
+    def rotation_yxz(self) -> glm.vec3:
+        return glm.vec3(self._rotation_yxz)
+
+    @rotation_yxz.setter
+    def rotation_yxz(self, value: glm.vec3):
+        if value != self._rotation_yxz:
+            self._rotation_yxz = glm.vec3(value)
+            self._invalidate()
+
+    @property
+    def scale(self) -> glm.vec3:
+        return glm.vec3(self._scale)
+
+    @scale.setter
+    def scale(self, value: glm.vec3):
+        if value != self._scale:
+            self._scale = glm.vec3(value)
+            self._invalidate()
+
+    def is_dirty(self) -> bool:
+        return self._mat is None
+
+    def _invalidate(self):
+        self._mat = None
+        if self.on_change is not None:
+            self.on_change()
+
     def get_translate_mat(self):
-        return glm.translate(glm.mat4(1), self.translation)
+        return glm.translate(glm.mat4(1), self._translation)
     
     def get_rotation_mat(self):
-        rot_y = glm.rotate(self.rotation_yxz.x, glm.vec3(0, 1, 0))
-        rot_x = glm.rotate(self.rotation_yxz.y, glm.vec3(1, 0, 0))
-        rot_z = glm.rotate(self.rotation_yxz.z, glm.vec3(0, 0, 1))
+        rot_y = glm.rotate(self._rotation_yxz.x, glm.vec3(0, 1, 0))
+        rot_x = glm.rotate(self._rotation_yxz.y, glm.vec3(1, 0, 0))
+        rot_z = glm.rotate(self._rotation_yxz.z, glm.vec3(0, 0, 1))
         return rot_y * rot_x * rot_z
         
     def get_scale_mat(self):
-        return glm.scale(glm.mat4(1), self.scale)
+        return glm.scale(glm.mat4(1), self._scale)
     
     def get_transform_mat(self):
-        return self.get_translate_mat() * self.get_rotation_mat() * self.get_scale_mat()
+        if self._mat is None:
+            self._mat = self.get_translate_mat() * self.get_rotation_mat() * self.get_scale_mat()
+        return self._mat
 
 
 """